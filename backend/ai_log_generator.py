@@ -1,3 +1,4 @@
+import asyncio
 import os
 import logging
 from datetime import datetime, date
@@ -5,6 +6,8 @@ from typing import Dict, List, Any, Optional
 import google.generativeai as genai
 from dotenv import load_dotenv
 
+from utils.blocking_io import run_blocking
+
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
@@ -35,13 +38,13 @@ async def aggregate_sensor_data(supabase, user_id: str, log_date: date) -> Dict[
         start_time = datetime.combine(log_date, datetime.min.time())
         end_time = datetime.combine(log_date, datetime.max.time())
         
-        response = supabase.table("sensor_readings").select(
+        response = await run_blocking(supabase.table("sensor_readings").select(
             "sensor_type, value"
         ).eq("user_id", user_id).gte(
             "timestamp", start_time.isoformat()
         ).lte(
             "timestamp", end_time.isoformat()
-        ).execute()
+        ).execute)
         
         readings = response.data if response.data else []
         
@@ -79,9 +82,9 @@ async def fetch_weather_summary(location: str, log_date: date) -> Optional[Dict[
 
 async def fetch_user_activities(supabase, user_id: str, log_date: date) -> List[Dict[str, Any]]:
     try:
-        response = supabase.table("farmer_activities").select(
+        response = await run_blocking(supabase.table("farmer_activities").select(
             "*"
-        ).eq("user_id", user_id).eq("activity_date", log_date.isoformat()).execute()
+        ).eq("user_id", user_id).eq("activity_date", log_date.isoformat()).execute)
         
         return response.data if response.data else []
     except Exception as e:
@@ -93,13 +96,13 @@ async def fetch_completed_tasks(supabase, user_id: str, log_date: date) -> List[
         start_time = datetime.combine(log_date, datetime.min.time())
         end_time = datetime.combine(log_date, datetime.max.time())
         
-        response = supabase.table("tasks").select(
+        response = await run_blocking(supabase.table("tasks").select(
             "*"
         ).eq("user_id", user_id).gte(
             "completed_at", start_time.isoformat()
         ).lte(
             "completed_at", end_time.isoformat()
-        ).execute()
+        ).execute)
         
         return response.data if response.data else []
     except Exception as e:
@@ -111,13 +114,13 @@ async def fetch_alerts(supabase, user_id: str, log_date: date) -> List[Dict[str,
         start_time = datetime.combine(log_date, datetime.min.time())
         end_time = datetime.combine(log_date, datetime.max.time())
         
-        response = supabase.table("alerts").select(
+        response = await run_blocking(supabase.table("alerts").select(
             "*"
         ).eq("user_id", user_id).gte(
             "triggered_at", start_time.isoformat()
         ).lte(
             "triggered_at", end_time.isoformat()
-        ).execute()
+        ).execute)
         
         return response.data if response.data else []
     except Exception as e:
@@ -199,7 +202,7 @@ async def generate_ai_summary(prompt: str) -> str:
             return "AI summary generation is not available (API key not configured)"
         
         model = genai.GenerativeModel('gemini-pro')
-        response = model.generate_content(prompt)
+        response = await run_blocking(model.generate_content, prompt)
         
         return response.text
     except Exception as e:
@@ -217,9 +220,9 @@ async def generate_daily_log(
     logger.info(f"Generating daily log for user {user_id} on {log_date}")
     
     try:
-        user_profile = supabase.table("profiles").select(
+        user_profile = await run_blocking(supabase.table("profiles").select(
             "primary_language, location, timezone"
-        ).eq("id", user_id).single().execute()
+        ).eq("id", user_id).single().execute)
         
         if not user_profile.data:
             raise ValueError(f"User profile not found for user {user_id}")
@@ -228,11 +231,14 @@ async def generate_daily_log(
         language = profile.get("primary_language", "en")
         location = profile.get("location", "Unknown")
         
-        sensor_stats = await aggregate_sensor_data(supabase, user_id, log_date)
-        weather = await fetch_weather_summary(location, log_date)
-        activities = await fetch_user_activities(supabase, user_id, log_date)
-        tasks = await fetch_completed_tasks(supabase, user_id, log_date)
-        alerts = await fetch_alerts(supabase, user_id, log_date)
+        # Independent reads, so they run side by side on the blocking I/O pool
+        sensor_stats, weather, activities, tasks, alerts = await asyncio.gather(
+            aggregate_sensor_data(supabase, user_id, log_date),
+            fetch_weather_summary(location, log_date),
+            fetch_user_activities(supabase, user_id, log_date),
+            fetch_completed_tasks(supabase, user_id, log_date),
+            fetch_alerts(supabase, user_id, log_date),
+        )
         
         prompt = generate_prompt(
             language, location, log_date,
@@ -252,17 +258,17 @@ async def generate_daily_log(
             "notification_sent": False
         }
         
-        existing_log = supabase.table("daily_farm_logs").select("id").eq(
+        existing_log = await run_blocking(supabase.table("daily_farm_logs").select("id").eq(
             "user_id", user_id
-        ).eq("log_date", log_date.isoformat()).execute()
+        ).eq("log_date", log_date.isoformat()).execute)
         
         if existing_log.data:
-            response = supabase.table("daily_farm_logs").update(
+            response = await run_blocking(supabase.table("daily_farm_logs").update(
                 log_data
-            ).eq("id", existing_log.data[0]["id"]).execute()
+            ).eq("id", existing_log.data[0]["id"]).execute)
             logger.info(f"Updated existing daily log for user {user_id}")
         else:
-            response = supabase.table("daily_farm_logs").insert(log_data).execute()
+            response = await run_blocking(supabase.table("daily_farm_logs").insert(log_data).execute)
             logger.info(f"Created new daily log for user {user_id}")
         
         return {
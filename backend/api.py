@@ -1,16 +1,16 @@
-from fastapi import FastAPI, HTTPException, Query, Header
+from fastapi import FastAPI, HTTPException, Query, Header, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-import joblib
-import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
+import hmac
 import os
+import time
 import uuid
 import uvicorn
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
 from supabase import create_client, Client
-from typing import Optional, Dict, Any, AsyncGenerator
+from typing import Optional, Dict, Any, AsyncGenerator, List
 from mqtt_client import start_mqtt_client, stop_mqtt_client
 from utils.geospatial import (
     validate_geojson, 
@@ -19,6 +19,21 @@ from utils.geospatial import (
     reverse_geocode,
     calculate_field_center
 )
+from utils.price_forecast import forecast_prices, FORECAST_MODES, MAX_FORECAST_DAYS, UNSEEN_COMMODITY
+from utils.market_history import (
+    fetch_price_histories, mandi_page_end_query, mandi_prices_query, mandi_scope, price_trend_query, FALLBACK_LEVELS,
+    MANDI_COLUMNS,
+)
+from utils.mandi_stream import InvalidCursor, decode_cursor, encode_cursor, etag_matches, ingest_etag, stream_rows
+from utils.market_export import FORMATS as EXPORT_FORMATS, export_filters, require_pyarrow, stream_export
+from utils.forecast_cache import ForecastCache, forecast_cache_key
+from utils.model_artifacts import process_memory
+from utils.stage_timing import SERVER_TIMING_ALWAYS, stage_metrics, start_timer
+from utils.model_registry import ModelRegistry, read_manifest, set_active_version, set_shadow_version
+from utils.blocking_io import run_blocking, shutdown as shutdown_blocking_io, stats as blocking_io_stats
+from utils.db import close_pool, get_market_db_connection, get_pool, market_db, open_pool
+from utils.market_rollup import ensure_rollup
+from utils.entity_dictionary import get_entity_dictionary, invalidate_entity_dictionary
 from otp_service import (
     generate_otp,
     send_otp_sms,
@@ -29,8 +44,14 @@ from otp_service import (
 )
 from tasks.scheduler import init_scheduler, start_scheduler, stop_scheduler, get_scheduler_status, add_job
 from tasks.daily_logs import generate_daily_logs_for_all_users
+from tasks.price_forecasts import (
+    precompute_price_forecasts,
+    fetch_precomputed_forecast,
+    JOB_ID as PRICE_FORECAST_JOB_ID,
+)
 from ai_log_generator import generate_daily_log
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from notification_service import (
     send_task_reminder,
     log_voice_call,
@@ -111,6 +132,23 @@ def get_user_id_from_token(authorization: Optional[str] = Header(None)) -> str:
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     # Startup
     print("Starting up...")
+    if MODEL_PRELOAD == "eager":
+        model_registry.active()
+    elif MODEL_PRELOAD == "background":
+        model_registry.warm()
+        print("🔥 Warming price model in the background")
+    try:
+        pool = open_pool()
+        print(f"✅ Market DB pool opened ({pool.minconn}-{pool.maxconn} connections)")
+    except Exception as e:
+        print(f"⚠️ Market DB pool failed to open: {e}. Connections will be opened on first use...")
+    try:
+        # Trends and fallback levels 3-5 read the rollup; a database set up before it existed gets it here
+        with market_db() as conn:
+            if ensure_rollup(conn):
+                print("✅ Built market_price_daily_rollup from market_prices")
+    except Exception as e:
+        print(f"⚠️ Could not create market_price_daily_rollup: {e}")
     try:
         start_mqtt_client()
         print("✅ MQTT client started")
@@ -126,8 +164,21 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
             CronTrigger(hour=19, minute=0, timezone="Asia/Kolkata"),
             job_id="daily_logs_7pm"
         )
+        add_job(
+            precompute_price_forecasts,
+            CronTrigger(hour=int(os.getenv("PRICE_FORECAST_HOUR", "3")), minute=0, timezone="Asia/Kolkata"),
+            job_id=PRICE_FORECAST_JOB_ID
+        )
+        if MODEL_REGISTRY_POLL_SECONDS > 0:
+            # Picks up versions activated by another worker or the registry CLI
+            add_job(
+                model_registry.reload_if_changed,
+                IntervalTrigger(seconds=MODEL_REGISTRY_POLL_SECONDS),
+                job_id="model_registry_watch"
+            )
         print("✅ Background scheduler started")
         print("📅 Daily log generation scheduled for 7:00 PM IST")
+        print("📅 Price forecast precompute scheduled after the daily ingest")
     except Exception as e:
         print(f"⚠️ Scheduler failed to start: {e}. Continuing without scheduler...")
     
@@ -144,6 +195,10 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
         stop_scheduler()
     except Exception as e:
         print(f"⚠️ Error stopping scheduler: {e}")
+
+    model_registry.shutdown()
+    close_pool()
+    shutdown_blocking_io()
     
     print("✅ Shutdown complete")
 
@@ -158,15 +213,75 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
-# Load model and encoders
-try:
-    model = joblib.load('price_model.pkl')
-    encoders = joblib.load('encoders.pkl')
-    print("Model and encoders loaded successfully.")
-except Exception as e:
-    print(f"Error loading model/encoders: {e}")
-    model = None
-    encoders = None
+# Model and encoders load on first prediction (MODEL_PRELOAD=background warms them at
+# startup, eager loads them before serving). The compiled forest is memory-mapped, so
+# uvicorn workers share its pages instead of each holding a private copy.
+MODEL_PRELOAD = os.getenv("MODEL_PRELOAD", "lazy").lower()
+MODEL_REGISTRY_POLL_SECONDS = int(os.getenv("MODEL_REGISTRY_POLL_SECONDS", "30"))
+# recursive (day-by-day, each prediction fed back) or direct (all horizons in one batch, needs a
+# model trained with train_model.py --direct); requests can override it with "mode"
+FORECAST_MODE_DEFAULT = os.getenv("FORECAST_MODE_DEFAULT", "recursive").lower()
+model_registry = ModelRegistry()
+
+forecast_cache = ForecastCache(
+    max_entries=int(os.getenv("FORECAST_CACHE_SIZE", "2048")),
+    ttl_seconds=float(os.getenv("FORECAST_CACHE_TTL_SECONDS", str(6 * 3600))),
+)
+
+
+def _on_model_swap(previous, version):
+    # Keys already carry the model version; this only frees the old model's entries
+    forecast_cache.clear()
+    invalidate_entity_dictionary()
+
+
+model_registry.on_swap.append(_on_model_swap)
+
+
+def current_encoders():
+    current = model_registry.active()
+    return current.encoders if current else None
+
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
+
+
+def require_admin_token(x_admin_token: Optional[str]) -> None:
+    if not ADMIN_API_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints disabled. Set ADMIN_API_TOKEN to enable them.")
+    if not hmac.compare_digest((x_admin_token or "").encode(), ADMIN_API_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+MAX_BATCH_ITEMS = 200
+
+
+def safe_encode(col, val, entities=None, unseen=0):
+    # Canonical-name dict lookup; names the encoders never saw encode to unseen
+    entities = entities or get_entity_dictionary(current_encoders())
+    return entities.encode(col, val, unseen)
+
+
+def encode_prediction_request(req, entities=None) -> tuple:
+    entities = entities or get_entity_dictionary(current_encoders())
+    return (
+        safe_encode('state', req.state, entities),
+        safe_encode('district', req.district, entities),
+        safe_encode('market', req.market, entities),
+        safe_encode('commodity', req.commodity, entities, UNSEEN_COMMODITY),
+        safe_encode('variety', req.variety, entities),
+        safe_encode('grade', req.grade, entities),
+    )
+
+
+def forecast_mode(req, current) -> str:
+    """Validated forecast mode for a request; raises ValueError with a client-facing message."""
+    mode = (req.mode or FORECAST_MODE_DEFAULT).lower()
+    if mode not in FORECAST_MODES:
+        raise ValueError(f"Unknown forecast mode '{req.mode}'. Use one of: {', '.join(FORECAST_MODES)}")
+    if mode == 'direct' and current.direct is None:
+        raise ValueError(f"Model {current.version} has no direct multi-horizon model; use mode 'recursive'")
+    return mode
+
 
 class PredictionRequest(BaseModel):
     state: str
@@ -176,6 +291,19 @@ class PredictionRequest(BaseModel):
     variety: str
     grade: str = "Unspecified"
     days: Optional[int] = 7
+    mode: Optional[str] = Field(None, description="Forecast mode: 'recursive' or 'direct' (default FORECAST_MODE_DEFAULT)")
+
+
+class BatchPredictionRequest(BaseModel):
+    items: List[PredictionRequest] = Field(..., description=f"Up to {MAX_BATCH_ITEMS} prediction requests")
+
+
+class ModelVersionRequest(BaseModel):
+    version: Optional[str] = None
+
+
+class CacheInvalidationRequest(BaseModel):
+    commodities: List[str] = Field(default_factory=list, description="Ingested commodity names; empty clears the whole cache")
 
 
 class DeviceRegistration(BaseModel):
@@ -229,6 +357,87 @@ def scheduler_health():
     return get_scheduler_status()
 
 
+@app.get("/health/model")
+def model_health():
+    return {
+        "preload": MODEL_PRELOAD,
+        **model_registry.status(),
+        "process": {"pid": os.getpid(), **process_memory()},
+    }
+
+
+@app.get("/health/db-pool")
+def db_pool_health():
+    pool = get_pool()
+    return {"check": pool.health(), **pool.stats()}
+
+
+@app.get("/health/blocking-io")
+def blocking_io_health():
+    return blocking_io_stats()
+
+
+@app.get("/metrics/latency")
+def latency_metrics(reset: bool = False, x_admin_token: Optional[str] = Header(None)):
+    snapshot = {"since": datetime.fromtimestamp(stage_metrics.started_at).isoformat(), "stages": stage_metrics.snapshot()}
+    if reset:
+        require_admin_token(x_admin_token)
+        stage_metrics.reset()
+    return snapshot
+
+
+@app.get("/health/forecast-cache")
+def forecast_cache_health():
+    return {"model_version": model_registry.version, **forecast_cache.stats()}
+
+
+@app.post("/admin/forecast-cache/invalidate")
+def invalidate_forecast_cache(request: CacheInvalidationRequest, x_admin_token: Optional[str] = Header(None)):
+    require_admin_token(x_admin_token)
+    if request.commodities:
+        removed = forecast_cache.invalidate_commodities(request.commodities)
+    else:
+        removed = forecast_cache.clear()
+    # Newly ingested markets or commodities should resolve on the next request
+    invalidate_entity_dictionary()
+    return {"success": True, "removed": removed}
+
+
+@app.get("/admin/models")
+def list_models(x_admin_token: Optional[str] = Header(None)):
+    require_admin_token(x_admin_token)
+    return {"manifest": read_manifest(model_registry.registry_dir), **model_registry.status()}
+
+
+@app.post("/admin/models/activate")
+def activate_model(request: ModelVersionRequest, x_admin_token: Optional[str] = Header(None)):
+    require_admin_token(x_admin_token)
+    if not request.version:
+        raise HTTPException(status_code=400, detail="version is required")
+    try:
+        set_active_version(request.version, model_registry.registry_dir)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    # Other workers follow on their next registry poll
+    return model_registry.reload()
+
+
+@app.post("/admin/models/shadow")
+def shadow_model(request: ModelVersionRequest, x_admin_token: Optional[str] = Header(None)):
+    require_admin_token(x_admin_token)
+    try:
+        set_shadow_version(request.version, model_registry.registry_dir)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return model_registry.reload()
+
+
+@app.post("/admin/models/reload")
+def reload_models(x_admin_token: Optional[str] = Header(None)):
+    require_admin_token(x_admin_token)
+    return model_registry.reload()
+
+
 @app.post("/auth/send-otp")
 def send_otp(request: SendOTPRequest):
     if not supabase:
@@ -355,120 +564,81 @@ def resend_otp(request: SendOTPRequest):
     return send_otp(request)
 
 
+def _timed(payload, timer, response: Response, x_server_timing: Optional[str]):
+    # Stages are recorded for successful responses; failures would skew the histograms
+    timer.finish()
+    if timer.enabled and (x_server_timing or SERVER_TIMING_ALWAYS):
+        response.headers["Server-Timing"] = timer.server_timing()
+    return payload
+
+
 @app.post("/predict-price")
-def predict_price(req: PredictionRequest):
-    if not model or not encoders:
+def predict_price(req: PredictionRequest, response: Response, x_server_timing: Optional[str] = Header(None)):
+    timer = start_timer("predict_price", force=bool(x_server_timing))
+    # One registry read per request: a hot swap never mixes two model versions
+    with timer.stage("model"):
+        current = model_registry.active()
+    if not current or not current.model or not current.encoders:
         raise HTTPException(status_code=500, detail="Model not loaded.")
 
-    predictions = []
-    
+    model, encoders, model_version = current.model, current.encoders, current.version
+
     # We predict for the next 7 days
     today = datetime.now()
     
     try:
-        # 1. Encode string inputs
-        def safe_encode(col, val):
-            if val in encoders[col].classes_:
-                return encoders[col].transform([val])[0]
-            else:
-                return 0
-                
-        state_enc = safe_encode('state', req.state)
-        dist_enc = safe_encode('district', req.district)
-        mkt_enc = safe_encode('market', req.market)
-        comm_enc = safe_encode('commodity', req.commodity)
-        var_enc = safe_encode('variety', req.variety)
-        grade_enc = safe_encode('grade', req.grade)
-
-        pass 
+        # 1. Resolve names once and encode them
+        with timer.stage("encode"):
+            entities = get_entity_dictionary(encoders)
+            encoded = encode_prediction_request(req, entities)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Encoding error: {str(e)}")
 
-    # DB Connection
+    forecast_days = min(getattr(req, 'days', 7) or 7, MAX_FORECAST_DAYS)
     try:
-        import psycopg2
-        conn = psycopg2.connect(
-            dbname=os.getenv("DB_NAME", "SmartAgriDB"),
-            user=os.getenv("DB_USER", "postgres"),
-            password=os.getenv("DB_PASS", "password"),
-            host=os.getenv("DB_HOST", "localhost"),
-            port=os.getenv("DB_PORT", "5432"),
-            sslmode='prefer'
-        )
-        cur = conn.cursor()
-        
-        # Helper for fuzzy params
-        def fuzzy(s):
-            return f"%{s}%"
-
-        # Try 1: Exact/Specific Match (Fuzzy on content, strict on hierarchy)
-        rows = []
-        cur.execute("""
-            SELECT modal_price FROM market_prices 
-            WHERE state ILIKE %s AND district ILIKE %s AND market ILIKE %s AND commodity ILIKE %s AND variety ILIKE %s
-            ORDER BY arrival_date DESC LIMIT 7
-        """, (req.state, req.district, fuzzy(req.market), fuzzy(req.commodity), fuzzy(req.variety)))
-        rows = cur.fetchall()
-
-        # Try 2: Same Market + Commodity (Ignore Variety, Fuzzy Commodity)
-        if not rows:
-            print(f"Level 1 failed for {req.commodity} in {req.market}. Trying Level 2 (Fuzzy Commodity)...")
-            cur.execute("""
-                SELECT modal_price FROM market_prices 
-                WHERE state ILIKE %s AND district ILIKE %s AND market ILIKE %s AND commodity ILIKE %s
-                ORDER BY arrival_date DESC LIMIT 7
-            """, (req.state, req.district, fuzzy(req.market), fuzzy(req.commodity)))
-            rows = cur.fetchall()
+        mode = forecast_mode(req, current)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Try 3: Same District + Commodity (Ignore Market)
-        if not rows:
-            print("Level 2 failed. Trying Level 3 (District Average)...")
-            cur.execute("""
-                SELECT AVG(modal_price) FROM market_prices 
-                WHERE state ILIKE %s AND district ILIKE %s AND commodity ILIKE %s
-                GROUP BY arrival_date
-                ORDER BY arrival_date DESC LIMIT 7
-            """, (req.state, fuzzy(req.district), fuzzy(req.commodity)))
-            rows = cur.fetchall()
-
-        # Try 4: Same State + Commodity
-        if not rows:
-            print("Level 3 failed. Trying Level 4 (State Average)...")
-            cur.execute("""
-                SELECT AVG(modal_price) FROM market_prices 
-                WHERE state ILIKE %s AND commodity ILIKE %s
-                GROUP BY arrival_date
-                ORDER BY arrival_date DESC LIMIT 7
-            """, (req.state, fuzzy(req.commodity)))
-            rows = cur.fetchall()
+    # DB Connection
+    try:
+        db_started = time.perf_counter()
+        with market_db() as conn:
+            timer.add("db_connect", (time.perf_counter() - db_started) * 1000)
+
+            # Answer from the nightly materialized forecasts when today's run covered this series
+            precomputed = None
+            if mode == 'recursive':
+                with timer.stage("precomputed_lookup"):
+                    precomputed = fetch_precomputed_forecast(conn, req, entities, forecast_days, model_version, today)
+            if precomputed is None:
+                # One statement resolves the whole fallback cascade (exact -> market -> district/state/global avg)
+                with timer.stage("fallback_cascade"):
+                    history = fetch_price_histories(conn, [req], entities)[0]
+        if precomputed is not None:
+            return _timed({
+                "commodity": req.commodity,
+                "market": req.market,
+                "predictions": precomputed,
+                "forecast_days": forecast_days,
+                "forecast_mode": mode,
+                "fallback_level": FALLBACK_LEVELS[1],
+            }, timer, response, x_server_timing)
+
+        rows = history.rows
 
-        # Try 5: Global Commodity Average (Last Resort)
-        if not rows:
-             print("Level 4 failed. Trying Level 5 (Global Average)...")
-             cur.execute("""
-                SELECT AVG(modal_price) FROM market_prices 
-                WHERE commodity ILIKE %s
-                GROUP BY arrival_date
-                ORDER BY arrival_date DESC LIMIT 7
-            """, (fuzzy(req.commodity),))
-             rows = cur.fetchall()
-
-        cur.close()
-        conn.close()
-        
         if not rows:
             print(f"All levels failed for {req.commodity}. No data found.")
             # Start of Logic Change: Raise error instead of fake prediction
             raise HTTPException(status_code=404, detail=f"No pricing data found for commodity '{req.commodity}' in market '{req.market}'. Please check the spelling or try a different combination.")
             # End of Logic Change
+        if history.level > 1:
+            print(f"Resolved {req.commodity} in {req.market} at fallback level {history.level} ({history.level_name}).")
 
-        # Flatten results (some are tuples of 1)
-        prices = [float(r[0]) for r in rows if r[0] is not None]
+        prices = [float(r) for r in rows if r is not None]
         if not prices:
              raise HTTPException(status_code=404, detail="Found data records but prices were empty.")
-             
-        current_lag = prices[0]
-        current_ma = sum(prices) / len(prices)
+        latest_arrival_date = history.latest_arrival_date
             
     except HTTPException as he:
         raise he
@@ -476,61 +646,140 @@ def predict_price(req: PredictionRequest):
         print(f"DB Error: {e}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-    if 'prices' in locals() and prices:
-        history_buffer = [p for p in prices]
-    else:
-        history_buffer = [current_lag] * 7
+    cache_key = forecast_cache_key(encoded, forecast_days, mode, model_version, latest_arrival_date, today.date(), prices)
+    with timer.stage("cache_lookup"):
+        cached = forecast_cache.get(cache_key)
+    if cached is not None:
+        return _timed(cached, timer, response, x_server_timing)
+
+    started = time.perf_counter()
+    with timer.stage("forecast"):
+        results = forecast_prices(
+            current.direct if mode == 'direct' else model,
+            [encoded],
+            [prices],
+            forecast_days,
+            start_date=today,
+            timer=timer,
+            mode=mode,
+        )[0]
+    # The shadow model is a recursive forest; only like-for-like forecasts are compared
+    if mode == 'recursive':
+        with timer.stage("shadow_submit"):
+            model_registry.submit_shadow([req], [prices], forecast_days, today, [results],
+                                         (time.perf_counter() - started) * 1000)
+
+    payload = {
+        "commodity": req.commodity,
+        "market": req.market,
+        "predictions": results,
+        "forecast_days": forecast_days,
+        "forecast_mode": mode,
+        "fallback_level": history.level_name,
+    }
+    forecast_cache.put(cache_key, payload, commodity=req.commodity)
+    return _timed(payload, timer, response, x_server_timing)
 
-    feature_names = [
-        'state_encoded', 'district_encoded', 'market_encoded', 
-        'commodity_encoded', 'variety_encoded', 'grade_encoded',
-        'moving_avg_7d', 'price_lag_1d', 'is_weekend'
-    ]
-    
-    results = []
 
-    forecast_days = min(getattr(req, 'days', 7) or 7, 30)
+@app.post("/predict-price/batch")
+def predict_price_batch(batch: BatchPredictionRequest, response: Response, x_server_timing: Optional[str] = Header(None)):
+    timer = start_timer("predict_price_batch", force=bool(x_server_timing))
+    with timer.stage("model"):
+        current = model_registry.active()
+    if not current or not current.model or not current.encoders:
+        raise HTTPException(status_code=500, detail="Model not loaded.")
+    model, encoders = current.model, current.encoders
 
-    for i in range(forecast_days):
-        target_date = today + timedelta(days=i+1)
-        is_weekend = 1 if target_date.weekday() >= 5 else 0
-        
-        features_df = pd.DataFrame([[
-            state_enc, dist_enc, mkt_enc, 
-            comm_enc, var_enc, grade_enc,
-            current_ma, current_lag, is_weekend
-        ]], columns=feature_names)
-        
-        pred_price = model.predict(features_df)[0]
+    items = batch.items
+    if not items:
+        return {"results": [], "count": 0, "failed": 0}
+    if len(items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch too large. Maximum {MAX_BATCH_ITEMS} items per request.")
 
+    today = datetime.now()
+    results = [
+        {
+            "index": i,
+            "commodity": item.commodity,
+            "market": item.market,
+            "predictions": [],
+            "forecast_days": max(min(item.days or 7, MAX_FORECAST_DAYS), 0),
+            "forecast_mode": None,
+            "fallback_level": None,
+            "error": None,
+        }
+        for i, item in enumerate(items)
+    ]
+    for i, item in enumerate(items):
         try:
-            tree_preds = np.array([tree.predict(features_df)[0] for tree in model.estimators_])
-            std_dev = float(np.std(tree_preds))
-            confidence_interval = {
-                "lower": round(max(0, pred_price - 1.96 * std_dev), 2),
-                "upper": round(pred_price + 1.96 * std_dev, 2),
-                "std_dev": round(std_dev, 2),
-            }
-        except Exception:
-            confidence_interval = None
+            results[i]["forecast_mode"] = forecast_mode(item, current)
+        except ValueError as e:
+            results[i]["error"] = {"status_code": 400, "detail": str(e)}
+
+    with timer.stage("encode"):
+        entities = get_entity_dictionary(encoders)
+        encoded = [None] * len(items)
+        for i, item in enumerate(items):
+            try:
+                encoded[i] = encode_prediction_request(item, entities)
+            except Exception as e:
+                results[i]["error"] = {"status_code": 400, "detail": f"Encoding error: {str(e)}"}
 
-        results.append({
-            "date": target_date.strftime("%Y-%m-%d"),
-            "predicted_price": round(pred_price, 2),
-            "confidence_interval": confidence_interval,
-        })
-        
-        current_lag = pred_price
-        history_buffer.insert(0, pred_price)
-        history_buffer.pop()
-        current_ma = sum(history_buffer) / len(history_buffer)
+    # One round trip resolves the fallback cascade for every item
+    try:
+        db_started = time.perf_counter()
+        with market_db() as conn:
+            timer.add("db_connect", (time.perf_counter() - db_started) * 1000)
+            with timer.stage("fallback_cascade"):
+                histories = fetch_price_histories(conn, items, entities)
+    except Exception as e:
+        print(f"DB Error: {e}")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-    return {
-        "commodity": req.commodity,
-        "market": req.market,
-        "predictions": results,
-        "forecast_days": forecast_days,
-    }
+    ready = []
+    for i, history in enumerate(histories):
+        rows = history.rows
+        if results[i]["error"]:
+            continue
+        results[i]["fallback_level"] = history.level_name
+        if not rows:
+            results[i]["error"] = {
+                "status_code": 404,
+                "detail": f"No pricing data found for commodity '{items[i].commodity}' in market '{items[i].market}'. Please check the spelling or try a different combination.",
+            }
+            continue
+        prices = [float(r) for r in rows if r is not None]
+        if not prices:
+            results[i]["error"] = {"status_code": 404, "detail": "Found data records but prices were empty."}
+            continue
+        ready.append((i, prices))
+
+    for mode in FORECAST_MODES:
+        group = [(i, prices) for i, prices in ready if results[i]["forecast_mode"] == mode]
+        if not group:
+            continue
+        # All series of a mode share one stacked feature matrix (per horizon step when recursive)
+        horizon = max(results[i]["forecast_days"] for i, _ in group)
+        started = time.perf_counter()
+        with timer.stage("forecast"):
+            forecasts = forecast_prices(
+                current.direct if mode == 'direct' else model,
+                [encoded[i] for i, _ in group],
+                [prices for _, prices in group],
+                horizon,
+                start_date=today,
+                timer=timer,
+                mode=mode,
+            )
+        if mode == 'recursive':
+            with timer.stage("shadow_submit"):
+                model_registry.submit_shadow([items[i] for i, _ in group], [prices for _, prices in group], horizon,
+                                             today, forecasts, (time.perf_counter() - started) * 1000)
+        for (i, _), forecast in zip(group, forecasts):
+            results[i]["predictions"] = forecast[:results[i]["forecast_days"]]
+
+    failed = sum(1 for r in results if r["error"])
+    return _timed({"results": results, "count": len(results), "failed": failed}, timer, response, x_server_timing)
 
 
 @app.get("/market-prices/trends")
@@ -541,39 +790,15 @@ def get_price_trends(
     days: int = Query(30, ge=7, le=90),
 ):
     try:
-        import psycopg2
-        conn = psycopg2.connect(
-            dbname=os.getenv("DB_NAME", "SmartAgriDB"),
-            user=os.getenv("DB_USER", "postgres"),
-            password=os.getenv("DB_PASS", "password"),
-            host=os.getenv("DB_HOST", "localhost"),
-            port=os.getenv("DB_PORT", "5432"),
-            sslmode='prefer'
-        )
         from psycopg2.extras import RealDictCursor
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        params = [f"%{commodity}%", state]
-        query = """
-            SELECT arrival_date, AVG(modal_price) as avg_price,
-                   MIN(min_price) as min_price, MAX(max_price) as max_price
-            FROM market_prices
-            WHERE commodity ILIKE %s AND state ILIKE %s
-        """
-        if district:
-            query += " AND district ILIKE %s"
-            params.append(f"%{district}%")
-
-        query += f"""
-            AND arrival_date >= CURRENT_DATE - INTERVAL '{days} days'
-            GROUP BY arrival_date
-            ORDER BY arrival_date ASC
-        """
-
-        cur.execute(query, params)
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
+
+        # Equality on canonical names where they resolve, the old patterns otherwise
+        entities = get_entity_dictionary(current_encoders())
+        query, params = price_trend_query(entities, commodity, state, district, days)
+
+        with market_db() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall()
 
         trend_data = [
             {
@@ -596,42 +821,87 @@ def get_price_trends(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/market-prices/export")
+def export_market_prices(
+    format: str = Query("parquet", pattern="^(parquet|arrow)$"),
+    start: Optional[date] = Query(None, description="First arrival date (default: 30 days before end)"),
+    end: Optional[date] = Query(None, description="Last arrival date (default: today)"),
+    state: Optional[str] = None,
+    commodity: Optional[str] = None,
+):
+    """Bulk export of market_prices as Parquet or an Arrow IPC stream.
+
+    Rows are read in keyset chunks on (arrival_date, id), each one COPY from
+    a single read-only snapshot, and every chunk is sent as a record batch
+    (Parquet row group) before the next one is read, with the name columns
+    dictionary encoded. Meant for analytics pulls instead of paging through
+    /mandi-prices.
+    """
+    end = end or datetime.now().date()
+    start = start or end - timedelta(days=30)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    try:
+        require_pyarrow()
+    except RuntimeError:
+        raise HTTPException(status_code=501, detail="Export needs pyarrow on the server")
+    try:
+        conn = get_market_db_connection()
+        where, params = export_filters(get_entity_dictionary(current_encoders()), start, end, state, commodity)
+    except Exception as e:
+        print(f"Database error: {e}")
+        raise HTTPException(status_code=503, detail="Market price database unavailable")
+
+    media_type, extension = EXPORT_FORMATS[format]
+    filename = f"market_prices_{start.isoformat()}_{end.isoformat()}.{extension}"
+    return StreamingResponse(stream_export(conn, where, params, format), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+# A page holds its pooled connection until the whole body is streamed
+MANDI_PRICES_MAX_LIMIT = 1000
+
+
 @app.get("/mandi-prices")
-def get_mandi_prices(state: str = None, district: str = None, limit: int = 100):
+def get_mandi_prices(
+    request: Request,
+    state: str = None,
+    district: str = None,
+    limit: int = Query(100, ge=1, le=MANDI_PRICES_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+):
+    """Newest market prices, one keyset page at a time.
+
+    The body is a JSON array of at most MANDI_PRICES_MAX_LIMIT rows, streamed
+    from a server-side cursor. When more rows follow, the X-Next-Cursor header (and a Link rel="next") carries the
+    cursor for the next page. Responses carry an ETag tied to the ingest
+    watermark and to the filters and cursor; sending it back in If-None-Match
+    for the same page returns 304 until new rows land.
+    """
     try:
-        import psycopg2
-        conn = psycopg2.connect(
-            dbname=os.getenv("DB_NAME", "SmartAgriDB"),
-            user=os.getenv("DB_USER", "postgres"),
-            password=os.getenv("DB_PASS", "password"),
-            host=os.getenv("DB_HOST", "localhost"),
-            port=os.getenv("DB_PORT", "5432"),
-            sslmode='prefer'
-        )
-        from psycopg2.extras import RealDictCursor
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        query = "SELECT * FROM market_prices WHERE 1=1"
-        params = []
-        
-        if state:
-            query += " AND state ILIKE %s"
-            params.append(state)
-        if district:
-            query += " AND district ILIKE %s"
-            params.append(district)
-            
-        query += " ORDER BY arrival_date DESC LIMIT %s"
-        params.append(limit)
-        
-        cur.execute(query, tuple(params))
-        results = cur.fetchall()
-        
-        cur.close()
-        conn.close()
-        return results
+        after = decode_cursor(cursor) if cursor else None
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    conn = None
+    try:
+        entities = get_entity_dictionary(current_encoders())
+        # Borrowed from the pool; the stream hands it back when the body is done
+        conn = get_pool().getconn()
+        # One snapshot for the ETag, the page end lookup and the streamed rows
+        conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        with conn.cursor() as cur:
+            etag = ingest_etag(cur, mandi_scope(entities, state, district, limit, after))
+            if etag_matches(if_none_match, etag):
+                conn.close()
+                return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+            cur.execute(*mandi_page_end_query(entities, state, district, limit, after))
+            page_end = cur.fetchall()
+        query, params = mandi_prices_query(entities, state, district, limit, after)
     except Exception as e:
         print(f"Database error: {e}. Returning mock data for demo purposes.")
+        if conn is not None:
+            conn.close()
         # Return mock market prices data for demo
         mock_data = [
             {
@@ -793,6 +1063,16 @@ def get_mandi_prices(state: str = None, district: str = None, limit: int = 100):
         ]
         return mock_data[:limit]
 
+    headers = {"Cache-Control": "no-cache"}
+    if etag:
+        headers["ETag"] = etag
+    if len(page_end) == 2:
+        next_cursor = encode_cursor(page_end[0])
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+    return StreamingResponse(stream_rows(conn, query, params, MANDI_COLUMNS),
+                             media_type="application/json", headers=headers)
+
 @app.get("/sensors/readings")
 def get_sensor_readings(
     field_id: Optional[str] = Query(None, description="Filter by field ID"),
@@ -1092,7 +1372,7 @@ async def get_daily_logs(
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase client not configured")
     
-    user_id = get_user_id_from_token(authorization)
+    user_id = await run_blocking(get_user_id_from_token, authorization)
     
     try:
         query = supabase.table("daily_farm_logs").select("*").eq("user_id", user_id).order("log_date", desc=True)
@@ -1102,7 +1382,7 @@ async def get_daily_logs(
         if end_date:
             query = query.lte("log_date", end_date)
         
-        response = query.execute()
+        response = await run_blocking(query.execute)
         
         return {
             "data": response.data or [],
@@ -1117,10 +1397,10 @@ async def get_daily_log_by_date(log_date: str, authorization: Optional[str] = He
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase client not configured")
     
-    user_id = get_user_id_from_token(authorization)
+    user_id = await run_blocking(get_user_id_from_token, authorization)
     
     try:
-        response = supabase.table("daily_farm_logs").select("*").eq("user_id", user_id).eq("log_date", log_date).single().execute()
+        response = await run_blocking(supabase.table("daily_farm_logs").select("*").eq("user_id", user_id).eq("log_date", log_date).single().execute)
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Log not found for this date")
@@ -1140,7 +1420,7 @@ async def manual_generate_log(
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase client not configured")
     
-    user_id = get_user_id_from_token(authorization)
+    user_id = await run_blocking(get_user_id_from_token, authorization)
     
     try:
         from datetime import datetime as _dt, date as _date
@@ -1167,7 +1447,7 @@ async def get_tasks(
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase client not configured")
     
-    user_id = get_user_id_from_token(authorization)
+    user_id = await run_blocking(get_user_id_from_token, authorization)
     
     try:
         query = supabase.table("tasks").select("*").eq("user_id", user_id).order("due_date", desc=False)
@@ -1181,7 +1461,7 @@ async def get_tasks(
         if end_date:
             query = query.lte("due_date", end_date)
         
-        response = query.execute()
+        response = await run_blocking(query.execute)
         
         return {
             "data": response.data or [],
@@ -1198,13 +1478,13 @@ async def create_task(task_data: dict, authorization: Optional[str] = Header(Non
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase client not configured")
     
-    user_id = get_user_id_from_token(authorization)
+    user_id = await run_blocking(get_user_id_from_token, authorization)
     
     try:
         task_data["user_id"] = user_id
         task_data["status"] = task_data.get("status", "pending")
         
-        response = supabase.table("tasks").insert(task_data).execute()
+        response = await run_blocking(supabase.table("tasks").insert(task_data).execute)
         
         return response.data[0] if response.data else {}
     except Exception as e:
@@ -1216,15 +1496,15 @@ async def update_task(task_id: str, task_data: dict, authorization: Optional[str
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase client not configured")
     
-    user_id = get_user_id_from_token(authorization)
+    user_id = await run_blocking(get_user_id_from_token, authorization)
     
     try:
-        existing = supabase.table("tasks").select("*").eq("id", task_id).eq("user_id", user_id).single().execute()
+        existing = await run_blocking(supabase.table("tasks").select("*").eq("id", task_id).eq("user_id", user_id).single().execute)
         
         if not existing.data:
             raise HTTPException(status_code=404, detail="Task not found")
         
-        response = supabase.table("tasks").update(task_data).eq("id", task_id).eq("user_id", user_id).execute()
+        response = await run_blocking(supabase.table("tasks").update(task_data).eq("id", task_id).eq("user_id", user_id).execute)
         
         return response.data[0] if response.data else {}
     except HTTPException as he:
@@ -1238,10 +1518,10 @@ async def delete_task(task_id: str, authorization: Optional[str] = Header(None))
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase client not configured")
     
-    user_id = get_user_id_from_token(authorization)
+    user_id = await run_blocking(get_user_id_from_token, authorization)
     
     try:
-        response = supabase.table("tasks").delete().eq("id", task_id).eq("user_id", user_id).execute()
+        response = await run_blocking(supabase.table("tasks").delete().eq("id", task_id).eq("user_id", user_id).execute)
         
         return {"success": True, "deleted": len(response.data) if response.data else 0}
     except Exception as e:
@@ -1257,7 +1537,7 @@ async def complete_task(
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase client not configured")
     
-    user_id = get_user_id_from_token(authorization)
+    user_id = await run_blocking(get_user_id_from_token, authorization)
     
     try:
         from datetime import datetime
@@ -1269,7 +1549,7 @@ async def complete_task(
             "completion_photo_url": completion_data.get("photo_url")
         }
         
-        response = supabase.table("tasks").update(update_data).eq("id", task_id).eq("user_id", user_id).execute()
+        response = await run_blocking(supabase.table("tasks").update(update_data).eq("id", task_id).eq("user_id", user_id).execute)
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Task not found")
@@ -1301,7 +1581,7 @@ async def get_schemes(
         if category:
             query = query.eq("category", category)
         
-        response = query.execute()
+        response = await run_blocking(query.execute)
         schemes = response.data or []
         
         if min_land is not None:
@@ -1322,7 +1602,7 @@ async def get_scheme_by_id(scheme_id: str):
         raise HTTPException(status_code=500, detail="Supabase client not configured")
     
     try:
-        response = supabase.table("government_schemes").select("*").eq("id", scheme_id).single().execute()
+        response = await run_blocking(supabase.table("government_schemes").select("*").eq("id", scheme_id).single().execute)
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Scheme not found")
@@ -1340,7 +1620,7 @@ async def check_eligibility(profile_data: dict, authorization: Optional[str] = H
         raise HTTPException(status_code=500, detail="Supabase client not configured")
     
     try:
-        response = supabase.table("government_schemes").select("*").execute()
+        response = await run_blocking(supabase.table("government_schemes").select("*").execute)
         all_schemes = response.data or []
         
         user_state = profile_data.get("state", "")
@@ -1389,7 +1669,7 @@ async def get_alerts(
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase client not configured")
     
-    user_id = get_user_id_from_token(authorization)
+    user_id = await run_blocking(get_user_id_from_token, authorization)
     
     try:
         query = supabase.table("alerts").select("*").eq("user_id", user_id).order("created_at", desc=True)
@@ -1397,7 +1677,7 @@ async def get_alerts(
         if acknowledged is not None:
             query = query.eq("acknowledged", acknowledged)
         
-        response = query.execute()
+        response = await run_blocking(query.execute)
         
         return {
             "data": response.data or [],
@@ -1414,13 +1694,13 @@ async def acknowledge_alert(alert_id: str, authorization: Optional[str] = Header
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase client not configured")
     
-    user_id = get_user_id_from_token(authorization)
+    user_id = await run_blocking(get_user_id_from_token, authorization)
     
     try:
-        response = supabase.table("alerts").update({
+        response = await run_blocking(supabase.table("alerts").update({
             "acknowledged": True,
             "acknowledged_at": datetime.utcnow().isoformat()
-        }).eq("id", alert_id).eq("user_id", user_id).execute()
+        }).eq("id", alert_id).eq("user_id", user_id).execute)
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Alert not found")
@@ -1436,7 +1716,7 @@ async def acknowledge_alert(alert_id: str, authorization: Optional[str] = Header
 async def get_current_weather_endpoint(lat: float, lon: float):
     try:
         from weather_service import get_current_weather
-        weather = get_current_weather(lat, lon)
+        weather = await run_blocking(get_current_weather, lat, lon)
         
         if not weather:
             raise HTTPException(status_code=503, detail="Weather service unavailable")
@@ -1450,7 +1730,7 @@ async def get_current_weather_endpoint(lat: float, lon: float):
 async def get_forecast_endpoint(lat: float, lon: float, days: int = 5):
     try:
         from weather_service import get_forecast
-        forecast = get_forecast(lat, lon, days)
+        forecast = await run_blocking(get_forecast, lat, lon, days)
         
         if not forecast:
             raise HTTPException(status_code=503, detail="Weather service unavailable")
@@ -1464,7 +1744,7 @@ async def get_forecast_endpoint(lat: float, lon: float, days: int = 5):
 async def get_weather_alerts_endpoint(lat: float, lon: float):
     try:
         from weather_service import check_weather_alerts
-        alerts = check_weather_alerts(lat, lon)
+        alerts = await run_blocking(check_weather_alerts, lat, lon)
         
         return {"alerts": alerts, "count": len(alerts)}
     except Exception as e:
@@ -1484,11 +1764,12 @@ async def send_voice_reminder(
     request: VoiceReminderRequest,
     authorization: str = Header(None),
 ):
-    user_id = await get_user_id_from_token(authorization)
+    user_id = await run_blocking(get_user_id_from_token, authorization)
     if not user_id:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    call_sid = send_task_reminder(
+    call_sid = await run_blocking(
+        send_task_reminder,
         phone_number=request.phone_number,
         task_title=request.task_title,
         task_id=request.task_id,
@@ -1497,7 +1778,7 @@ async def send_voice_reminder(
     )
 
     if call_sid and request.channel == "voice" and supabase:
-        log_voice_call(supabase, request.task_id, call_sid, request.phone_number)
+        await run_blocking(log_voice_call, supabase, request.task_id, call_sid, request.phone_number)
 
     return {
         "success": call_sid is not None or True,
@@ -1510,7 +1791,7 @@ async def send_voice_reminder(
 @app.post("/voice/acknowledge/{task_id}")
 async def voice_acknowledge(task_id: str, Digits: str = ""):
     if supabase:
-        update_call_acknowledgment(supabase, task_id, "", Digits)
+        await run_blocking(update_call_acknowledgment, supabase, task_id, "", Digits)
 
     from twilio.twiml.voice_response import VoiceResponse
     from fastapi.responses import Response
@@ -1528,7 +1809,7 @@ async def voice_acknowledge(task_id: str, Digits: str = ""):
 
 @app.get("/voice/call-logs")
 async def get_voice_call_logs(authorization: str = Header(None)):
-    user_id = await get_user_id_from_token(authorization)
+    user_id = await run_blocking(get_user_id_from_token, authorization)
     if not user_id:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
@@ -1536,7 +1817,7 @@ async def get_voice_call_logs(authorization: str = Header(None)):
         return {"data": [], "message": "Database not configured"}
 
     try:
-        logs = supabase.table("voice_call_logs").select("*").order("initiated_at", desc=True).limit(50).execute()
+        logs = await run_blocking(supabase.table("voice_call_logs").select("*").order("initiated_at", desc=True).limit(50).execute)
         return {"data": logs.data}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,164 @@
+"""
+Rolling-origin backtest of price model candidates.
+
+Every candidate is trained on the days before each fold's cutoff and scored on
+the days after it, with all (candidate, fold) fits running in parallel worker
+processes. Latency is then measured one candidate at a time on the compiled
+forest from its most recent fold, so the numbers are not skewed by the fits:
+per forecast step (1 row), per default 7-day /predict-price request, and per
+batch step.
+
+Features come from the feature store (see utils/feature_store.py), so this
+reads only new days from market_prices after the first run.
+
+Usage:
+    cd backend
+    python backtest.py
+    python backtest.py --candidate rf40:n_estimators=40,max_depth=14 --folds 6 --test-days 7
+    python backtest.py --json backtest.json
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from utils.compiled_forest import CompiledForest
+from utils.model_evaluation import (
+    feature_matrix,
+    fit_and_score,
+    measure_latency,
+    parse_params,
+    rolling_origin_folds,
+)
+
+warnings.filterwarnings('ignore')
+
+# name -> RandomForestRegressor params; rf100 is what train_model.py fits today
+DEFAULT_CANDIDATES = {
+    "rf100": {"n_estimators": 100},
+    "rf50_d16": {"n_estimators": 50, "max_depth": 16},
+    "rf30_d12_leaf5": {"n_estimators": 30, "max_depth": 12, "min_samples_leaf": 5},
+}
+
+_X = _y = _dates = None
+
+
+def _init_worker(X, y, dates):
+    global _X, _y, _dates
+    _X, _y, _dates = X, y, dates
+
+
+def _run_fold(name, params, fold, export_dir):
+    train = _dates < fold.cutoff.to_datetime64()
+    test = (_dates >= fold.cutoff.to_datetime64()) & (_dates < fold.test_end.to_datetime64())
+    result, forest = fit_and_score(params, _X[train], _y[train], _X[test], _y[test])
+    if export_dir:
+        forest.save(export_dir)
+    result.update(candidate=name, fold=fold.index, cutoff=fold.cutoff.date().isoformat())
+    return result
+
+
+def run_backtest(df, candidates, n_folds=4, test_days=7, min_train_days=14, workers=None,
+                 batch_size=256, repeat=200):
+    """Backtest candidates on encoded training features; returns (summary, per-fold results)."""
+    X = feature_matrix(df)
+    y = df['modal_price'].to_numpy(dtype=np.float64)
+    dates = df['arrival_date'].to_numpy(dtype='datetime64[ns]')
+    folds = rolling_origin_folds(dates, n_folds, test_days, min_train_days)
+    print(f"{len(folds)} folds of {test_days} days, cutoffs "
+          f"{', '.join(f.cutoff.date().isoformat() for f in folds)}; {len(candidates)} candidates")
+
+    export_root = tempfile.mkdtemp(prefix="backtest_")
+    results = []
+    try:
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                                 initializer=_init_worker, initargs=(X, y, dates)) as pool:
+            futures = []
+            for name, params in candidates.items():
+                for fold in folds:
+                    # The newest fold's model is kept for the latency measurement
+                    export = os.path.join(export_root, name) if fold is folds[-1] else None
+                    futures.append(pool.submit(_run_fold, name, params, fold, export))
+            for future in as_completed(futures):
+                results.append(future.result())
+        print(f"Fitted {len(results)} models in {time.perf_counter() - started:.1f}s")
+
+        # Latency on held-out rows of the newest fold, in the feature layout predict_price uses
+        newest = dates >= folds[-1].cutoff.to_datetime64()
+        summary = {}
+        for name, params in candidates.items():
+            runs = sorted((r for r in results if r["candidate"] == name), key=lambda r: r["fold"])
+            forest = CompiledForest.load(os.path.join(export_root, name))
+            latency = measure_latency(forest, X[newest], batch_size=batch_size, repeat=repeat)
+            summary[name] = {
+                "params": params,
+                "mae": float(np.mean([r["mae"] for r in runs])),
+                "r2": float(np.mean([r["r2"] for r in runs])),
+                "fit_seconds": float(np.mean([r["fit_seconds"] for r in runs])),
+                "size_mb": runs[-1]["size_mb"],
+                "trees": runs[-1]["trees"],
+                "max_depth": runs[-1]["max_depth"],
+                "latency": latency,
+            }
+    finally:
+        shutil.rmtree(export_root, ignore_errors=True)
+    return summary, sorted(results, key=lambda r: (r["candidate"], r["fold"]))
+
+
+def print_summary(summary):
+    print(f"\n{'candidate':>16} {'MAE':>9} {'R2':>7} {'fit s':>7} {'size MB':>8} "
+          f"{'1-row p50':>10} {'1-row p99':>10} {'request p99':>12} {'batch p50':>10} {'batch p99':>10}")
+    for name, s in summary.items():
+        single, request = s["latency"]["single"], s["latency"]["request"]
+        batch = s["latency"]["batch"] or {}
+        print(f"{name:>16} {s['mae']:>9.2f} {s['r2']:>7.4f} {s['fit_seconds']:>7.1f} {s['size_mb']:>8.1f} "
+              f"{single['p50_ms']:>8.3f}ms {single['p99_ms']:>8.3f}ms {request['p99_ms']:>10.3f}ms "
+              f"{batch.get('p50_ms', float('nan')):>8.3f}ms {batch.get('p99_ms', float('nan')):>8.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidate", action="append", metavar="NAME:PARAMS",
+                        help="e.g. rf40:n_estimators=40,max_depth=14 (repeatable; default: built-in grid)")
+    parser.add_argument("--folds", type=int, default=4)
+    parser.add_argument("--test-days", type=int, default=7)
+    parser.add_argument("--min-train-days", type=int, default=14)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=256, help="Rows per batch latency sample")
+    parser.add_argument("--json", help="Write the summary and per-fold results to this file")
+    args = parser.parse_args()
+
+    if args.candidate:
+        candidates = {}
+        for spec in args.candidate:
+            name, _, params = spec.partition(":")
+            candidates[name] = parse_params(params)
+    else:
+        candidates = DEFAULT_CANDIDATES
+
+    from train_model import encode_features, load_features
+
+    df = load_features()
+    if df.empty:
+        print("No data found in database. Please run the fetch script first.")
+        return
+    df, _ = encode_features(df, save_path=None)
+
+    summary, folds = run_backtest(df, candidates, args.folds, args.test_days, args.min_train_days,
+                                  args.workers, args.batch_size)
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"summary": summary, "folds": folds}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
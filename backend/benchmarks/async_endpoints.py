@@ -0,0 +1,135 @@
+"""Throughput of an `async def` endpoint doing Supabase queries inline vs on the blocking I/O pool.
+
+A local stand-in for PostgREST answers every query after --latency seconds.
+Requests are driven in-process through httpx's ASGI transport, so they share
+one event loop the way they do in a single uvicorn worker, with the given
+numbers of requests in flight. Three routes run the same government_schemes
+query through a real supabase client:
+
+  inline     the query's .execute() called directly, as the endpoints did
+  offloaded  the same call awaited through utils.blocking_io.run_blocking
+  /schemes   the API's own endpoint
+
+The stand-in server and the supabase client share this process, so beyond
+a few dozen requests in flight their Python overhead, not the pool, caps
+throughput.
+
+Usage:
+    cd backend
+    python -m benchmarks.async_endpoints
+    python -m benchmarks.async_endpoints --in-flight 1 16 64 --requests 256 --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+from fastapi import FastAPI
+
+SCHEMES = [{"id": i, "name": f"Scheme {i}", "state": "All India", "category": "subsidy",
+            "min_land_acres": None, "max_land_acres": None} for i in range(20)]
+
+
+class FakePostgREST:
+    """Answers any GET under /rest/v1/ with SCHEMES after `latency` seconds, from a background thread."""
+
+    def __init__(self, latency: float):
+        latency_s = latency
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                time.sleep(latency_s)
+                payload = json.dumps(SCHEMES).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            request_queue_size = 256
+
+        self._server = Server(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def make_app(client) -> FastAPI:
+    from utils.blocking_io import run_blocking
+
+    bench = FastAPI()
+
+    @bench.get("/inline")
+    async def inline():
+        response = client.table("government_schemes").select("*").eq("state", "All India").execute()
+        return {"count": len(response.data)}
+
+    @bench.get("/offloaded")
+    async def offloaded():
+        response = await run_blocking(client.table("government_schemes").select("*").eq("state", "All India").execute)
+        return {"count": len(response.data)}
+
+    return bench
+
+
+async def drive(app, path: str, in_flight: int, requests: int) -> float:
+    """Requests per second for `requests` GETs of path, at most in_flight at a time."""
+    semaphore = asyncio.Semaphore(in_flight)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+        async def one():
+            async with semaphore:
+                response = await http.get(path)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        return requests / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[1, 4, 16, 32, 64])
+    parser.add_argument("--requests", type=int, default=128)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds the fake PostgREST takes per query")
+    args = parser.parse_args()
+
+    with FakePostgREST(args.latency) as postgrest:
+        os.environ["VITE_SUPABASE_URL"] = postgrest.url
+        os.environ["SUPABASE_SERVICE_ROLE_KEY"] = "benchmark-key"
+        import api
+        from utils.blocking_io import BLOCKING_IO_WORKERS
+
+        bench = make_app(api.get_supabase_client())
+        routes = [("inline", bench, "/inline"), ("offloaded", bench, "/offloaded"), ("/schemes", api.app, "/schemes")]
+        print(f"PostgREST latency {args.latency * 1000:.0f} ms, {BLOCKING_IO_WORKERS} blocking I/O workers")
+        print(f"{'in flight':>9} " + " ".join(f"{name + ' req/s':>16}" for name, _, _ in routes))
+        for in_flight in args.in_flight:
+            rates = [asyncio.run(drive(app, path, in_flight, args.requests)) for _, app, path in routes]
+            print(f"{in_flight:>9} " + " ".join(f"{rate:>16.1f}" for rate in rates))
+
+
+if __name__ == "__main__":
+    main()
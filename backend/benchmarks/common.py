@@ -0,0 +1,110 @@
+"""Shared helpers for the backend benchmark scripts.
+
+Benchmarks are run from the backend directory, e.g.:
+    python -m benchmarks.forecast_latency
+"""
+import os
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from sklearn.ensemble import RandomForestRegressor
+
+from utils.price_forecast import FEATURE_NAMES
+
+# Benchmarks that need Postgres seed their own database so real data is never touched
+BENCH_DB_NAME = os.getenv("BENCH_DB_NAME", "SmartAgriBench")
+
+
+def make_synthetic_training_data(n_rows: int = 20000, seed: int = 42) -> pd.DataFrame:
+    """Random rows in the same feature layout train_model.py produces."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'state_encoded': rng.integers(0, 27, n_rows),
+        'district_encoded': rng.integers(0, 354, n_rows),
+        'market_encoded': rng.integers(0, 884, n_rows),
+        'commodity_encoded': rng.integers(0, 189, n_rows),
+        'variety_encoded': rng.integers(0, 320, n_rows),
+        'grade_encoded': rng.integers(0, 14, n_rows),
+        'is_weekend': rng.integers(0, 2, n_rows),
+    })
+    base = 500 + df['commodity_encoded'] * 40 + rng.normal(0, 150, n_rows)
+    df['price_lag_1d'] = base + rng.normal(0, 50, n_rows)
+    df['moving_avg_7d'] = base + rng.normal(0, 25, n_rows)
+    df['modal_price'] = 0.6 * df['price_lag_1d'] + 0.4 * df['moving_avg_7d'] + rng.normal(0, 30, n_rows)
+    return df
+
+
+def make_synthetic_model(n_estimators: int = 100, n_rows: int = 20000, seed: int = 42, **params):
+    """Fit a RandomForestRegressor shaped like price_model.pkl on synthetic data."""
+    df = make_synthetic_training_data(n_rows, seed)
+    model = RandomForestRegressor(n_estimators=n_estimators, random_state=seed, n_jobs=-1, **params)
+    model.fit(df[FEATURE_NAMES], df['modal_price'])
+    return model
+
+
+def time_call(func: Callable, repeat: int = 20) -> Dict[str, float]:
+    """Wall-clock latency of func() in milliseconds over `repeat` runs."""
+    samples: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    arr = np.array(samples)
+    return {
+        "mean_ms": float(arr.mean()),
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p95_ms": float(np.percentile(arr, 95)),
+    }
+
+
+def use_bench_database() -> None:
+    """Create the benchmark database if needed and point DB_NAME at it."""
+    conn = psycopg2.connect(
+        dbname='postgres',
+        user=os.getenv("DB_USER", "postgres"),
+        password=os.getenv("DB_PASS", "password"),
+        host=os.getenv("DB_HOST", "localhost"),
+        port=os.getenv("DB_PORT", "5432"),
+    )
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (BENCH_DB_NAME,))
+        if not cur.fetchone():
+            cur.execute(f'CREATE DATABASE "{BENCH_DB_NAME}"')
+    conn.close()
+    os.environ["DB_NAME"] = BENCH_DB_NAME
+
+
+def seed_market_prices(conn, states: int = 20, districts: int = 10, markets: int = 5,
+                       commodities: int = 20, varieties: int = 2, days: int = 50) -> int:
+    """Recreate market_prices with the project schema and fill it (and its daily rollup) server-side.
+
+    Row count is states * districts * markets * commodities * varieties * days
+    (2,000,000 with the defaults). Names look like the data.gov.in feed, e.g.
+    'State3', 'District3_7', 'Market3_7_2 APMC', 'Commodity12', 'Variety1'.
+    """
+    from fetch_market_prices import create_table_if_not_exists
+    from utils.market_rollup import rebuild_rollup
+
+    with conn.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS market_prices")
+    create_table_if_not_exists(conn)
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO market_prices
+            (state, district, market, commodity, variety, grade, arrival_date, min_price, max_price, modal_price)
+            SELECT 'State' || s, 'District' || s || '_' || d, 'Market' || s || '_' || d || '_' || m || ' APMC',
+                   'Commodity' || c, 'Variety' || v, 'FAQ', CURRENT_DATE - day,
+                   round(p - 100), round(p + 100), round(p)
+            FROM generate_series(1, %s) s, generate_series(1, %s) d, generate_series(1, %s) m,
+                 generate_series(1, %s) c, generate_series(1, %s) v, generate_series(0, %s - 1) day,
+                 LATERAL (SELECT 500 + c * 40 + random() * 300 AS p) price
+        """, (states, districts, markets, commodities, varieties, days))
+        count = cur.rowcount
+        cur.execute("ANALYZE market_prices")
+        rebuild_rollup(cur)
+    conn.commit()
+    return count
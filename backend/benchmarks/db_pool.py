@@ -0,0 +1,74 @@
+"""Per-request connect vs the shared pool, for the trend query under concurrency.
+
+Each simulated request runs the /market-prices/trends query once, either on
+a connection opened and closed for it (the endpoints before the pool) or on
+one borrowed from a MarketDBPool of --pool-size. Requests come from
+--threads worker threads; latency is per request, including the connection.
+Runs against BENCH_DB_NAME (default SmartAgriBench; seed it with
+benchmarks.price_trends). Over TLS or to a remote host the handshake, and so
+the gap, is larger than on a local socket.
+
+Usage:
+    cd backend
+    python -m benchmarks.db_pool
+    python -m benchmarks.db_pool --threads 1 8 32 --requests 400 --pool-size 10
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.common import use_bench_database
+from utils.db import MarketDBPool, get_market_db_connection
+from utils.entity_dictionary import EntityDictionary
+from utils.market_history import price_trend_query
+
+
+def run(borrow, query, params, threads, requests):
+    """(p50 ms, p95 ms, requests per second) for `requests` calls spread over `threads`."""
+    def one(_):
+        started = time.perf_counter()
+        conn = borrow()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+                cur.fetchall()
+            conn.rollback()
+        finally:
+            conn.close()
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        samples = np.array(list(executor.map(one, range(requests))))
+    elapsed = time.perf_counter() - started
+    return float(np.percentile(samples, 50)), float(np.percentile(samples, 95)), requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--pool-size", type=int, default=10)
+    args = parser.parse_args()
+
+    use_bench_database()
+    conn = get_market_db_connection()
+    entities = EntityDictionary.build(conn)
+    conn.close()
+    query, params = price_trend_query(entities, "Commodity7", "State3", None, 30)
+
+    pool = MarketDBPool(minconn=args.pool_size, maxconn=args.pool_size, timeout=60).open()
+    print(f"{'threads':>8} {'mode':>8} {'p50 ms':>8} {'p95 ms':>8} {'req/s':>8}")
+    for threads in args.threads:
+        for mode, borrow in (("connect", get_market_db_connection), ("pool", pool.getconn)):
+            p50, p95, rate = run(borrow, query, params, threads, args.requests)
+            print(f"{threads:>8} {mode:>8} {p50:>8.2f} {p95:>8.2f} {rate:>8.0f}")
+    stats = pool.stats()
+    print(f"pool: created {stats['created']}, waits {stats['wait']}")
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
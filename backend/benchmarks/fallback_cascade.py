@@ -0,0 +1,104 @@
+"""Price-history lookup: old five-query ILIKE cascade vs the single-statement resolver,
+with ILIKE patterns and with canonical names from the entity dictionary.
+
+Seeds market_prices in the benchmark database (BENCH_DB_NAME, default
+SmartAgriBench) and times both lookups for requests that resolve at each
+fallback level.
+
+Usage:
+    cd backend
+    python -m benchmarks.fallback_cascade            # seed 2M rows, then benchmark
+    python -m benchmarks.fallback_cascade --no-seed  # reuse the existing table
+"""
+import argparse
+from types import SimpleNamespace
+
+from benchmarks.common import seed_market_prices, time_call, use_bench_database
+from utils.db import get_market_db_connection
+from utils.entity_dictionary import EntityDictionary
+from utils.market_history import FALLBACK_LEVELS, fetch_price_histories
+
+SCENARIOS = [
+    ("exact", dict(state="State3", district="District3_4", market="Market3_4_2", commodity="Commodity7", variety="Variety1")),
+    ("market", dict(state="State3", district="District3_4", market="Market3_4_2", commodity="Commodity7", variety="Organic")),
+    ("district_avg", dict(state="State3", district="District3_4", market="Nowhere", commodity="Commodity7", variety="Variety1")),
+    ("state_avg", dict(state="State3", district="Elsewhere", market="Nowhere", commodity="Commodity7", variety="Variety1")),
+    ("global_avg", dict(state="Atlantis", district="Elsewhere", market="Nowhere", commodity="Commodity7", variety="Variety1")),
+    ("miss", dict(state="Atlantis", district="Elsewhere", market="Nowhere", commodity="Saffron", variety="Variety1")),
+]
+
+
+def legacy_cascade(conn, req):
+    """The sequential lookup predict_price used before; returns (rows, round_trips)."""
+    def fuzzy(s):
+        return f"%{s}%"
+
+    cur = conn.cursor()
+    queries = [
+        ("""SELECT modal_price FROM market_prices
+            WHERE state ILIKE %s AND district ILIKE %s AND market ILIKE %s AND commodity ILIKE %s AND variety ILIKE %s
+            ORDER BY arrival_date DESC LIMIT 7""",
+         (req.state, req.district, fuzzy(req.market), fuzzy(req.commodity), fuzzy(req.variety))),
+        ("""SELECT modal_price FROM market_prices
+            WHERE state ILIKE %s AND district ILIKE %s AND market ILIKE %s AND commodity ILIKE %s
+            ORDER BY arrival_date DESC LIMIT 7""",
+         (req.state, req.district, fuzzy(req.market), fuzzy(req.commodity))),
+        ("""SELECT AVG(modal_price) FROM market_prices
+            WHERE state ILIKE %s AND district ILIKE %s AND commodity ILIKE %s
+            GROUP BY arrival_date ORDER BY arrival_date DESC LIMIT 7""",
+         (req.state, fuzzy(req.district), fuzzy(req.commodity))),
+        ("""SELECT AVG(modal_price) FROM market_prices
+            WHERE state ILIKE %s AND commodity ILIKE %s
+            GROUP BY arrival_date ORDER BY arrival_date DESC LIMIT 7""",
+         (req.state, fuzzy(req.commodity))),
+        ("""SELECT AVG(modal_price) FROM market_prices
+            WHERE commodity ILIKE %s
+            GROUP BY arrival_date ORDER BY arrival_date DESC LIMIT 7""",
+         (fuzzy(req.commodity),)),
+    ]
+    rows = []
+    round_trips = 0
+    for query, params in queries:
+        cur.execute(query, params)
+        round_trips += 1
+        rows = cur.fetchall()
+        if rows:
+            break
+    cur.close()
+    return [r[0] for r in rows], round_trips
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--no-seed", action="store_true", help="Reuse the existing benchmark table")
+    parser.add_argument("--days", type=int, default=50, help="Days of history per series when seeding")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    use_bench_database()
+    conn = get_market_db_connection()
+    if not args.no_seed:
+        print("Seeding market_prices...")
+        print(f"Seeded {seed_market_prices(conn, days=args.days):,} rows")
+
+    entities = EntityDictionary.build(conn)
+    print(f"\n{'scenario':>13} {'level':>13} {'legacy p50':>11} {'trips':>6} {'single p50':>11} {'canonical p50':>14}")
+    for name, fields in SCENARIOS:
+        req = SimpleNamespace(**fields)
+        legacy_rows, trips = legacy_cascade(conn, req)
+        history = fetch_price_histories(conn, [req])[0]
+        assert legacy_rows == history.rows, f"Lookup mismatch for scenario {name}"
+        assert (history.level_name or "miss") == name, f"Expected {name}, resolved {history.level_name}"
+        assert fetch_price_histories(conn, [req], entities)[0] == history, f"Canonical mismatch for {name}"
+
+        legacy = time_call(lambda: legacy_cascade(conn, req), repeat=args.repeat)
+        single = time_call(lambda: fetch_price_histories(conn, [req]), repeat=args.repeat)
+        canonical = time_call(lambda: fetch_price_histories(conn, [req], entities), repeat=args.repeat)
+        print(f"{name:>13} {FALLBACK_LEVELS.get(history.level, '-'):>13} "
+              f"{legacy['p50_ms']:>9.1f}ms {trips:>6} {single['p50_ms']:>9.1f}ms {canonical['p50_ms']:>12.1f}ms")
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
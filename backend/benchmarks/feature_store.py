@@ -0,0 +1,115 @@
+"""Feature engineering: per-group lambdas vs native grouped ops vs the feature store.
+
+Against a seeded market_prices table (BENCH_DB_NAME, default SmartAgriBench)
+this times the preprocess_data feature code as it was (groupby.transform with
+Python lambdas and a row-wise .apply), compute_features on the same rows, a full
+FeatureStore build, and then a FeatureStore update after one more day of prices
+is inserted -- the work a daily retrain now does. The store is built in a
+temporary directory and checked against a full recompute.
+
+Usage:
+    cd backend
+    python -m benchmarks.feature_store                 # seed 2M rows, then benchmark
+    python -m benchmarks.feature_store --no-seed --skip-legacy
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import seed_market_prices, use_bench_database
+
+SERIES_KEYS = ['state', 'district', 'market', 'commodity', 'variety']
+FEATURES = ['modal_price', 'moving_avg_7d', 'price_lag_1d', 'is_weekend']
+
+
+def legacy_features(df):
+    """The feature steps of preprocess_data before compute_features."""
+    df['arrival_date'] = pd.to_datetime(df['arrival_date'])
+    df['modal_price'] = df['modal_price'].astype('float64')
+    df = df.sort_values(by=SERIES_KEYS + ['arrival_date'])
+    df['modal_price'] = df.groupby(SERIES_KEYS, observed=True)['modal_price'].transform(
+        lambda x: x.interpolate(method='linear').bfill().ffill())
+    df = df.dropna(subset=['modal_price'])
+    grouper = df.groupby(SERIES_KEYS, observed=True)
+    df['moving_avg_7d'] = grouper['modal_price'].transform(lambda x: x.rolling(window=7, min_periods=1).mean())
+    df['price_lag_1d'] = grouper['modal_price'].transform(lambda x: x.shift(1))
+    df['price_lag_1d'] = df['price_lag_1d'].fillna(df['modal_price'])
+    df['is_weekend'] = df['arrival_date'].dt.dayofweek.apply(lambda x: 1 if x >= 5 else 0)
+    return df
+
+
+def append_day(conn):
+    """Copy the newest day of every series one day forward with jittered prices."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO market_prices
+            (state, district, market, commodity, variety, grade, arrival_date, min_price, max_price, modal_price)
+            SELECT state, district, market, commodity, variety, grade, arrival_date + 1,
+                   min_price, max_price, round(modal_price * (0.95 + random() * 0.1))
+            FROM market_prices
+            WHERE arrival_date = (SELECT max(arrival_date) FROM market_prices)
+        """)
+        count = cur.rowcount
+    conn.commit()
+    return count
+
+
+def _timed(label, func):
+    started = time.perf_counter()
+    result = func()
+    print(f"{label:>34} {time.perf_counter() - started:>8.2f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--no-seed", action="store_true", help="Reuse the existing benchmark table")
+    parser.add_argument("--days", type=int, default=50, help="Days of history per series when seeding")
+    parser.add_argument("--skip-legacy", action="store_true", help="Do not time the lambda version (slow)")
+    args = parser.parse_args()
+
+    use_bench_database()
+    import train_model
+    from utils.feature_store import FeatureStore, compute_features
+
+    conn = train_model.get_db_connection()
+    if not args.no_seed:
+        print(f"Seeded {seed_market_prices(conn, days=args.days):,} rows")
+    os.chdir(tempfile.mkdtemp())
+
+    raw = train_model.load_data()
+    print()
+    if not args.skip_legacy:
+        legacy = _timed("lambda transforms (before)", lambda: legacy_features(raw.copy()))
+    vectorized = _timed("compute_features (full)", lambda: compute_features(raw))
+    if not args.skip_legacy:
+        legacy = legacy.reset_index(drop=True)
+        for col in ['modal_price', 'price_lag_1d', 'is_weekend']:
+            np.testing.assert_array_equal(legacy[col].to_numpy(), vectorized[col].to_numpy())
+        # rolling().mean() keeps a running sum; compute_features sums each window afresh
+        np.testing.assert_allclose(legacy['moving_avg_7d'], vectorized['moving_avg_7d'], rtol=1e-9)
+        print(f"{'':>34} features match ({len(vectorized):,} rows)")
+    raw = legacy = vectorized = None
+
+    store = FeatureStore("feature_store")
+    loader = lambda since: train_model.load_data(since=since)  # noqa: E731
+    _timed("store build (load + features)", lambda: store.update(loader, rebuild=True))
+    print(f"{'':>34} appended {append_day(conn):,} rows for one more day")
+    _timed("store update (one-day delta)", lambda: store.update(loader))
+    stored = _timed("store read", store.read)
+    conn.close()
+
+    expected = compute_features(train_model.load_data())
+    for col in SERIES_KEYS:
+        expected[col] = expected[col].astype(str)
+    pd.testing.assert_frame_equal(stored[SERIES_KEYS + FEATURES], expected[SERIES_KEYS + FEATURES],
+                                  check_dtype=False)
+    print(f"{'':>34} store matches a full recompute ({len(stored):,} rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Per-request latency of the /predict-price forecast loop.
+
+Compares the original per-day DataFrame + per-tree predict loop against
+utils.price_forecast.forecast_prices (on the sklearn forest and on the
+CompiledForest arrays) for 7, 14 and 30 day horizons, and checks that all of
+them produce identical responses.
+
+Usage:
+    cd backend
+    python -m benchmarks.forecast_latency
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import make_synthetic_model, time_call
+from utils.compiled_forest import CompiledForest
+from utils.price_forecast import FEATURE_NAMES, forecast_prices
+
+HORIZONS = [7, 14, 30]
+ENCODED = (12, 140, 401, 77, 95, 3)
+HISTORY = [2310.0, 2295.5, 2280.0, 2301.25, 2275.0, 2260.0, 2290.0]
+
+
+def legacy_forecast(model, encoded, prices, forecast_days, today):
+    """The loop predict_price used before the vectorized engine."""
+    state_enc, dist_enc, mkt_enc, comm_enc, var_enc, grade_enc = encoded
+    current_lag = prices[0]
+    current_ma = sum(prices) / len(prices)
+    history_buffer = [p for p in prices]
+    results = []
+
+    for i in range(forecast_days):
+        target_date = today + timedelta(days=i+1)
+        is_weekend = 1 if target_date.weekday() >= 5 else 0
+
+        features_df = pd.DataFrame([[
+            state_enc, dist_enc, mkt_enc,
+            comm_enc, var_enc, grade_enc,
+            current_ma, current_lag, is_weekend
+        ]], columns=FEATURE_NAMES)
+
+        pred_price = model.predict(features_df)[0]
+
+        try:
+            tree_preds = np.array([tree.predict(features_df)[0] for tree in model.estimators_])
+            std_dev = float(np.std(tree_preds))
+            confidence_interval = {
+                "lower": round(max(0, pred_price - 1.96 * std_dev), 2),
+                "upper": round(pred_price + 1.96 * std_dev, 2),
+                "std_dev": round(std_dev, 2),
+            }
+        except Exception:
+            confidence_interval = None
+
+        results.append({
+            "date": target_date.strftime("%Y-%m-%d"),
+            "predicted_price": round(pred_price, 2),
+            "confidence_interval": confidence_interval,
+        })
+
+        current_lag = pred_price
+        history_buffer.insert(0, pred_price)
+        history_buffer.pop()
+        current_ma = sum(history_buffer) / len(history_buffer)
+
+    return results
+
+
+def main():
+    import warnings
+    warnings.filterwarnings('ignore')
+
+    print("Training synthetic 100-tree forest...")
+    model = make_synthetic_model(n_estimators=100)
+    # Single-threaded so model.predict sums trees in a fixed order
+    model.set_params(n_jobs=1)
+    today = datetime(2024, 1, 1)
+
+    compiled = CompiledForest.from_sklearn(model)
+    print(f"Compiled forest: {compiled.nbytes / 1e6:.1f} MB of node arrays, max depth {compiled.max_depth}")
+
+    print(f"\n{'horizon':>8} {'legacy p50':>12} {'sklearn p50':>12} {'compiled p50':>13} {'speedup':>8}  parity")
+    for days in HORIZONS:
+        for history in (HISTORY, HISTORY[:3]):
+            expected = legacy_forecast(model, ENCODED, history, days, today)
+            actual = forecast_prices(model, [ENCODED], [history], days, start_date=today)[0]
+            assert actual == expected, f"Forecast mismatch for {days}-day horizon"
+            actual = forecast_prices(compiled, [ENCODED], [history], days, start_date=today)[0]
+            assert actual == expected, f"Compiled forecast mismatch for {days}-day horizon"
+
+        legacy = time_call(lambda: legacy_forecast(model, ENCODED, HISTORY, days, today), repeat=5)
+        engine = time_call(lambda: forecast_prices(model, [ENCODED], [HISTORY], days, start_date=today))
+        fast = time_call(lambda: forecast_prices(compiled, [ENCODED], [HISTORY], days, start_date=today))
+        speedup = legacy["p50_ms"] / fast["p50_ms"]
+        print(f"{days:>8} {legacy['p50_ms']:>10.1f}ms {engine['p50_ms']:>10.1f}ms "
+              f"{fast['p50_ms']:>11.1f}ms {speedup:>7.1f}x  OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Local stand-in for the data.gov.in mandi price resource.
+
+FixtureServer serves records (recorded with fetch_market_prices.py --record,
+or made up by make_records) with the same query parameters and response shape
+as api.data.gov.in, from a background thread. Failures, Retry-After headers
+and per-request latency can be injected so the fetcher's retry and
+concurrency behaviour can be exercised without the network.
+"""
+import glob
+import json
+import os
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+
+def make_records(n: int, days: int = 30, seed: int = 42, end: Optional[date] = None) -> List[Dict]:
+    """n records shaped like the feed (string prices, DD/MM/YYYY dates), newest first."""
+    rng = np.random.default_rng(seed)
+    end = end or date.today()
+    records = []
+    for i in range(n):
+        day = end - timedelta(days=i * days // max(n, 1))
+        s, m, c = int(rng.integers(1, 20)), int(rng.integers(1, 6)), int(rng.integers(1, 20))
+        price = int(500 + c * 40 + rng.integers(0, 300))
+        records.append({
+            "state": f"State{s}", "district": f"District{s}_{m}", "market": f"Market{s}_{m} APMC",
+            "commodity": f"Commodity{c}", "variety": f"Variety{i % 3}", "grade": "FAQ",
+            "arrival_date": day.strftime("%d/%m/%Y"),
+            "min_price": str(price - 100), "max_price": str(price + 100), "modal_price": str(price),
+        })
+    return records
+
+
+def load_recorded_records(record_dir: str) -> List[Dict]:
+    """Concatenate page-<offset>.json files written by fetch_market_prices.py --record, in offset order."""
+    paths = glob.glob(os.path.join(record_dir, "page-*.json"))
+    records: List[Dict] = []
+    for path in sorted(paths, key=lambda p: int(os.path.basename(p)[5:-5])):
+        with open(path) as f:
+            records.extend(json.load(f)["records"])
+    return records
+
+
+class FixtureServer:
+    """Serves records[offset:offset + limit] at http://127.0.0.1:<port>/resource.
+
+    filters[<field>]=<value> query parameters select matching records first,
+    as data.gov.in does.
+    failures maps an offset to the statuses its first requests get before the
+    real page, e.g. {2000: [503, 429]}; "drop" closes the connection instead.
+    retry_after, when set, is sent with 429 and 503 responses.
+    """
+
+    def __init__(self, records: List[Dict], latency: float = 0.0,
+                 failures: Optional[Dict[int, List]] = None, retry_after: Optional[float] = None):
+        self.records = records
+        self.latency = latency
+        self.failures = {offset: list(statuses) for offset, statuses in (failures or {}).items()}
+        self.retry_after = retry_after
+        self.requests: List[tuple] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/resource"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _respond(self, offset: int, limit: int, filters: Dict[str, str]):
+        """(status, body) for one request, consuming an injected failure if one is queued."""
+        with self._lock:
+            queued = self.failures.get(offset)
+            status = queued.pop(0) if queued else 200
+            self.requests.append((offset, status))
+        if status != 200:
+            return status, None
+        records = self.records
+        if filters:
+            records = [r for r in records if all(r.get(k) == v for k, v in filters.items())]
+        page = records[offset:offset + limit]
+        return 200, {"total": len(records), "count": len(page), "limit": str(limit),
+                     "offset": str(offset), "records": page}
+
+    def _handler(self):
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                offset = int(query.get("offset", ["0"])[0])
+                limit = int(query.get("limit", ["10"])[0])
+                filters = {k[8:-1]: v[0] for k, v in query.items() if k.startswith("filters[")}
+                with fixture._lock:
+                    fixture.in_flight += 1
+                    fixture.max_in_flight = max(fixture.max_in_flight, fixture.in_flight)
+                try:
+                    if fixture.latency:
+                        time.sleep(fixture.latency)
+                    status, body = fixture._respond(offset, limit, filters)
+                    if status == "drop":
+                        self.close_connection = True
+                        self.connection.close()
+                        return
+                    payload = json.dumps(body or {"error": "fixture failure"}).encode()
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    if status in (429, 503) and fixture.retry_after is not None:
+                        self.send_header("Retry-After", str(fixture.retry_after))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                finally:
+                    with fixture._lock:
+                        fixture.in_flight -= 1
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,77 @@
+"""/mandi-prices: in-memory RealDictCursor result vs the streamed server-side cursor.
+
+Reads pages of the given sizes from market_prices in the benchmark database
+(BENCH_DB_NAME, default SmartAgriBench; seed it with benchmarks.fallback_cascade
+or benchmarks.price_trends) and reports wall time and peak Python memory
+(tracemalloc, in a separate run) for building the whole response body each way.
+
+Usage:
+    cd backend
+    python -m benchmarks.mandi_prices
+    python -m benchmarks.mandi_prices --limits 1000 100000 --state State3
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from fastapi.encoders import jsonable_encoder
+from psycopg2.extras import RealDictCursor
+
+from benchmarks.common import use_bench_database
+from utils.db import get_market_db_connection
+from utils.entity_dictionary import EntityDictionary
+from utils.mandi_stream import stream_rows
+from utils.market_history import MANDI_COLUMNS, mandi_prices_query
+
+
+def in_memory(entities, state, limit):
+    """The endpoint before streaming: fetchall into dicts, then one JSON document."""
+    conn = get_market_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur.execute(*mandi_prices_query(entities, state, None, limit))
+    body = json.dumps(jsonable_encoder(cur.fetchall()))
+    cur.close()
+    conn.close()
+    return len(body)
+
+
+def streamed(entities, state, limit):
+    conn = get_market_db_connection()
+    query, params = mandi_prices_query(entities, state, None, limit)
+    return sum(len(chunk) for chunk in stream_rows(conn, query, params, MANDI_COLUMNS))
+
+
+def measure(func, *args):
+    """(body bytes, seconds, peak bytes); tracemalloc slows Python down, so it gets a run of its own."""
+    started = time.perf_counter()
+    size = func(*args)
+    seconds = time.perf_counter() - started
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limits", type=int, nargs="+", default=[100, 10000, 100000])
+    parser.add_argument("--state", help="Filter on a state, e.g. State3")
+    args = parser.parse_args()
+
+    use_bench_database()
+    conn = get_market_db_connection()
+    entities = EntityDictionary.build(conn)
+    conn.close()
+
+    print(f"{'limit':>8} {'body MB':>8} {'in-memory s':>12} {'peak MB':>8} {'streamed s':>11} {'peak MB':>8}")
+    for limit in args.limits:
+        size, memory_s, memory_peak = measure(in_memory, entities, args.state, limit)
+        streamed_size, stream_s, stream_peak = measure(streamed, entities, args.state, limit)
+        print(f"{limit:>8} {size / 1e6:>8.1f} {memory_s:>12.2f} {memory_peak / 1e6:>8.1f} "
+              f"{stream_s:>11.2f} {stream_peak / 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Transfer size and time of a month of market_prices: JSON vs Arrow IPC vs Parquet.
+
+Encodes the same rows (the last --days days in the benchmark database,
+BENCH_DB_NAME, default SmartAgriBench; seed it with benchmarks.price_trends)
+the way /mandi-prices does (streamed JSON array) and the way
+/market-prices/export does, then decodes each the way a client would
+(json.loads, pyarrow.ipc, pyarrow.parquet). Gzipped JSON size is shown for
+reference, since that is what a compressing proxy would send.
+
+Usage:
+    cd backend
+    python -m benchmarks.market_export
+    python -m benchmarks.market_export --days 7 --state State3
+"""
+import argparse
+import io
+import json
+import time
+import zlib
+from datetime import date, timedelta
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from benchmarks.common import use_bench_database
+from utils.db import get_market_db_connection
+from utils.entity_dictionary import EntityDictionary
+from utils.mandi_stream import stream_rows
+from utils.market_export import NAME_COLUMNS, PRICE_COLUMNS, export_filters, stream_export
+
+DECODERS = {
+    "json": lambda body: len(json.loads(body)),
+    "arrow": lambda body: pa.ipc.open_stream(body).read_all().num_rows,
+    "parquet": lambda body: pq.read_table(io.BytesIO(body)).num_rows,
+}
+
+
+def encode(fmt, where, params):
+    conn = get_market_db_connection()
+    if fmt == "json":
+        columns = ['id'] + NAME_COLUMNS + ['arrival_date'] + PRICE_COLUMNS
+        query = f"SELECT {', '.join(columns)} FROM market_prices WHERE {where} ORDER BY arrival_date, id"
+        return "".join(stream_rows(conn, query, params, columns)).encode()
+    return b"".join(stream_export(conn, where, params, fmt))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--state")
+    parser.add_argument("--commodity")
+    args = parser.parse_args()
+
+    use_bench_database()
+    conn = get_market_db_connection()
+    entities = EntityDictionary.build(conn)
+    conn.close()
+    end = date.today()
+    where, params = export_filters(entities, end - timedelta(days=args.days - 1), end, args.state, args.commodity)
+
+    print(f"{'format':>8} {'rows':>10} {'MB':>8} {'gzip MB':>8} {'encode s':>9} {'decode s':>9}")
+    for fmt, decode in DECODERS.items():
+        started = time.perf_counter()
+        body = encode(fmt, where, params)
+        encode_s = time.perf_counter() - started
+        started = time.perf_counter()
+        rows = decode(body)
+        decode_s = time.perf_counter() - started
+        gzipped = f"{len(zlib.compress(body, 6)) / 1e6:>8.1f}" if fmt == "json" else f"{'-':>8}"
+        print(f"{fmt:>8} {rows:>10,} {len(body) / 1e6:>8.1f} {gzipped} {encode_s:>9.2f} {decode_s:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
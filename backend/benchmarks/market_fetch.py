@@ -0,0 +1,96 @@
+"""Wall clock of a full mandi price sync: sequential requests loop vs fetch_pages.
+
+Both fetchers page through the same records served by the local fixture
+server with a fixed per-request latency (real data.gov.in pages take a few
+hundred ms). The sequential loop is fetch_and_process as it was -- one
+requests.get per page and a 0.5 s sleep between pages -- and stops at its
+first error. Pages are handed to a no-op writer so only fetching is timed;
+pass --db to insert into the benchmark database instead.
+
+Usage:
+    cd backend
+    python -m benchmarks.market_fetch
+    python -m benchmarks.market_fetch --pages 100 --latency 0.3 --failure-rate 0.05
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+import requests
+
+from benchmarks.common import use_bench_database
+from benchmarks.mandi_fixture import FixtureServer, make_records
+from utils.market_fetch import fetch_pages
+
+PAGE_SIZE = 1000
+
+
+def legacy_fetch(url, on_page, limit=PAGE_SIZE, sleep=0.5):
+    """The fetch loop of fetch_and_process before fetch_pages."""
+    offset, pages = 0, 0
+    while True:
+        try:
+            resp = requests.get(url, params={"api-key": "bench", "format": "json", "limit": limit, "offset": offset})
+            resp.raise_for_status()
+            records = resp.json().get('records', [])
+            if not records:
+                break
+            on_page(offset, records)
+            pages += 1
+            if len(records) < limit:
+                break
+            offset += limit
+            time.sleep(sleep)
+        except Exception as e:
+            print(f"  legacy loop stopped at offset {offset}: {e}")
+            break
+    return pages
+
+
+def _failures(n_pages, rate, seed=0):
+    rng = np.random.default_rng(seed)
+    return {p * PAGE_SIZE: [503] for p in range(n_pages) if rng.random() < rate}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.25, help="Seconds per request at the fixture server")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of pages answered 503 once")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--max-rps", type=float, default=0, help="fetch_pages rate limit (0 = none)")
+    parser.add_argument("--skip-legacy", action="store_true")
+    parser.add_argument("--db", action="store_true", help="Insert pages into the benchmark database")
+    args = parser.parse_args()
+
+    records = make_records(args.pages * PAGE_SIZE)
+    writer = lambda offset, page: len(page)  # noqa: E731
+    if args.db:
+        use_bench_database()
+        import fetch_market_prices
+
+        conn = fetch_market_prices.get_db_connection()
+        fetch_market_prices.create_table_if_not_exists(conn)
+        writer = lambda offset, page: fetch_market_prices.insert_market_data(conn, page)  # noqa: E731
+
+    print(f"{args.pages} pages of {PAGE_SIZE} records, {args.latency * 1000:.0f} ms per request, "
+          f"{args.failure_rate:.0%} of pages fail once")
+    print(f"{'fetcher':<24} {'seconds':>8} {'pages':>6} {'retries':>8} {'failed':>7}")
+    if not args.skip_legacy:
+        with FixtureServer(records, args.latency, _failures(args.pages, args.failure_rate)) as server:
+            started = time.perf_counter()
+            pages = legacy_fetch(server.url, writer)
+            print(f"{'sequential + 0.5s sleep':<24} {time.perf_counter() - started:>8.2f} {pages:>6} {0:>8} {'-':>7}")
+
+    for concurrency in args.concurrency:
+        with FixtureServer(records, args.latency, _failures(args.pages, args.failure_rate)) as server:
+            stats = asyncio.run(fetch_pages(server.url, {"api-key": "bench", "format": "json"}, writer,
+                                            limit=PAGE_SIZE, concurrency=concurrency, max_rps=args.max_rps,
+                                            backoff_base=0.1))
+        print(f"{f'fetch_pages x{concurrency}':<24} {stats['seconds']:>8.2f} {stats['pages']:>6} "
+              f"{stats['retries']:>8} {len(stats['failed_offsets']):>7}")
+
+
+if __name__ == "__main__":
+    main()
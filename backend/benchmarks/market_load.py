@@ -0,0 +1,129 @@
+"""Rows/sec of the market_prices loaders: execute_values vs COPY + staging merge.
+
+Loads the same synthetic data.gov.in records page by page (one transaction
+per page, as the sync does) into a freshly created market_prices table in
+BENCH_DB_NAME (default SmartAgriBench; the table is recreated), then loads
+them a second time, which is what the overlap days of every incremental
+sync look like. Loaders:
+  values_nothing  per-record strptime + execute_values ... DO NOTHING (the original insert_market_data)
+  values_upsert   per-record strptime + execute_values ... DO UPDATE (the upsert before COPY)
+  copy_merge      parse_market_frame + load_market_frame
+
+Usage:
+    cd backend
+    python -m benchmarks.market_load
+    python -m benchmarks.market_load --records 500000 --page-size 5000
+"""
+import argparse
+import os
+import time
+from datetime import datetime
+
+import psycopg2
+from psycopg2 import extras
+
+from benchmarks.common import use_bench_database
+from benchmarks.mandi_fixture import make_records
+from utils.market_loader import load_market_frame, parse_market_frame
+
+KEY = "(state, district, market, commodity, variety, arrival_date)"
+INSERT = """
+INSERT INTO market_prices
+(state, district, market, commodity, variety, grade, arrival_date, min_price, max_price, modal_price)
+VALUES %s
+"""
+UPSERT = INSERT + f"""
+ON CONFLICT {KEY} DO UPDATE
+SET grade = EXCLUDED.grade, min_price = EXCLUDED.min_price,
+    max_price = EXCLUDED.max_price, modal_price = EXCLUDED.modal_price
+WHERE (market_prices.grade, market_prices.min_price, market_prices.max_price, market_prices.modal_price)
+      IS DISTINCT FROM (EXCLUDED.grade, EXCLUDED.min_price, EXCLUDED.max_price, EXCLUDED.modal_price)
+"""
+
+
+def legacy_rows(records, dedupe=False):
+    """Row tuples as insert_market_data built them, one strptime per record."""
+    rows = {} if dedupe else []
+    for rec in records:
+        try:
+            dt = datetime.strptime(rec.get('arrival_date', ''), "%d/%m/%Y").date()
+        except ValueError:
+            continue
+        row = (rec.get('state'), rec.get('district'), rec.get('market'), rec.get('commodity'),
+               rec.get('variety'), rec.get('grade'), dt,
+               rec.get('min_price'), rec.get('max_price'), rec.get('modal_price'))
+        if dedupe:
+            rows[row[:5] + (dt,)] = row
+        else:
+            rows.append(row)
+    return list(rows.values()) if dedupe else rows
+
+
+def values_nothing(cur, records):
+    extras.execute_values(cur, INSERT + f"ON CONFLICT {KEY} DO NOTHING", legacy_rows(records))
+
+
+def values_upsert(cur, records):
+    rows = legacy_rows(records, dedupe=True)
+    extras.execute_values(cur, UPSERT, rows, page_size=len(rows))
+
+
+def copy_merge(cur, records):
+    load_market_frame(cur, parse_market_frame(records))
+
+
+LOADERS = {"values_nothing": values_nothing, "values_upsert": values_upsert, "copy_merge": copy_merge}
+
+
+def recreate_table(conn):
+    from fetch_market_prices import create_table_if_not_exists
+
+    with conn.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS market_prices")
+    conn.commit()
+    create_table_if_not_exists(conn)
+
+
+def load_pages(conn, loader, pages):
+    started = time.perf_counter()
+    for page in pages:
+        with conn:
+            with conn.cursor() as cur:
+                loader(cur, page)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--loader", choices=sorted(LOADERS), nargs="+", default=list(LOADERS))
+    args = parser.parse_args()
+
+    records = make_records(args.records, days=365)
+    pages = [records[i:i + args.page_size] for i in range(0, len(records), args.page_size)]
+    use_bench_database()
+    conn = psycopg2.connect(
+        dbname=os.environ["DB_NAME"],
+        user=os.getenv("DB_USER", "postgres"),
+        password=os.getenv("DB_PASS", "password"),
+        host=os.getenv("DB_HOST", "localhost"),
+        port=os.getenv("DB_PORT", "5432"),
+    )
+
+    print(f"{len(records)} records in pages of {args.page_size}")
+    print(f"{'loader':<16} {'first load rows/s':>18} {'reload rows/s':>14} {'rows':>8}")
+    for name in args.loader:
+        recreate_table(conn)
+        first = load_pages(conn, LOADERS[name], pages)
+        second = load_pages(conn, LOADERS[name], pages)
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*) FROM market_prices")
+            rows = cur.fetchone()[0]
+        conn.commit()
+        print(f"{name:<16} {len(records) / first:>18,.0f} {len(records) / second:>14,.0f} {rows:>8}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
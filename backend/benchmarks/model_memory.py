@@ -0,0 +1,116 @@
+"""Startup time and memory of N worker processes serving the price model.
+
+Each mode starts --workers spawned processes that load the model the way an
+API worker would, answer one forecast and then report their load time, first
+prediction latency, RSS and PSS while all of them are still alive:
+
+    pickle  joblib.load(price_model.pkl), the original per-worker sklearn copy
+    npz     CompiledForest from price_forest.npz, a private copy per worker
+    mmap    CompiledForest from the price_forest/ directory, memory-mapped
+
+PSS charges shared pages proportionally, so the PSS total is what the
+workers really cost together; RSS counts shared pages once per worker.
+
+Usage:
+    cd backend
+    python -m benchmarks.model_memory                       # synthetic 100-tree model
+    python -m benchmarks.model_memory --model price_model.pkl --workers 8
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from datetime import datetime
+
+import joblib
+
+from benchmarks.common import make_synthetic_model
+from utils.compiled_forest import CompiledForest, export_forest
+from utils.model_artifacts import process_memory
+from utils.price_forecast import forecast_prices
+
+MODES = ["pickle", "npz", "mmap"]
+
+
+def _worker(mode, paths, barrier, results):
+    started = time.perf_counter()
+    before = process_memory()["rss_mb"] or 0.0
+    if mode == "pickle":
+        model = joblib.load(paths["pickle"])
+        model.set_params(n_jobs=1)
+    else:
+        model = CompiledForest.load(paths[mode])
+    load_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    forecast_prices(model, [(1, 2, 3, 4, 5, 0)], [[2300.0, 2290.0, 2310.0]], 7, start_date=datetime(2024, 1, 1))
+    first_ms = (time.perf_counter() - started) * 1000
+
+    # Fault in every node so the comparison does not depend on which paths one forecast visits
+    if isinstance(model, CompiledForest):
+        for name in ("feature", "threshold", "left", "right", "value"):
+            getattr(model, name).sum()
+
+    barrier.wait()
+    memory = process_memory()
+    results.put({
+        "load_s": load_seconds,
+        "first_ms": first_ms,
+        "model_mb": (memory["rss_mb"] or 0.0) - before,
+        **memory,
+    })
+    barrier.wait()
+
+
+def run_mode(mode, paths, workers):
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(mode, paths, barrier, results)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    rows = [results.get() for _ in range(workers)]
+    for p in procs:
+        p.join()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="Fitted price_model.pkl (default: synthetic 100-tree forest)")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {
+            "pickle": args.model or os.path.join(tmp, "price_model.pkl"),
+            "npz": os.path.join(tmp, "price_forest.npz"),
+            "mmap": os.path.join(tmp, "price_forest"),
+        }
+        if args.model:
+            sk_model = joblib.load(args.model)
+        else:
+            print("Training synthetic 100-tree model...")
+            sk_model = make_synthetic_model(n_estimators=100)
+            joblib.dump(sk_model, paths["pickle"])
+        forest = export_forest(sk_model, paths["mmap"])
+        forest.save(paths["npz"])
+        del sk_model
+        print(f"Forest: {forest.n_trees} trees, {forest.nbytes / 1e6:.1f} MB of node arrays, "
+              f"pickle {os.path.getsize(paths['pickle']) / 1e6:.1f} MB\n")
+
+        print(f"{'mode':>7} {'load p50':>9} {'first fcst':>11} {'model MB/wkr':>13} "
+              f"{'RSS/wkr':>8} {'PSS/wkr':>8} {f'PSS x{args.workers}':>9}")
+        for mode in MODES:
+            rows = sorted(run_mode(mode, paths, args.workers), key=lambda r: r["load_s"])
+            mid = rows[len(rows) // 2]
+            pss_total = sum(r["pss_mb"] or 0.0 for r in rows)
+            print(f"{mode:>7} {mid['load_s'] * 1000:>7.0f}ms {mid['first_ms']:>9.1f}ms "
+                  f"{sum(r['model_mb'] for r in rows) / len(rows):>13.1f} "
+                  f"{sum(r['rss_mb'] or 0.0 for r in rows) / len(rows):>8.1f} "
+                  f"{pss_total / len(rows):>8.1f} {pss_total:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
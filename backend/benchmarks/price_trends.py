@@ -0,0 +1,75 @@
+"""/market-prices/trends: daily aggregates over raw market_prices rows vs the daily rollup.
+
+Seeds market_prices (and its rollup) in the benchmark database
+(BENCH_DB_NAME, default SmartAgriBench), checks that both queries return
+the same days and prices, and times them for a state and a district trend.
+
+Usage:
+    cd backend
+    python -m benchmarks.price_trends            # seed 3.6M rows, then benchmark
+    python -m benchmarks.price_trends --no-seed  # reuse the existing tables
+"""
+import argparse
+
+from benchmarks.common import seed_market_prices, time_call, use_bench_database
+from utils.db import get_market_db_connection
+from utils.entity_dictionary import EntityDictionary
+from utils.market_history import price_trend_query
+
+# The query get_price_trends ran before the rollup
+RAW_TREND_QUERY = """
+    SELECT arrival_date, AVG(modal_price) as avg_price,
+           MIN(min_price) as min_price, MAX(max_price) as max_price
+    FROM market_prices
+    WHERE commodity = %s AND state = %s{district}
+      AND arrival_date >= CURRENT_DATE - %s * INTERVAL '1 day'
+    GROUP BY arrival_date
+    ORDER BY arrival_date ASC
+"""
+
+SCENARIOS = [
+    ("state", "Commodity7", "State3", None),
+    ("district", "Commodity7", "State3", "District3_4"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--no-seed", action="store_true", help="Reuse the existing benchmark tables")
+    parser.add_argument("--days", type=int, default=90, help="Trend window, and days of history when seeding")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    use_bench_database()
+    conn = get_market_db_connection()
+    if not args.no_seed:
+        print("Seeding market_prices...")
+        print(f"Seeded {seed_market_prices(conn, days=args.days):,} rows")
+    entities = EntityDictionary.build(conn)
+
+    print(f"\n{'trend':>9} {'days':>5} {'raw rows':>9} {'raw p50':>9} {'rollup rows':>12} {'rollup p50':>11}")
+    with conn.cursor() as cur:
+        for name, commodity, state, district in SCENARIOS:
+            raw_query = RAW_TREND_QUERY.format(district=" AND district = %s" if district else "")
+            raw_params = [commodity, state] + ([district] if district else []) + [args.days]
+            query, params = price_trend_query(entities, commodity, state, district, args.days)
+
+            cur.execute(raw_query, raw_params)
+            raw = cur.fetchall()
+            cur.execute(query, params)
+            assert cur.fetchall() == raw, f"Rollup trend differs for {name}"
+            counts = []
+            for table in ("market_prices", "market_price_daily_rollup"):
+                where = raw_query.split("WHERE")[1].split("GROUP BY")[0]
+                cur.execute(f"SELECT count(*) FROM {table} WHERE {where}", raw_params)
+                counts.append(cur.fetchone()[0])
+
+            raw_ms = time_call(lambda: (cur.execute(raw_query, raw_params), cur.fetchall()), repeat=args.repeat)
+            rollup_ms = time_call(lambda: (cur.execute(query, params), cur.fetchall()), repeat=args.repeat)
+            print(f"{name:>9} {len(raw):>5} {counts[0]:>9,} {raw_ms['p50_ms']:>7.1f}ms "
+                  f"{counts[1]:>12,} {rollup_ms['p50_ms']:>9.1f}ms")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
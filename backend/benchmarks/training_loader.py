@@ -0,0 +1,108 @@
+"""Peak RSS and wall clock of the training-data loader.
+
+Runs the original pd.read_sql("SELECT * ...") loader and the streaming
+server-side-cursor loader from train_model.py in fresh processes against a
+seeded market_prices table (BENCH_DB_NAME, default SmartAgriBench), then
+optionally checks that preprocess_data produces identical features from both.
+
+Usage:
+    cd backend
+    python -m benchmarks.training_loader                 # seed 2M rows, then benchmark
+    python -m benchmarks.training_loader --no-seed --check
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.common import seed_market_prices, use_bench_database
+
+
+def legacy_load_data():
+    """The loader train_model.py used before streaming."""
+    import train_model
+
+    conn = train_model.get_db_connection()
+    df = pd.read_sql("SELECT * FROM market_prices ORDER BY arrival_date ASC", conn)
+    conn.close()
+    return df
+
+
+def streaming_load_data():
+    import train_model
+
+    return train_model.load_data()
+
+
+LOADERS = {"read_sql": legacy_load_data, "streaming": streaming_load_data}
+
+
+def _measure(name, results):
+    use_bench_database()
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    started = time.perf_counter()
+    df = LOADERS[name]()
+    seconds = time.perf_counter() - started
+    results.put({
+        "loader": name,
+        "rows": len(df),
+        "seconds": seconds,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "baseline_mb": baseline,
+        "frame_mb": df.memory_usage(deep=True).sum() / 1e6,
+    })
+
+
+def check_features():
+    import train_model
+
+    # preprocess_data writes encoders.pkl to the working directory; keep the real one untouched
+    os.chdir(tempfile.mkdtemp())
+    features = [
+        'state_encoded', 'district_encoded', 'market_encoded', 'commodity_encoded', 'variety_encoded',
+        'grade_encoded', 'moving_avg_7d', 'price_lag_1d', 'is_weekend', 'modal_price',
+    ]
+    legacy, _ = train_model.preprocess_data(legacy_load_data())
+    streamed, _ = train_model.preprocess_data(train_model.load_data())
+    pd.testing.assert_frame_equal(
+        legacy[features].reset_index(drop=True), streamed[features].reset_index(drop=True), check_dtype=False
+    )
+    print(f"preprocess_data output identical for both loaders ({len(legacy):,} rows)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--no-seed", action="store_true", help="Reuse the existing benchmark table")
+    parser.add_argument("--days", type=int, default=50, help="Days of history per series when seeding")
+    parser.add_argument("--check", action="store_true", help="Compare preprocess_data output (slow on big tables)")
+    args = parser.parse_args()
+
+    use_bench_database()
+    if not args.no_seed:
+        import train_model
+
+        conn = train_model.get_db_connection()
+        print(f"Seeded {seed_market_prices(conn, days=args.days):,} rows")
+        conn.close()
+
+    ctx = multiprocessing.get_context("spawn")
+    print(f"\n{'loader':>10} {'rows':>10} {'seconds':>8} {'peak RSS':>9} {'loader RSS':>11} {'frame MB':>9}")
+    for name in LOADERS:
+        results = ctx.Queue()
+        proc = ctx.Process(target=_measure, args=(name, results))
+        proc.start()
+        r = results.get()
+        proc.join()
+        print(f"{r['loader']:>10} {r['rows']:>10,} {r['seconds']:>8.1f} {r['peak_rss_mb']:>7.0f}MB "
+              f"{r['peak_rss_mb'] - r['baseline_mb']:>9.0f}MB {r['frame_mb']:>9.1f}")
+
+    if args.check:
+        check_features()
+
+
+if __name__ == "__main__":
+    main()
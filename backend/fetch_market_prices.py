@@ -1,17 +1,32 @@
+import argparse
+import asyncio
+import json
 import requests
 import psycopg2
 from psycopg2 import extras
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
-import time
+
+from utils import market_rollup, market_schema
+from utils.market_fetch import fetch_pages
+from utils.market_loader import load_market_frame, parse_market_frame
 
 # Load environment variables
 load_dotenv()
 
 API_KEY = os.getenv("API_KEY", "579b464db66ec23bdd000001df45da81e3134987623cf97c024f6d86")
 RESOURCE_ID = "9ef84268-d588-465a-a308-a864a43d0070"
-BASE_URL = f"https://api.data.gov.in/resource/{RESOURCE_ID}"
+BASE_URL = os.getenv("MARKET_API_BASE_URL", f"https://api.data.gov.in/resource/{RESOURCE_ID}")
+PAGE_SIZE = int(os.getenv("MARKET_FETCH_PAGE_SIZE", "1000"))
+# Pages waiting for the writer are loaded together, up to this many records per COPY and merge
+LOAD_BATCH_ROWS = int(os.getenv("MARKET_LOAD_BATCH_ROWS", "10000"))
+# Incremental syncs re-fetch this many days before the watermark for late and revised records
+SYNC_OVERLAP_DAYS = int(os.getenv("MARKET_SYNC_OVERLAP_DAYS", "2"))
+
+# Running API to notify after new rows land (optional)
+API_BASE_URL = os.getenv("API_BASE_URL")
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
 
 # Database config
 DB_NAME = os.getenv("DB_NAME", "SmartAgriDB")
@@ -69,26 +84,37 @@ def get_db_connection():
         return None
 
 def create_table_if_not_exists(conn):
+    """Create market_prices (partitioned, see utils/market_schema.py), its daily
+    rollup (utils/market_rollup.py) and the sync state table.
+
+    Existing data is kept; an existing table just gets its upcoming monthly
+    partitions and any missing indexes, and a missing rollup is built from it.
+    """
     query = """
-    CREATE TABLE IF NOT EXISTS market_prices (
-        id SERIAL PRIMARY KEY,
-        state TEXT,
-        district TEXT,
-        market TEXT,
-        commodity TEXT,
-        variety TEXT,
-        grade TEXT,
-        arrival_date DATE,
-        min_price NUMERIC,
-        max_price NUMERIC,
-        modal_price NUMERIC,
-        UNIQUE(state, district, market, commodity, variety, arrival_date)
+    CREATE TABLE IF NOT EXISTS market_sync_state (
+        resource_id TEXT PRIMARY KEY,
+        watermark DATE,
+        full_run BOOLEAN NOT NULL DEFAULT FALSE,
+        run_date DATE,
+        next_offset INTEGER,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
     );
     """
     try:
         with conn.cursor() as cur:
-            # Drop table to ensure clean schema (development mode helper)
-            cur.execute("DROP TABLE IF EXISTS market_prices")
+            kind = market_schema.table_kind(cur)
+            if kind is None:
+                market_schema.create_schema(cur)
+            elif kind == "plain":
+                print("market_prices is not partitioned yet; run: python -m utils.market_schema --migrate")
+            else:
+                today = datetime.now().date()
+                market_schema.ensure_partitions(
+                    cur, market_schema.months_between(today, market_schema.add_months(
+                        today, market_schema.MARKET_PARTITION_MONTHS_AHEAD)))
+                market_schema.create_indexes(cur)
+            if market_rollup.create_rollup(cur) and kind is not None:
+                print("Built market_price_daily_rollup from existing market_prices rows")
             cur.execute(query)
         conn.commit()
     except Exception as e:
@@ -97,56 +123,195 @@ def create_table_if_not_exists(conn):
 
 def insert_market_data(conn, records):
     """
-    Takes a list of record dictionaries from the API and inserts them into the market_prices table.
+    Takes a list of record dictionaries from the API and upserts them into the market_prices table.
+    Returns the number of rows inserted or changed.
     """
-    if not records:
-        return 0
-
-    rows_to_insert = []
-    
-    for rec in records:
-        date_str = rec.get('arrival_date', '')
-        try:
-            # Format is usually DD/MM/YYYY from data.gov.in
-            dt = datetime.strptime(date_str, "%d/%m/%Y").date()
-        except ValueError:
-            # Skip invalid dates
-            continue
-            
-        rows_to_insert.append((
-            rec.get('state'),
-            rec.get('district'),
-            rec.get('market'),
-            rec.get('commodity'),
-            rec.get('variety'),
-            rec.get('grade'),
-            dt,
-            rec.get('min_price'),
-            rec.get('max_price'),
-            rec.get('modal_price')
-        ))
-    
-    if not rows_to_insert:
+    rows_to_insert = parse_market_frame(records or [])
+    if rows_to_insert.empty:
         return 0
 
     try:
         with conn.cursor() as cur:
-            # We use ON CONFLICT DO NOTHING to avoid duplicate errors on re-runs
-            query = """
-            INSERT INTO market_prices 
-            (state, district, market, commodity, variety, grade, arrival_date, min_price, max_price, modal_price)
-            VALUES %s
-            ON CONFLICT (state, district, market, commodity, variety, arrival_date) DO NOTHING;
-            """
-            extras.execute_values(cur, query, rows_to_insert)
+            inserted, updated = load_market_frame(cur, rows_to_insert)
         conn.commit()
-        return len(rows_to_insert)
+        return inserted + updated
     except Exception as e:
         print(f"Error inserting data: {e}")
         conn.rollback()
         return 0
 
-def fetch_and_process():
+def load_sync_state(conn):
+    """The sync state row for this resource, or a fresh one before the first sync."""
+    with conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
+        cur.execute("SELECT * FROM market_sync_state WHERE resource_id = %s", (RESOURCE_ID,))
+        row = cur.fetchone()
+    conn.commit()
+    if row:
+        return dict(row)
+    return {"resource_id": RESOURCE_ID, "watermark": None, "full_run": False, "run_date": None, "next_offset": None}
+
+def save_sync_state(cur, state):
+    cur.execute("""
+        INSERT INTO market_sync_state (resource_id, watermark, full_run, run_date, next_offset, updated_at)
+        VALUES (%(resource_id)s, %(watermark)s, %(full_run)s, %(run_date)s, %(next_offset)s, now())
+        ON CONFLICT (resource_id) DO UPDATE
+        SET watermark = EXCLUDED.watermark, full_run = EXCLUDED.full_run, run_date = EXCLUDED.run_date,
+            next_offset = EXCLUDED.next_offset, updated_at = EXCLUDED.updated_at
+    """, state)
+
+def invalidate_forecast_cache(commodities):
+    """Ask the API to drop cached forecasts for commodities that received new rows."""
+    if not commodities:
+        return False
+    if not API_BASE_URL or not ADMIN_API_TOKEN:
+        print("API_BASE_URL/ADMIN_API_TOKEN not set. Skipping forecast cache invalidation.")
+        return False
+
+    try:
+        resp = requests.post(
+            f"{API_BASE_URL.rstrip('/')}/admin/forecast-cache/invalidate",
+            json={"commodities": sorted(commodities)},
+            headers={"X-Admin-Token": ADMIN_API_TOKEN},
+            timeout=10,
+        )
+        resp.raise_for_status()
+        print(f"Forecast cache invalidated. Removed: {resp.json().get('removed', 0)}")
+        return True
+    except Exception as e:
+        print(f"Warning: Could not invalidate forecast cache: {e}")
+        return False
+
+def _older_than(cutoff_date):
+    """stop_when check: the page's last record is older than cutoff_date.
+
+    This relies on the API returning data roughly newest first; pages are
+    still processed in full, and only offsets after such a page are skipped.
+    """
+    def check(records):
+        try:
+            return datetime.strptime(records[-1].get('arrival_date', ''), "%d/%m/%Y").date() < cutoff_date
+        except Exception:
+            return False
+    return check
+
+def plan_sync(state, today, full=False):
+    """[(arrival_date filter or None for the whole resource, start offset)] for this run.
+
+    An interrupted run is resumed where its checkpoint left off. Otherwise a
+    run is incremental, one filtered query per day from SYNC_OVERLAP_DAYS
+    before the watermark through today, unless there is no watermark yet or
+    full is set.
+    """
+    if not full and state["next_offset"] is not None:
+        if state["full_run"]:
+            return [(None, state["next_offset"])]
+        day = state["run_date"]
+        plan = [(day, state["next_offset"])]
+        while day < today:
+            day += timedelta(days=1)
+            plan.append((day, 0))
+        return plan
+    if full or state["watermark"] is None:
+        return [(None, 0)]
+    day = min(state["watermark"] - timedelta(days=SYNC_OVERLAP_DAYS), today)
+    plan = []
+    while day <= today:
+        plan.append((day, 0))
+        day += timedelta(days=1)
+    return plan
+
+def sync_pages(conn, state, run_date, start_offset, totals, record_dir=None):
+    """Fetch one paginated query, committing each batch of pages together with the resume checkpoint.
+
+    The checkpoint is the lowest offset not yet written, so pages finishing
+    out of order never let a resumed run skip one. Returns False when some
+    page still failed after its retries; the checkpoint then stays at or
+    before it for the next run.
+    """
+    params = {"api-key": API_KEY, "format": "json"}
+    stop_when = None
+    if run_date is None:
+        stop_when = _older_than((datetime.now() - timedelta(days=365*2)).date())
+    else:
+        params["filters[arrival_date]"] = run_date.strftime("%d/%m/%Y")
+    done = set()
+    progress = {"next": start_offset}
+
+    def write_batch(pages):
+        """Runs in the fetcher's writer thread: the pages waiting in its queue, as one COPY and merge."""
+        offsets = [offset for offset, _ in pages]
+        records = [rec for _, page in pages for rec in page]
+        if record_dir:
+            for offset, page in pages:
+                with open(os.path.join(record_dir, f"page-{offset}.json"), "w") as f:
+                    json.dump({"records": page}, f)
+        next_offset = progress["next"]
+        while next_offset in done or next_offset in offsets:
+            next_offset += PAGE_SIZE
+        with conn:
+            with conn.cursor() as cur:
+                inserted, updated = load_market_frame(cur, parse_market_frame(records))
+                save_sync_state(cur, dict(state, full_run=run_date is None, run_date=run_date,
+                                          next_offset=next_offset))
+        done.update(offsets)
+        progress["next"] = next_offset
+        totals["inserted"] += inserted
+        totals["updated"] += updated
+        if inserted or updated:
+            totals["commodities"].update(rec['commodity'] for rec in records if rec.get('commodity'))
+        print(f"Offsets {', '.join(map(str, sorted(offsets)))} processed. Inserted: {inserted}, updated: {updated}.")
+        return inserted + updated
+
+    with conn:
+        with conn.cursor() as cur:
+            save_sync_state(cur, dict(state, full_run=run_date is None, run_date=run_date, next_offset=start_offset))
+    stats = asyncio.run(fetch_pages(BASE_URL, params, limit=PAGE_SIZE, start_offset=start_offset,
+                                    stop_when=stop_when, on_batch=write_batch, batch_rows=LOAD_BATCH_ROWS))
+    print(f"Fetched {stats['pages']} pages ({stats['records']} records) in {stats['seconds']:.1f}s "
+          f"with {stats['requests']} requests, {stats['retries']} retried.")
+    if stats["failed_offsets"]:
+        print(f"Warning: offsets still failing after retries: {stats['failed_offsets']}. "
+              f"The next run resumes from offset {progress['next']}.")
+        return False
+    return True
+
+def sync_market_prices(conn, full=False, record_dir=None):
+    """Bring market_prices up to date and advance the watermark.
+
+    Returns {"inserted", "updated", "commodities", "complete"}; an incomplete
+    run leaves its checkpoint in market_sync_state to resume from.
+    """
+    state = load_sync_state(conn)
+    today = datetime.now().date()
+    plan = plan_sync(state, today, full)
+    if state["next_offset"] is not None and not full:
+        print(f"Resuming interrupted sync at {plan[0][0] or 'full resource'}, offset {plan[0][1]}.")
+    elif plan[0][0] is None:
+        print("No watermark yet (or --full): syncing the whole resource, up to two years back.")
+    else:
+        print(f"Incremental sync from {plan[0][0]} (watermark {state['watermark']}).")
+
+    totals = {"inserted": 0, "updated": 0, "commodities": set(), "complete": False}
+    for run_date, start_offset in plan:
+        print(f"Fetching {run_date or 'all dates'} from offset {start_offset}...")
+        day_dir = None
+        if record_dir:
+            day_dir = os.path.join(record_dir, run_date.isoformat()) if run_date else record_dir
+            os.makedirs(day_dir, exist_ok=True)
+        if not sync_pages(conn, state, run_date, start_offset, totals, day_dir):
+            return totals
+
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT max(arrival_date) FROM market_prices WHERE arrival_date <= %s", (today,))
+            newest = cur.fetchone()[0]
+            watermark = max(filter(None, [newest, state["watermark"]]), default=None)
+            save_sync_state(cur, dict(state, watermark=watermark, full_run=False, run_date=None, next_offset=None))
+    print(f"Sync complete. Inserted: {totals['inserted']}, updated: {totals['updated']}. Watermark: {watermark}")
+    totals["complete"] = True
+    return totals
+
+def fetch_and_process(full=False, record_dir=None):
     # Attempt to create DB first
     create_database_if_not_exists()
     
@@ -157,67 +322,22 @@ def fetch_and_process():
 
     create_table_if_not_exists(conn)
 
-    limit = 1000
-    offset = 0
-    cutoff_date = (datetime.now() - timedelta(days=365*2)).date()
-    
-    print(f"Fetching data from API since {cutoff_date}...")
-
-    more_data = True
-    total_inserted = 0
-    
-    while more_data:
-        print(f"Fetching offset {offset}...")
-        params = {
-            "api-key": API_KEY,
-            "format": "json",
-            "limit": limit,
-            "offset": offset
-        }
-        
-        try:
-            resp = requests.get(BASE_URL, params=params)
-            resp.raise_for_status()
-            data = resp.json()
-            
-            records = data.get('records', [])
-            if not records:
-                print("No more records returned by API.")
-                break
-            
-            # Check dates to stop if we go too far back (assuming roughly newer to older, 
-            # though API sort isn't guaranteed, we process all but stop if explicitly older block)
-            # Actually, without sort param, order is potentially random or insertion order. 
-            # We will process everything in the block.
-            
-            # Use our new function to insert
-            inserted_count = insert_market_data(conn, records)
-            total_inserted += inserted_count
-            print(f"Batch processed. Inserted: {inserted_count}. Total: {total_inserted}")
-
-            if len(records) < limit:
-                more_data = False
-            
-            # Simple check if the LAST record in this batch is super old to break early
-            # This relies on the API returning data somewhat chronologically descending
-            if records:
-                try:
-                    last_date = datetime.strptime(records[-1].get('arrival_date', ''), "%d/%m/%Y").date()
-                    if last_date < cutoff_date:
-                        print("Reached data older than cutoff. Stopping.")
-                        break
-                except Exception:
-                    pass
-
-            offset += limit
-            time.sleep(0.5)
-
-        except Exception as e:
-            print(f"Error during fetch/process: {e}")
-            break
+    totals = {"commodities": set()}
+    try:
+        totals = sync_market_prices(conn, full=full, record_dir=record_dir)
+    except Exception as e:
+        print(f"Error during fetch/process: {e}. The next run resumes from the last checkpoint.")
 
     conn.close()
+    invalidate_forecast_cache(totals["commodities"])
     print("Market price sync complete.")
 
 if __name__ == "__main__":
-    fetch_and_process()
+    parser = argparse.ArgumentParser(description="Sync mandi prices from data.gov.in into market_prices")
+    parser.add_argument("--full", action="store_true",
+                        help="Re-sync the whole resource (upserting) instead of the days since the watermark")
+    parser.add_argument("--record", metavar="DIR",
+                        help="Also save every fetched page as DIR[/<date>]/page-<offset>.json "
+                             "(fixtures for tests/benchmarks)")
+    args = parser.parse_args()
+    fetch_and_process(full=args.full, record_dir=args.record)
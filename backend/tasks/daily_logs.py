@@ -5,6 +5,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from ai_log_generator import generate_daily_log
+from utils.blocking_io import run_blocking
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
@@ -49,7 +50,7 @@ async def generate_daily_logs_for_all_users():
         return
     
     try:
-        users_response = supabase.table("profiles").select("id, name, phone_verified").eq("phone_verified", True).execute()
+        users_response = await run_blocking(supabase.table("profiles").select("id, name, phone_verified").eq("phone_verified", True).execute)
         
         if not users_response.data:
             logger.info("No verified users found")
@@ -0,0 +1,275 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import joblib
+from psycopg2 import extras
+
+from tasks.scheduler import update_job_metrics
+from utils.db import get_market_db_connection
+from utils.market_history import canonical_names
+from utils.model_artifacts import load_price_model
+from utils.model_registry import active_artifact_paths
+from utils.model_shards import with_shards
+from utils.price_forecast import MAX_FORECAST_DAYS, UNSEEN_COMMODITY, confidence_interval, forecast_arrays
+
+logger = logging.getLogger(__name__)
+
+JOB_ID = "price_forecasts_nightly"
+
+# Series with an arrival in this many days are precomputed
+ACTIVE_DAYS = int(os.getenv("PRICE_FORECAST_ACTIVE_DAYS", "30"))
+CHUNK_SIZE = int(os.getenv("PRICE_FORECAST_CHUNK_SIZE", "500"))
+WORKERS = int(os.getenv("PRICE_FORECAST_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+
+CREATE_TABLE_QUERY = """
+    CREATE TABLE IF NOT EXISTS price_forecasts (
+        state TEXT NOT NULL,
+        district TEXT NOT NULL,
+        market TEXT NOT NULL,
+        commodity TEXT NOT NULL,
+        variety TEXT NOT NULL,
+        grade TEXT NOT NULL,
+        forecast_date DATE NOT NULL,
+        predicted_price DOUBLE PRECISION NOT NULL,
+        std_dev DOUBLE PRECISION,
+        generated_on DATE NOT NULL,
+        latest_arrival_date DATE,
+        model_version TEXT,
+        created_at TIMESTAMPTZ DEFAULT NOW(),
+        PRIMARY KEY (state, district, market, commodity, variety, grade, forecast_date)
+    )
+"""
+
+# Last 7 prices (newest first) of every series that had an arrival recently. The window only
+# picks the series; like fetch_price_histories, the prices are the latest 7 whatever their date.
+ACTIVE_SERIES_QUERY = """
+    SELECT s.state, s.district, s.market, s.commodity, s.variety,
+           (array_agg(t.grade ORDER BY t.arrival_date DESC))[1] AS grade,
+           MAX(t.arrival_date) AS latest_arrival_date,
+           array_agg(t.modal_price ORDER BY t.arrival_date DESC) AS prices
+    FROM (
+        SELECT DISTINCT state, district, market, commodity, variety FROM market_prices
+        WHERE arrival_date >= CURRENT_DATE - %s
+          AND state IS NOT NULL AND district IS NOT NULL AND market IS NOT NULL
+          AND commodity IS NOT NULL AND variety IS NOT NULL
+    ) s
+    CROSS JOIN LATERAL (
+        SELECT grade, arrival_date, modal_price FROM market_prices m
+        WHERE m.state = s.state AND m.district = s.district AND m.market = s.market
+          AND m.commodity = s.commodity AND m.variety = s.variety
+        ORDER BY arrival_date DESC LIMIT 7
+    ) t
+    GROUP BY s.state, s.district, s.market, s.commodity, s.variety
+"""
+
+UPSERT_QUERY = """
+    INSERT INTO price_forecasts
+    (state, district, market, commodity, variety, grade, forecast_date, predicted_price, std_dev,
+     generated_on, latest_arrival_date, model_version)
+    VALUES %s
+    ON CONFLICT (state, district, market, commodity, variety, grade, forecast_date) DO UPDATE SET
+        predicted_price = EXCLUDED.predicted_price,
+        std_dev = EXCLUDED.std_dev,
+        generated_on = EXCLUDED.generated_on,
+        latest_arrival_date = EXCLUDED.latest_arrival_date,
+        model_version = EXCLUDED.model_version,
+        created_at = NOW()
+"""
+
+LOOKUP_COLUMNS = ('state', 'district', 'market', 'commodity', 'variety', 'grade')
+# Rows are stale once the series has an arrival newer than the one they were forecast from,
+# e.g. from a sync that ran after the nightly job; the live path answers those
+LOOKUP_QUERY = """
+    SELECT forecast_date, predicted_price, std_dev FROM price_forecasts f
+    WHERE state = %s AND district = %s AND market = %s AND commodity = %s AND variety = %s AND grade = %s
+      AND generated_on = %s AND model_version IS NOT DISTINCT FROM %s
+      AND forecast_date > %s
+      AND NOT EXISTS (
+          SELECT 1 FROM market_prices m
+          WHERE m.state = f.state AND m.district = f.district AND m.market = f.market
+            AND m.commodity = f.commodity AND m.variety = f.variety
+            AND m.arrival_date > f.latest_arrival_date
+      )
+    ORDER BY forecast_date ASC
+    LIMIT %s
+"""
+
+_worker_model = None
+
+
+def _init_worker(forest_path):
+    global _worker_model
+    _worker_model = with_shards(load_price_model(compiled_path=forest_path), forest_path)
+
+
+def _forecast_chunk(args):
+    encoded_rows, histories, start_date = args
+    return forecast_arrays(_worker_model, encoded_rows, histories, MAX_FORECAST_DAYS, start_date=start_date)
+
+
+def _encode_series(encoders, series: List[Dict]) -> List[tuple]:
+    # LabelEncoder.transform is the index into the sorted classes_; unknown values map to 0,
+    # and an unknown commodity to UNSEEN_COMMODITY so it is served by the global model
+    lookups = {col: {c: i for i, c in enumerate(le.classes_)} for col, le in encoders.items()}
+    cols = ['state', 'district', 'market', 'commodity', 'variety', 'grade']
+    return [
+        tuple(lookups[col].get(s[col], UNSEEN_COMMODITY if col == 'commodity' else 0) for col in cols)
+        for s in series
+    ]
+
+
+def _forecast_rows(series: List[Dict], forecast, generated_on, model_version) -> List[tuple]:
+    # Unrounded values are stored so served responses match live inference exactly
+    dates, points, stds = forecast
+    rows = []
+    for row, s in enumerate(series):
+        for i, target_date in enumerate(dates):
+            rows.append((
+                s['state'], s['district'], s['market'], s['commodity'], s['variety'], s['grade'],
+                target_date.date(), float(points[row, i]), float(stds[row, i]) if stds is not None else None,
+                generated_on, s['latest_arrival_date'], model_version,
+            ))
+    return rows
+
+
+def run_price_forecast_job(workers: int = WORKERS, chunk_size: int = CHUNK_SIZE) -> Dict:
+    """Precompute 30-day forecasts for every active series into price_forecasts."""
+    started = time.perf_counter()
+    today = datetime.now()
+    # The registry's active version at job start; a swap mid-run is picked up tomorrow
+    model_version, forest_path, encoders_path = active_artifact_paths()
+    update_job_metrics(
+        JOB_ID, status="running", started_at=today.isoformat(), finished_at=None,
+        series_total=None, series_done=0, rows_written=0, progress_pct=0.0, duration_seconds=None,
+    )
+
+    conn = get_market_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(CREATE_TABLE_QUERY)
+            cur.execute(ACTIVE_SERIES_QUERY, (ACTIVE_DAYS,))
+            columns = [d[0] for d in cur.description]
+            series = [dict(zip(columns, row)) for row in cur.fetchall()]
+        conn.commit()
+
+        for s in series:
+            s['grade'] = s['grade'] or ''
+            s['prices'] = [float(p) for p in (s['prices'] or []) if p is not None]
+        # Grouped by commodity so each chunk touches few per-commodity model shards
+        series = sorted((s for s in series if s['prices']), key=lambda s: s['commodity'])
+        update_job_metrics(JOB_ID, series_total=len(series))
+        logger.info(f"📈 Precomputing {MAX_FORECAST_DAYS}-day forecasts for {len(series)} series with {workers} workers")
+
+        encoders = joblib.load(encoders_path)
+        encoded = _encode_series(encoders, series)
+        chunks = [
+            (series[i:i + chunk_size], encoded[i:i + chunk_size])
+            for i in range(0, len(series), chunk_size)
+        ]
+
+        series_done = 0
+        rows_written = 0
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(forest_path,),
+        )
+        with executor:
+            jobs = [(enc, [s['prices'] for s in chunk], today) for chunk, enc in chunks]
+            for (chunk, _), forecast in zip(chunks, executor.map(_forecast_chunk, jobs)):
+                rows = _forecast_rows(chunk, forecast, today.date(), model_version)
+                with conn.cursor() as cur:
+                    extras.execute_values(cur, UPSERT_QUERY, rows, page_size=5000)
+                conn.commit()
+
+                series_done += len(chunk)
+                rows_written += len(rows)
+                update_job_metrics(
+                    JOB_ID, series_done=series_done, rows_written=rows_written,
+                    progress_pct=round(100.0 * series_done / len(series), 1),
+                    duration_seconds=round(time.perf_counter() - started, 2),
+                )
+
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM price_forecasts WHERE generated_on < %s", (today.date(),))
+            removed = cur.rowcount
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        update_job_metrics(JOB_ID, status="failed", error=str(e),
+                           duration_seconds=round(time.perf_counter() - started, 2))
+        raise
+    finally:
+        conn.close()
+
+    duration = round(time.perf_counter() - started, 2)
+    summary = {
+        "status": "success",
+        "finished_at": datetime.now().isoformat(),
+        "series_total": len(series),
+        "series_done": series_done,
+        "rows_written": rows_written,
+        "stale_rows_removed": removed,
+        "progress_pct": 100.0,
+        "duration_seconds": duration,
+        "series_per_second": round(len(series) / duration, 1) if duration else None,
+        "error": None,
+    }
+    update_job_metrics(JOB_ID, **summary)
+    logger.info(f"📈 Price forecasts written: {rows_written} rows for {len(series)} series in {duration}s")
+    return summary
+
+
+async def precompute_price_forecasts():
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, run_price_forecast_job)
+
+
+def fetch_precomputed_forecast(conn, req, entities, forecast_days: int, model_version: Optional[str], today: datetime):
+    """Materialized predictions for an exact series, or None if no fresh full horizon exists.
+
+    Names are matched the way fetch_price_histories matches them: by
+    equality on canonical names, and only when every name resolves. A
+    request with an unresolved name is answered from its ILIKE patterns,
+    which may span several series, so it never reads a single precomputed
+    series. Rows forecast from an older arrival than the series' latest
+    are not fresh either.
+    """
+    names = canonical_names(req, entities, LOOKUP_COLUMNS)
+    if names is None:
+        return None
+    try:
+        with conn.cursor() as cur:
+            cur.execute(LOOKUP_QUERY, tuple(names[col] for col in LOOKUP_COLUMNS) + (
+                today.date(), model_version, today.date(), forecast_days,
+            ))
+            rows = cur.fetchall()
+    except Exception as e:
+        conn.rollback()
+        logger.warning(f"Precomputed forecast lookup failed: {e}")
+        return None
+
+    if len(rows) < forecast_days:
+        return None
+    return [
+        {
+            "date": forecast_date.strftime("%Y-%m-%d"),
+            "predicted_price": round(price, 2),
+            "confidence_interval": confidence_interval(price, std_dev),
+        }
+        for forecast_date, price, std_dev in rows
+    ]
+
+
+if __name__ == "__main__":
+    print(run_price_forecast_job())
@@ -15,6 +15,7 @@ scheduler = AsyncIOScheduler(timezone=pytz.timezone('Asia/Kolkata'))
 job_status = {
     "scheduler_running": False,
     "jobs": {},
+    "metrics": {},
     "last_error": None,
     "started_at": None
 }
@@ -84,11 +85,18 @@ def add_job(func, trigger, job_id, **kwargs):
         logger.error(f"Failed to add job {job_id}: {e}")
         return False
 
+def update_job_metrics(job_id, **metrics):
+    """Record progress/duration figures for a job, shown in get_scheduler_status()."""
+    job_metrics = job_status["metrics"].setdefault(job_id, {})
+    job_metrics.update(metrics)
+    job_metrics["updated_at"] = datetime.now().isoformat()
+
 def get_scheduler_status():
     return {
         "scheduler_running": scheduler.running,
         "jobs_count": len(scheduler.get_jobs()),
         "jobs": job_status["jobs"],
+        "metrics": job_status["metrics"],
         "last_error": job_status["last_error"],
         "started_at": job_status["started_at"],
         "current_time": datetime.now().isoformat()
@@ -0,0 +1,90 @@
+"""
+Parity checks for utils.compiled_forest against sklearn.
+
+Usage:
+    cd backend
+    python -m pytest test_compiled_forest.py
+"""
+import os
+import tempfile
+import warnings
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from benchmarks.common import make_synthetic_model, make_synthetic_training_data
+from utils import compiled_forest
+from utils.compiled_forest import CompiledForest, export_forest, saved_forest_version
+from utils.price_forecast import FEATURE_NAMES, forecast_prices
+
+warnings.filterwarnings('ignore')
+
+MODEL = make_synthetic_model(n_estimators=20, n_rows=5000)
+MODEL.set_params(n_jobs=1)
+X = make_synthetic_training_data(n_rows=2000, seed=7)[FEATURE_NAMES].to_numpy(dtype=np.float64)
+
+
+def test_tree_predictions_match_sklearn():
+    compiled = CompiledForest.from_sklearn(MODEL)
+    expected = np.stack([tree.predict(X.astype(np.float32)) for tree in MODEL.estimators_])
+    assert np.array_equal(compiled.tree_predictions(X), expected)
+
+
+def test_predict_matches_model_predict():
+    compiled = CompiledForest.from_sklearn(MODEL)
+    assert np.array_equal(compiled.predict(X), MODEL.predict(X))
+
+
+def test_export_round_trip():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "forest.npz")
+        export_forest(MODEL, path)
+        loaded = CompiledForest.load(path)
+    assert np.array_equal(loaded.predict(X), MODEL.predict(X))
+
+
+def test_directory_export_is_replaced_atomically(monkeypatch):
+    first = CompiledForest.from_sklearn(MODEL)
+    second = CompiledForest.from_sklearn(make_synthetic_model(n_estimators=5, n_rows=1000, seed=3))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "price_forest")
+        first.save(path)
+        mapped = CompiledForest.load(path)
+
+        # A save that dies half way leaves the published export untouched
+        save = np.save
+        calls = []
+
+        def failing_save(file, arr):
+            calls.append(file)
+            if len(calls) == 3:
+                raise OSError("disk full")
+            save(file, arr)
+
+        monkeypatch.setattr(compiled_forest.np, "save", failing_save)
+        with pytest.raises(OSError):
+            second.save(path)
+        monkeypatch.undo()
+        assert saved_forest_version(path) == first.digest()
+        assert np.array_equal(CompiledForest.load(path).predict(X), MODEL.predict(X))
+
+        second.save(path)
+        assert saved_forest_version(path) == second.digest()
+        assert np.array_equal(CompiledForest.load(path).predict(X), second.predict(X))
+        # The forest mapped before the swap still reads its own arrays
+        assert np.array_equal(mapped.predict(X), MODEL.predict(X))
+
+        # Only the published arrays and the ones before them are kept
+        third = CompiledForest.from_sklearn(make_synthetic_model(n_estimators=3, n_rows=1000, seed=4))
+        third.save(path)
+        assert sorted(os.listdir(path)) == sorted([second.digest(), third.digest(), "meta.json"])
+
+
+def test_forecast_matches_sklearn_path():
+    compiled = CompiledForest.from_sklearn(MODEL)
+    encoded = [tuple(row[:6]) for row in X[:25]]
+    histories = [[row[7], row[6], row[6]][:1 + i % 3] for i, row in enumerate(X[:25])]
+    start = datetime(2024, 1, 1)
+    expected = forecast_prices(MODEL, encoded, histories, 30, start_date=start)
+    assert forecast_prices(compiled, encoded, histories, 30, start_date=start) == expected
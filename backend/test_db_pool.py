@@ -0,0 +1,124 @@
+"""
+Market DB pool checks: bounded size with a wait timeout, session reset on
+return, recycling by age, replacement of connections that died while idle,
+and the gauges. Runs against the configured Postgres (DB_NAME) and is
+skipped when Postgres is unreachable.
+
+Usage:
+    cd backend
+    python -m pytest test_db_pool.py
+"""
+import threading
+import time
+
+import psycopg2
+import pytest
+
+from utils.db import MarketDBPool, PoolTimeout, get_market_db_connection
+
+
+def _pool(**kwargs):
+    try:
+        get_market_db_connection().close()
+    except psycopg2.OperationalError:
+        pytest.skip("Postgres unreachable")
+    return MarketDBPool(**{"minconn": 1, "maxconn": 2, "timeout": 0.2, **kwargs}).open()
+
+
+def _backend_pid(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_backend_pid()")
+        pid = cur.fetchone()[0]
+    conn.rollback()
+    return pid
+
+
+def test_bounded_wait_and_timeout():
+    pool = _pool()
+    first, second = pool.getconn(), pool.getconn()
+    assert pool.stats()["in_use"] == 2 and pool.stats()["size"] == 2
+    started = time.monotonic()
+    try:
+        pool.getconn()
+        assert False, "third borrow should time out"
+    except PoolTimeout:
+        pass
+    assert time.monotonic() - started >= 0.2 and pool.counters["timeouts"] == 1
+
+    # A waiter gets the connection handed back by another thread
+    threading.Timer(0.05, first.close).start()
+    third = pool.getconn(timeout=2)
+    assert _backend_pid(third) > 0
+    third.close()
+    second.close()
+    stats = pool.stats()
+    assert stats["in_use"] == 0 and stats["idle"] == 2 and stats["created"] == 2
+    assert stats["wait"]["count"] >= 3
+    pool.close()
+
+
+def test_waiters_are_served_in_order():
+    pool = _pool(maxconn=1)
+    held = pool.getconn()
+    served = []
+
+    def borrow(name):
+        conn = pool.getconn(timeout=5)
+        served.append(name)
+        conn.close()
+
+    threads = []
+    for name in ("first", "second"):
+        threads.append(threading.Thread(target=borrow, args=(name,)))
+        threads[-1].start()
+        time.sleep(0.05)
+    assert pool.stats()["waiting"] == 2
+    held.close()
+    # The releasing thread asks again straight away, behind both waiters
+    pool.getconn(timeout=5).close()
+    served.append("releaser")
+    for thread in threads:
+        thread.join()
+    assert served == ["first", "second", "releaser"], served
+    pool.close()
+
+
+def test_returned_connections_are_reset():
+    pool = _pool(maxconn=1)
+    with pool.connection() as conn:
+        pid = _backend_pid(conn)
+        conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        # Left inside a transaction on purpose
+    assert conn.closed
+    with pool.connection() as conn:
+        assert _backend_pid(conn) == pid
+        assert not conn.readonly and conn.isolation_level is None and not conn.autocommit
+        with conn.cursor() as cur:
+            cur.execute("CREATE TEMP TABLE pool_probe (x int)")
+        conn.commit()
+    pool.close()
+
+
+def test_recycles_old_and_replaces_dead_connections():
+    pool = _pool(maxconn=1, check_idle=0)
+    with pool.connection() as conn:
+        pid = _backend_pid(conn)
+    admin = get_market_db_connection()
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute("SELECT pg_terminate_backend(%s)", (pid,))
+    admin.close()
+    time.sleep(0.1)
+    # Idle past check_idle: the ping fails and a fresh connection is handed out
+    with pool.connection() as conn:
+        replaced = _backend_pid(conn)
+    assert replaced != pid and pool.counters["health_check_failures"] == 1
+
+    pool.max_age = 0
+    with pool.connection() as conn:
+        assert _backend_pid(conn) != replaced
+    assert pool.counters["recycled"] >= 1
+    assert pool.health()["ok"] and pool.stats()["size"] <= 1
+    pool.close()
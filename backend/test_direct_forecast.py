@@ -0,0 +1,64 @@
+"""
+Checks for the direct multi-horizon training set and forecast.
+
+Usage:
+    cd backend
+    python -m pytest test_direct_forecast.py
+"""
+import warnings
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+from train_model import build_direct_training_set
+from utils.compiled_forest import CompiledForest
+from utils.price_forecast import DIRECT_FEATURE_NAMES, forecast_direct_arrays, forecast_prices
+
+warnings.filterwarnings('ignore')
+
+
+def _features(days=40):
+    dates = pd.date_range("2024-01-01", periods=days)
+    rows = []
+    for market in (1, 2):
+        for i, d in enumerate(dates):
+            rows.append({
+                'state_encoded': 0, 'district_encoded': 0, 'market_encoded': market, 'commodity_encoded': 3,
+                'variety_encoded': 0, 'grade_encoded': 0, 'arrival_date': d,
+                'modal_price': 1000.0 * market + i, 'moving_avg_7d': 1000.0 * market + i - 3,
+            })
+    return pd.DataFrame(rows)
+
+
+def test_direct_rows_pair_origin_with_price_h_days_later():
+    df = _features()
+    direct = build_direct_training_set(df, horizons_per_row=3, max_rows=10000)
+    assert len(direct) > 0 and set(DIRECT_FEATURE_NAMES) <= set(direct.columns)
+    # Prices rise by 1 a day, so the target is the origin price plus the horizon
+    np.testing.assert_array_equal(direct['target_price'], direct['price_lag_1d'] + direct['horizon_days'])
+    assert direct['horizon_days'].between(1, 30).all()
+    expected_weekend = (direct['target_date'].dt.dayofweek >= 5).astype(int)
+    np.testing.assert_array_equal(direct['is_weekend'], expected_weekend)
+
+
+def test_direct_forecast_is_one_batch_over_all_horizons():
+    rng = np.random.default_rng(0)
+    X = rng.normal(0, 100, size=(2000, len(DIRECT_FEATURE_NAMES)))
+    X[:, 9] = rng.integers(1, 31, 2000)
+    y = X[:, 7] + 3 * X[:, 9]
+    forest = CompiledForest.from_sklearn(RandomForestRegressor(n_estimators=5, random_state=0).fit(X, y))
+
+    start = datetime(2024, 1, 5)
+    encoded = [(1, 2, 3, 4, 5, 6), (6, 5, 4, 3, 2, 1)]
+    histories = [[100.0, 90.0, 80.0], [50.0]]
+    dates, points, stds = forecast_direct_arrays(forest, encoded, histories, 10, start)
+    assert points.shape == (2, 10) and stds.shape == (2, 10)
+    for s, (enc, hist) in enumerate(zip(encoded, histories)):
+        for h in range(10):
+            row = list(enc) + [np.mean(hist), hist[0], 1 if dates[h].weekday() >= 5 else 0, h + 1]
+            assert points[s, h] == forest.predict(np.array([row]))[0]
+
+    formatted = forecast_prices(forest, encoded, histories, 10, start, mode='direct')
+    assert formatted[1][9]["predicted_price"] == round(points[1, 9], 2)
@@ -0,0 +1,163 @@
+"""
+Name resolution checks for utils.entity_dictionary.
+
+Usage:
+    cd backend
+    python -m pytest test_entity_dictionary.py
+"""
+import threading
+from contextlib import contextmanager
+
+from sklearn.preprocessing import LabelEncoder
+
+from utils import entity_dictionary
+from utils.entity_dictionary import EntityDictionary, get_entity_dictionary, invalidate_entity_dictionary, normalize_name
+
+MARKET_NAMES = {
+    'state': [('Maharashtra', 900), ('Karnataka', 500)],
+    'district': [('Nashik', 400), ('Belgaum', 300)],
+    'market': [('Lasalgaon APMC', 300), ('Nashik Market', 100), ('Belgaum Market', 80)],
+    'commodity': [('Onion', 500), ('Tomato', 300), ('Paddy(Dhan)(Common)', 50), ('tomato', 2)],
+    'variety': [('Local', 700), ('Hybrid', 100)],
+    'grade': [('FAQ', 800)],
+}
+
+
+class _Cursor:
+    def __init__(self):
+        self.rows = []
+
+    def execute(self, query, params=None):
+        column = next(col for col in MARKET_NAMES if f"SELECT {col}," in query)
+        self.rows = MARKET_NAMES[column]
+
+    def fetchall(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Connection:
+    def cursor(self):
+        return _Cursor()
+
+
+def _encoders():
+    encoders = {}
+    for col, classes in {
+        'state': ['Karnataka', 'Maharashtra'],
+        'district': ['Belgaum', 'Nashik'],
+        'market': ['Lasalgaon APMC', 'Nashik Market'],
+        'commodity': ['Onion', 'Potato', 'Tomato'],
+        'variety': ['Hybrid', 'Local'],
+        'grade': ['FAQ'],
+    }.items():
+        encoders[col] = LabelEncoder().fit(classes)
+    return encoders
+
+
+ENTITIES = EntityDictionary.build(_Connection(), _encoders(), {'commodity': {'pyaz': 'Onion'}})
+
+
+def test_normalize_name():
+    assert normalize_name("  Paddy (Dhan)  ") == "paddy dhan"
+    assert normalize_name(None) == ""
+
+
+def test_exact_and_case_insensitive():
+    assert ENTITIES.resolve('commodity', 'TOMATO ').name == 'Tomato'
+    assert ENTITIES.encode('commodity', 'tomato') == 2
+    assert ENTITIES.encode('state', 'maharashtra') == 1
+
+
+def test_encoding_matches_label_encoder():
+    encoders = _encoders()
+    for col, le in encoders.items():
+        for name in le.classes_:
+            assert ENTITIES.encode(col, name) == le.transform([name])[0]
+
+
+def test_aliases():
+    assert ENTITIES.resolve('commodity', 'pyaz').name == 'Onion'
+    assert ENTITIES.resolve('commodity', 'Paddy').name == 'Paddy(Dhan)(Common)'
+
+
+def test_substring_and_typos():
+    assert ENTITIES.resolve('market', 'Lasalgaon').match == 'substring'
+    assert ENTITIES.canonical('market', 'Lasalgoan APMC') == 'Lasalgaon APMC'
+    assert ENTITIES.canonical('commodity', 'Tomatoe') == 'Tomato'
+    # "Market" is in two names and too far from both: no guess
+    assert ENTITIES.canonical('market', 'Market') is None
+
+
+def test_unknown_names():
+    assert ENTITIES.resolve('commodity', 'Saffron').name is None
+    assert ENTITIES.encode('commodity', 'Saffron') == 0
+    assert ENTITIES.encode('commodity', 'Saffron', unseen=-1) == -1 and ENTITIES.encode('commodity', '', unseen=-1) == -1
+    # Known to market_prices but not to the encoders
+    assert ENTITIES.encode('commodity', 'Paddy', unseen=-1) == -1 and ENTITIES.encode('commodity', 'Onion', -1) == 0
+    # Known to the encoders but not to market_prices
+    potato = ENTITIES.resolve('commodity', 'Potato')
+    assert potato.name is None and potato.encoded == 1
+
+
+def test_expired_dictionary_is_rebuilt_in_the_background(monkeypatch):
+    release, builds = threading.Event(), []
+
+    @contextmanager
+    def slow_db():
+        builds.append(threading.current_thread().name)
+        if len(builds) > 1:
+            assert release.wait(5)
+        yield _Connection()
+
+    monkeypatch.setattr(entity_dictionary, "market_db", slow_db)
+    monkeypatch.setattr(entity_dictionary, "_dictionary", None)
+    encoders = _encoders()
+    first = get_entity_dictionary(encoders)
+    assert first.canonical('market', 'Lasalgaon') == 'Lasalgaon APMC'
+
+    invalidate_entity_dictionary()
+    # The rebuild blocks on the database; callers keep getting the old dictionary meanwhile
+    assert get_entity_dictionary(encoders) is first
+    assert get_entity_dictionary(encoders) is first
+    rebuild = entity_dictionary._rebuild
+    release.set()
+    rebuild.join(5)
+    second = get_entity_dictionary(encoders)
+    assert second is not first and second.canonical('market', 'Lasalgaon') == 'Lasalgaon APMC'
+    assert builds == ["MainThread", "entity-dictionary-rebuild"]
+
+
+def test_model_swap_rebuilds_with_the_new_encoders(monkeypatch):
+    down = False
+
+    @contextmanager
+    def db():
+        if down:
+            raise ConnectionError("market_prices unreachable")
+        yield _Connection()
+
+    monkeypatch.setattr(entity_dictionary, "market_db", db)
+    monkeypatch.setattr(entity_dictionary, "_dictionary", None)
+    old = _encoders()
+    assert get_entity_dictionary(old).encode('commodity', 'Onion') == 0
+
+    swapped = _encoders()
+    swapped['commodity'] = LabelEncoder().fit(['Garlic', 'Onion', 'Tomato'])
+    # Built before returning, even though the old dictionary has not expired
+    entities = get_entity_dictionary(swapped)
+    assert entities.encode('commodity', 'Onion') == 1
+    assert entities.canonical('market', 'Lasalgaon') == 'Lasalgaon APMC'
+    assert get_entity_dictionary(swapped) is entities
+
+    # With market_prices unreachable the old names are not worth the old encoders
+    down = True
+    entities = get_entity_dictionary(old)
+    assert entities.encoders is old and entities.encode('commodity', 'Onion') == 0
+    assert entities.canonical('market', 'Lasalgaon') is None
+    assert get_entity_dictionary(old) is entities
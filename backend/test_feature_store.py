@@ -0,0 +1,123 @@
+"""
+Checks that compute_features matches the old lambda-based preprocess_data
+features and that incremental FeatureStore updates match a full recompute,
+including rows revised or added late inside the sync's overlap window.
+
+Usage:
+    cd backend
+    python -m pytest test_feature_store.py
+"""
+import tempfile
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.feature_store import legacy_features
+from utils.feature_store import FeatureStore, compute_features
+
+warnings.filterwarnings('ignore')
+
+KEYS = ['state', 'district', 'market', 'commodity', 'variety', 'grade']
+
+
+def make_rows(days=40, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for market in ["Alpha", "Beta", "Gamma"]:
+        for commodity in ["Onion", "Tomato"]:
+            # Series report on different days, like real mandis
+            dates = sorted(rng.choice(pd.date_range("2024-01-01", periods=days), size=days // 2, replace=False))
+            for d in dates:
+                rows.append(("S", "D", market, commodity, "Local", "FAQ", d, float(rng.integers(800, 1600))))
+    df = pd.DataFrame(rows, columns=KEYS + ['arrival_date', 'modal_price'])
+    df.loc[rng.choice(len(df), size=len(df) // 6, replace=False), 'modal_price'] = np.nan
+    # One series with no prices at all is dropped by both versions
+    df.loc[(df['market'] == "Gamma") & (df['commodity'] == "Tomato"), 'modal_price'] = np.nan
+    return df
+
+
+def test_matches_legacy_features():
+    df = make_rows()
+    legacy = legacy_features(df.copy()).reset_index(drop=True)
+    new = compute_features(df)
+    assert len(new) == len(legacy)
+    for col in ['modal_price', 'price_lag_1d', 'is_weekend']:
+        np.testing.assert_array_equal(legacy[col].to_numpy(), new[col].to_numpy())
+    np.testing.assert_allclose(legacy['moving_avg_7d'], new['moving_avg_7d'], rtol=1e-12)
+
+
+def test_incremental_update_matches_full():
+    # NaNs stay in: gaps straddling a cutoff are re-filled once later prices arrive
+    df = make_rows(seed=1)
+    loader = lambda since: df if since is None else df[df['arrival_date'].dt.date > since]  # noqa: E731
+
+    cutoffs = [pd.Timestamp("2024-01-20"), pd.Timestamp("2024-02-03")]
+    store = FeatureStore(tempfile.mkdtemp())
+    store.update(lambda since: df[df['arrival_date'] <= cutoffs[0]])
+    store.update(lambda since: loader(since)[lambda x: x['arrival_date'] <= cutoffs[1]])
+    assert store.update(loader) > 0
+    assert store.update(loader) == 0
+
+    stored = store.read()
+    full = compute_features(df)
+    cols = KEYS + ['arrival_date', 'modal_price', 'moving_avg_7d', 'price_lag_1d', 'is_weekend']
+    pd.testing.assert_frame_equal(stored[cols], full[cols], check_dtype=False)
+    assert store.meta()["rows"] == len(full)
+    assert len(store.months()) == 2
+
+
+def test_gap_at_batch_boundary_is_refilled():
+    prices = [100, 110, np.nan, np.nan, 150, 160]
+    df = pd.DataFrame({
+        **{col: ["X"] * len(prices) for col in KEYS},
+        'arrival_date': pd.date_range("2024-03-01", periods=len(prices)),
+        'modal_price': prices,
+    })
+    store = FeatureStore(tempfile.mkdtemp())
+    # The first batch ends inside the gap, the second one closes it
+    assert store.update(lambda since: df.iloc[:4]) == 4
+    assert store.update(lambda since: df[df['arrival_date'].dt.date > since]) == 2
+
+    stored = store.read()
+    np.testing.assert_allclose(stored['modal_price'], [100, 110, 123.333333, 136.666667, 150, 160], rtol=1e-6)
+    full = compute_features(df)
+    cols = ['modal_price', 'moving_avg_7d', 'price_lag_1d']
+    pd.testing.assert_frame_equal(stored[cols], full[cols])
+    assert store.meta()["rows"] == 6
+
+    # A series with no reported price yet is held back until one arrives
+    blank = df.assign(market="Y", modal_price=[np.nan] * 3 + [90, 95, 100])
+    store = FeatureStore(tempfile.mkdtemp())
+    assert store.update(lambda since: blank.iloc[:3]) == 0
+    assert store.update(lambda since: blank[blank['arrival_date'].dt.date > since]) == 6
+    np.testing.assert_array_equal(store.read()['modal_price'], [90, 90, 90, 90, 95, 100])
+
+
+def test_late_and_revised_rows_in_the_overlap_window_are_reloaded():
+    df = make_rows(seed=2)
+    end = df['arrival_date'].max()
+    # A price from the day before the last is revised and one of the last day's records arrives late
+    synced = df.copy()
+    revised = synced.index == synced.index[synced['arrival_date'] == end - pd.Timedelta(days=1)][0]
+    synced.loc[revised, 'modal_price'] = 5000.0
+    late = df.index[df['arrival_date'] == end][-1]
+    loader = lambda frame: lambda since: frame if since is None else frame[frame['arrival_date'].dt.date > since]  # noqa: E731
+
+    store = FeatureStore(tempfile.mkdtemp())
+    store.update(loader(df.drop(index=late).assign(modal_price=df['modal_price'].where(~revised, 1.0))),
+                 overlap_days=2)
+    store.update(loader(synced), overlap_days=2)
+
+    stored = store.read()
+    full = compute_features(synced)
+    cols = KEYS + ['arrival_date', 'modal_price', 'moving_avg_7d', 'price_lag_1d']
+    pd.testing.assert_frame_equal(stored[cols], full[cols], check_dtype=False)
+    assert store.meta()["rows"] == len(full)
+
+    # Without the overlap the same sync leaves the old price and misses the late row
+    store = FeatureStore(tempfile.mkdtemp())
+    store.update(loader(df.drop(index=late).assign(modal_price=df['modal_price'].where(~revised, 1.0))),
+                 overlap_days=0)
+    assert store.update(loader(synced), overlap_days=0) == 0
+    assert len(store.read()) == len(full) - 1
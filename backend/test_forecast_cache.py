@@ -0,0 +1,102 @@
+"""
+ForecastCache checks: TTL expiry, LRU eviction, invalidation by commodity,
+the /predict-price cache key, and the admin token check guarding the
+invalidation endpoint.
+
+Usage:
+    cd backend
+    python -m pytest test_forecast_cache.py
+"""
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+
+import api
+from utils import forecast_cache
+from utils.forecast_cache import ForecastCache, forecast_cache_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(forecast_cache.time, "monotonic", clock)
+    return clock
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = ForecastCache(ttl_seconds=60)
+    cache.put("key", {"price": 1})
+    clock.now += 59
+    assert cache.get("key") == {"price": 1}
+    clock.now += 2
+    assert cache.get("key") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"], stats["entries"]) == (1, 1, 1, 0)
+
+    # A put starts a fresh TTL
+    cache.put("key", 2)
+    clock.now += 59
+    assert cache.get("key") == 2
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = ForecastCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+    disabled = ForecastCache(max_entries=0)
+    disabled.put("a", 1)
+    assert disabled.get("a") is None and disabled.stats()["entries"] == 0
+
+
+def test_invalidate_commodities(clock):
+    cache = ForecastCache()
+    cache.put("onion", 1, commodity=" Onion ")
+    cache.put("tomato", 2, commodity="Tomato")
+    cache.put("untagged", 3)
+    # "onion" was requested as a pattern, so an ingested "Onion (Big)" makes it stale; untagged entries always go
+    assert cache.invalidate_commodities(["Onion (Big)", ""]) == 2
+    assert cache.get("onion") is None and cache.get("untagged") is None
+    assert cache.get("tomato") == 2
+    assert cache.invalidate_commodities([]) == 0
+    assert cache.clear() == 1
+    assert cache.stats()["invalidations"] == 3
+
+
+def test_forecast_cache_key():
+    args = dict(encoded=[1, 2, 3, 4, 5, 6], forecast_days=7, mode="recursive", model_version="abc",
+                latest_arrival_date=date(2024, 3, 1), day=date(2024, 3, 2), prices=[100.0, 99.5])
+    key = forecast_cache_key(**args)
+    hash(key)
+    assert key == forecast_cache_key(**{**args, "encoded": tuple(args["encoded"]), "prices": (100.0, 99.5)})
+    for name, value in [("encoded", [1, 2, 3, 4, 5, 0]), ("forecast_days", 14), ("mode", "direct"),
+                        ("model_version", "def"), ("latest_arrival_date", date(2024, 3, 2)),
+                        ("day", date(2024, 3, 3)), ("prices", [100.0, 99.0])]:
+        assert forecast_cache_key(**{**args, name: value}) != key, name
+
+
+def test_require_admin_token(monkeypatch):
+    monkeypatch.setattr(api, "ADMIN_API_TOKEN", None)
+    with pytest.raises(HTTPException) as e:
+        api.require_admin_token("anything")
+    assert e.value.status_code == 403
+
+    monkeypatch.setattr(api, "ADMIN_API_TOKEN", "s3cret")
+    api.require_admin_token("s3cret")
+    for token in (None, "", "s3cre", "s3cret!", "S3CRET"):
+        with pytest.raises(HTTPException) as e:
+            api.require_admin_token(token)
+        assert e.value.status_code == 401
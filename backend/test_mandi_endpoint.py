@@ -26,3 +26,50 @@ test_endpoint({"state": "Kerala"}, "State=Kerala")
 
 # 3. Test with non-existent state
 test_endpoint({"state": "NonExistent"}, "State=NonExistent")
+
+
+def walk_pages(params=None, desc="", page_size=50, max_pages=5):
+    """Follow X-Next-Cursor and check that pages are newest first and never repeat a row."""
+    print(f"\n--- Paging {desc} ---")
+    try:
+        params = dict(params or {}, limit=page_size)
+        seen, previous = set(), None
+        for page in range(max_pages):
+            resp = requests.get(base_url, params=params)
+            data = resp.json()
+            keys = [(row["arrival_date"], row["id"]) for row in data]
+            ordered = keys == sorted(keys, reverse=True) and (previous is None or not keys or keys[0] < previous)
+            repeated = seen.intersection(row["id"] for row in data)
+            print(f"Page {page + 1}: {len(data)} rows, ordered={ordered}, repeated={len(repeated)}")
+            seen.update(row["id"] for row in data)
+            previous = keys[-1] if keys else previous
+            if "X-Next-Cursor" not in resp.headers:
+                print("Last page reached")
+                break
+            params["cursor"] = resp.headers["X-Next-Cursor"]
+    except Exception as e:
+        print(f"Error: {e}")
+
+
+def check_conditional_get(params=None):
+    """A repeat request with the ETag should be answered 304 until new rows land."""
+    print("\n--- Conditional GET ---")
+    try:
+        resp = requests.get(base_url, params=params)
+        etag = resp.headers.get("ETag")
+        print(f"ETag: {etag}")
+        if etag:
+            again = requests.get(base_url, params=params, headers={"If-None-Match": etag})
+            print(f"Status with If-None-Match: {again.status_code} (expected 304)")
+        else:
+            print("No ETag yet (run fetch_market_prices.py to record a sync watermark)")
+    except Exception as e:
+        print(f"Error: {e}")
+
+
+# 4. Walk a few pages with the keyset cursor
+walk_pages(None, "No Params")
+walk_pages({"state": "Kerala"}, "State=Kerala")
+
+# 5. ETag / 304
+check_conditional_get({"limit": 10})
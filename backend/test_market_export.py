@@ -0,0 +1,103 @@
+"""
+Arrow / Parquet export round trips: every row comes back once, in
+(arrival_date, id) order, with NULLs, empty strings and CSV-hostile names
+intact, across several keyset chunks. Runs against a scratch Postgres
+database (EXPORT_TEST_DB_NAME, default SmartAgriExportTest) and is skipped
+when Postgres is unreachable.
+
+Usage:
+    cd backend
+    python -m pytest test_market_export.py
+"""
+import io
+import os
+from datetime import date
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import fetch_market_prices as fmp
+from utils.market_export import export_filters, stream_export
+from utils.market_loader import load_market_frame, parse_market_frame
+
+
+
+class Names:
+    """EntityDictionary stand-in where no name resolves, so filters match case-insensitively."""
+
+    def canonical(self, col, value):
+        return None
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    """Market tables loaded with a few awkward rows, in the scratch database fetch_market_prices is pointed at."""
+    monkeypatch.setattr(fmp, "DB_NAME", os.getenv("EXPORT_TEST_DB_NAME", "SmartAgriExportTest"))
+    fmp.create_database_if_not_exists()
+    conn = fmp.get_db_connection()
+    if conn is None:
+        pytest.skip("Postgres unreachable")
+    with conn.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS market_prices, market_price_daily_rollup CASCADE")
+    conn.commit()
+    fmp.create_table_if_not_exists(conn)
+    records = [
+        {"state": "Kerala", "district": "Idukki", "market": f"Market {i % 3}", "commodity": "Cardamom",
+         "variety": "Small", "grade": "FAQ", "arrival_date": f"{1 + i % 28:02d}/0{1 + i % 2}/2024",
+         "min_price": str(1000 + i), "max_price": str(1100 + i), "modal_price": f"{1050 + i}.25"}
+        for i in range(40)
+    ] + [
+        {"state": "Kerala", "district": 'Quote "and", comma', "market": "Line\nbreak", "commodity": "Pepper",
+         "variety": "", "grade": None, "arrival_date": "15/01/2024", "modal_price": "600"},
+        {"state": "Assam", "district": "Nagaon", "market": "Dhing APMC", "commodity": "Jute",
+         "variety": "TD-5", "grade": "FAQ", "arrival_date": "15/02/2024", "modal_price": "4500"},
+    ]
+    with conn.cursor() as cur:
+        load_market_frame(cur, parse_market_frame(records))
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def _expected(conn, where, params):
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT id, state, district, market, commodity, variety, grade, arrival_date,
+                   min_price::float8, max_price::float8, modal_price::float8
+            FROM market_prices WHERE {where} ORDER BY arrival_date, id
+        """, params)
+        rows = cur.fetchall()
+    conn.commit()
+    return rows
+
+
+def _rows(table):
+    return [tuple(row.values()) for row in table.to_pylist()]
+
+
+def test_arrow_and_parquet_round_trip_in_chunks(conn):
+    where, params = export_filters(Names(), date(2024, 1, 1), date(2024, 12, 31))
+    expected = _expected(conn, where, params)
+    assert len(expected) == 42
+    for fmt, read in (("arrow", lambda body: pa.ipc.open_stream(body).read_all()),
+                      ("parquet", lambda body: pq.read_table(io.BytesIO(body)))):
+        chunks = list(stream_export(fmp.get_db_connection(), where, params, fmt, batch_rows=8))
+        table = read(b"".join(chunks))
+        assert len(chunks) > 5, fmt
+        assert _rows(table) == expected, fmt
+        assert pa.types.is_dictionary(table.schema.field("market").type), fmt
+    odd = [row for row in expected if row[4] == "Pepper"][0]
+    assert odd[5] == "" and odd[6] is None and odd[3] == "Line\nbreak"
+
+
+def test_filters_and_empty_range(conn):
+    where, params = export_filters(Names(), date(2024, 2, 1), date(2024, 2, 29), state="kerala", commodity="cardamom")
+    expected = _expected(conn, where, params)
+    table = pa.ipc.open_stream(b"".join(stream_export(fmp.get_db_connection(), where, params, "arrow"))).read_all()
+    assert len(expected) == 20 and _rows(table) == expected
+    assert set(table.column("state").to_pylist()) == {"Kerala"}
+
+    where, params = export_filters(Names(), date(2023, 1, 1), date(2023, 1, 31))
+    table = pq.read_table(io.BytesIO(b"".join(stream_export(fmp.get_db_connection(), where, params, "parquet"))))
+    assert table.num_rows == 0 and "modal_price" in table.schema.names
@@ -0,0 +1,102 @@
+"""
+Checks for the concurrent data.gov.in page fetcher against the local fixture server.
+
+Usage:
+    cd backend
+    python -m pytest test_market_fetch.py
+"""
+import asyncio
+import threading
+import time
+
+from benchmarks.mandi_fixture import FixtureServer, make_records
+from utils.market_fetch import backoff_delay, fetch_pages
+
+RECORDS = make_records(1050)
+
+
+def _fetch(server, limit=100, **kwargs):
+    pages = {}
+    lock = threading.Lock()
+
+    def on_page(offset, records):
+        with lock:
+            assert offset not in pages
+            pages[offset] = records
+        return len(records)
+
+    kwargs.setdefault("max_rps", 0)
+    kwargs.setdefault("backoff_base", 0.01)
+    stats = asyncio.run(fetch_pages(server.url, {"api-key": "test", "format": "json"}, on_page,
+                                    limit=limit, **kwargs))
+    return pages, stats
+
+
+def test_all_pages_are_fetched_with_bounded_concurrency():
+    with FixtureServer(RECORDS, latency=0.02) as server:
+        pages, stats = _fetch(server, concurrency=4)
+    assert sorted(pages) == list(range(0, 1050, 100))
+    assert [r for offset in sorted(pages) for r in pages[offset]] == RECORDS
+    assert stats["written"] == stats["records"] == 1050 and stats["pages"] == 11
+    assert 1 < server.max_in_flight <= 4
+    # Nothing is requested past the advertised total
+    assert stats["requests"] == 11 and stats["failed_offsets"] == []
+
+
+def test_transient_failures_are_retried():
+    failures = {0: [503], 300: [429, 502], 700: ["drop", 500]}
+    with FixtureServer(RECORDS, failures=failures, retry_after=0) as server:
+        pages, stats = _fetch(server, concurrency=3)
+    assert len(pages) == 11 and stats["records"] == 1050
+    assert stats["retries"] == 5 and stats["failed_offsets"] == []
+
+
+def test_page_failing_every_retry_does_not_stop_the_run():
+    with FixtureServer(RECORDS, failures={500: [503] * 10}) as server:
+        pages, stats = _fetch(server, concurrency=2, retries=2)
+    assert stats["failed_offsets"] == [500]
+    assert sorted(pages) == [o for o in range(0, 1050, 100) if o != 500]
+
+
+def test_stop_when_skips_later_offsets():
+    with FixtureServer(RECORDS) as server:
+        pages, _ = _fetch(server, concurrency=1, stop_when=lambda records: records[0] == RECORDS[200])
+    assert sorted(pages) == [0, 100, 200]
+
+
+def test_pages_in_flight_past_stop_when_are_dropped():
+    # 300 and 400 are requested alongside 200 but only answer after it stopped the run
+    failures = {300: [503], 400: [503]}
+    with FixtureServer(RECORDS, failures=failures, retry_after=0.2) as server:
+        pages, stats = _fetch(server, concurrency=4, stop_when=lambda records: records[0] == RECORDS[200])
+    assert sorted(pages) == [0, 100, 200]
+    assert stats["dropped_pages"] >= 2 and stats["pages"] == 3
+
+
+def test_rate_limit_spaces_requests():
+    with FixtureServer(RECORDS[:500]) as server:
+        started = time.perf_counter()
+        _fetch(server, concurrency=4, max_rps=20)
+    # 5 pages (the total is known from the first), started at most 20 a second
+    assert time.perf_counter() - started >= 4 / 20
+
+
+def test_slow_writer_gets_queued_pages_as_one_batch():
+    batches = []
+
+    def on_batch(pages):
+        time.sleep(0.05)
+        batches.append([offset for offset, _ in pages])
+        return sum(len(records) for _, records in pages)
+
+    with FixtureServer(RECORDS) as server:
+        stats = asyncio.run(fetch_pages(server.url, {}, limit=100, concurrency=4, max_rps=0,
+                                        on_batch=on_batch, batch_rows=400))
+    assert sorted(o for batch in batches for o in batch) == list(range(0, 1050, 100))
+    assert max(len(batch) for batch in batches) > 1 and all(len(batch) <= 4 for batch in batches)
+    assert stats["pages"] == 11 and stats["written"] == 1050
+
+
+def test_backoff_is_jittered_and_capped():
+    delays = [backoff_delay(attempt, base=1.0, cap=8.0) for attempt in range(10) for _ in range(20)]
+    assert all(0 <= d <= 8.0 for d in delays) and len(set(delays)) > 1
@@ -0,0 +1,188 @@
+"""
+Partitioned market_prices checks: migration from the old single table, and
+an EXPLAIN regression over the API's hot queries, which fails if any of them
+plans a sequential scan over a populated partition. Runs against a scratch
+Postgres database (SCHEMA_TEST_DB_NAME, default SmartAgriSchemaTest) and is
+skipped when Postgres is unreachable.
+
+Usage:
+    cd backend
+    python -m pytest test_market_schema.py
+"""
+import os
+from datetime import date
+
+import psycopg2.errors
+import pytest
+
+import fetch_market_prices as fmp
+from benchmarks.common import seed_market_prices
+from utils import market_rollup, market_schema
+from utils.market_history import (
+    BATCH_HISTORY_QUERY,
+    CANONICAL_HISTORY_QUERY,
+    mandi_page_end_query,
+    mandi_prices_query,
+    price_trend_query,
+)
+from utils.market_loader import load_market_frame, parse_market_frame
+
+# Partitions holding fewer rows than this may be scanned; the planner rightly prefers it there
+SEQ_SCAN_ROW_LIMIT = 1000
+
+OLD_SCHEMA = """
+CREATE TABLE market_prices (
+    id SERIAL PRIMARY KEY, state TEXT, district TEXT, market TEXT, commodity TEXT, variety TEXT, grade TEXT,
+    arrival_date DATE, min_price NUMERIC, max_price NUMERIC, modal_price NUMERIC,
+    UNIQUE(state, district, market, commodity, variety, arrival_date)
+)
+"""
+
+
+class Names:
+    """EntityDictionary stand-in: every name resolves (canonical) or none does (patterns)."""
+
+    def __init__(self, resolves: bool):
+        self.resolves = resolves
+
+    def canonical(self, col, value):
+        return value if self.resolves else None
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    """The scratch database without market tables, with fetch_market_prices pointed at it."""
+    monkeypatch.setattr(fmp, "DB_NAME", os.getenv("SCHEMA_TEST_DB_NAME", "SmartAgriSchemaTest"))
+    fmp.create_database_if_not_exists()
+    conn = fmp.get_db_connection()
+    if conn is None:
+        pytest.skip("Postgres unreachable")
+    with conn.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS market_prices, market_prices_legacy, market_price_daily_rollup CASCADE")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def _seq_scans(cur, query, params):
+    """Populated relations the plan reads with a sequential scan."""
+    cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+    plan = cur.fetchone()[0][0]["Plan"]
+    relations, stack = [], [plan]
+    while stack:
+        node = stack.pop()
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name", "").startswith("market_price"):
+            relations.append(node["Relation Name"])
+        stack.extend(node.get("Plans", []))
+    if not relations:
+        return []
+    cur.execute("SELECT relname FROM pg_class WHERE relname = ANY(%s) AND reltuples > %s",
+                (relations, SEQ_SCAN_ROW_LIMIT))
+    return sorted(row[0] for row in cur.fetchall())
+
+
+def test_migration_keeps_rows_and_ids(conn):
+    with conn.cursor() as cur:
+        cur.execute(OLD_SCHEMA)
+        cur.execute("""
+            INSERT INTO market_prices (state, district, market, commodity, variety, grade, arrival_date, modal_price)
+            SELECT 'S', 'D', 'M', 'C' || (i % 7), 'V', 'FAQ', DATE '2024-01-15' + (i / 7), 1000 + i
+            FROM generate_series(0, 699) i
+        """)
+    conn.commit()
+    result = market_schema.migrate(conn, drop_legacy=True)
+    assert result["migrated"] and result["copied"] == result["rows"] == 700
+    # The daily rollup is built from the migrated rows, before any sync runs
+    assert result["rollup_created"]
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*), sum(price_count) FROM market_price_daily_rollup")
+        assert cur.fetchone() == (700, 700)
+        assert market_schema.table_kind(cur) == "partitioned"
+        info = market_schema.status(cur)
+        assert info["partitions"]["market_prices_p202402"] > 0
+        assert "market_prices_commodity_state_district_date_idx" in info["indexes"]
+        cur.execute("SELECT min(id), max(id), count(*) FROM market_prices")
+        assert cur.fetchone() == (1, 700, 700)
+        # New rows get fresh ids, and a month before the migrated range gets its own partition
+        records = [{"state": "S", "district": "D", "market": "M", "commodity": "C1", "variety": "V",
+                    "arrival_date": "31/12/2023", "modal_price": "900"}]
+        assert load_market_frame(cur, parse_market_frame(records)) == (1, 0)
+        cur.execute("SELECT id, tableoid::regclass::text FROM market_prices WHERE arrival_date = '2023-12-31'")
+        assert cur.fetchone() == (701, "market_prices_p202312")
+    conn.commit()
+    assert market_schema.migrate(conn) == {"migrated": False, "indexes": [], "rollup_created": False}
+
+
+def test_rollup_is_created_for_an_existing_table(conn):
+    with conn.cursor() as cur:
+        market_schema.create_schema(cur)
+        cur.execute("""
+            INSERT INTO market_prices (state, district, market, commodity, variety, arrival_date, modal_price)
+            SELECT 'S', 'D', 'M' || i, 'C', 'V', DATE '2024-01-15', 1000 + 100 * i FROM generate_series(0, 2) i
+        """)
+    conn.commit()
+    # As an API worker does on startup against a database set up before the rollup existed
+    assert market_rollup.ensure_rollup(conn)
+    assert not market_rollup.ensure_rollup(conn)
+    with conn.cursor() as cur:
+        cur.execute("SELECT price_sum, price_count FROM market_price_daily_rollup")
+        assert cur.fetchall() == [(3300, 3)]
+    conn.commit()
+
+
+class PrivilegeCursor:
+    """pg_trgm is available but the role may not create extensions."""
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        self.statements.append(statement)
+        if statement.startswith("CREATE EXTENSION"):
+            raise psycopg2.errors.InsufficientPrivilege("permission denied to create extension")
+
+    def fetchone(self):
+        return (1,) if "pg_available_extensions" in self.statements[-1] else None
+
+
+def test_trgm_without_privilege_keeps_the_transaction():
+    cur = PrivilegeCursor()
+    assert market_schema.has_trgm(cur) is False
+    assert cur.statements[-3:] == ["SAVEPOINT create_trgm", "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+                                   "ROLLBACK TO SAVEPOINT create_trgm"]
+
+
+def test_hot_queries_use_indexes(conn):
+    seed_market_prices(conn, states=5, districts=4, markets=3, commodities=20, varieties=2, days=75)
+    day = date.today()
+    with conn.cursor() as cur:
+        trgm = market_schema.has_trgm(cur)
+        series = ([0, 1], ["State1", "State2"], ["District1_1", "District2_9"], ["District1_1", "District2_9"],
+                  ["Market1_1_1 APMC", "Unknown APMC"], ["Commodity3", "Commodity4"], ["Variety1", "Variety1"])
+        queries = {
+            "history": (CANONICAL_HISTORY_QUERY, series),
+            "trend_district": price_trend_query(Names(True), "Commodity3", "State1", "District1_2", 90),
+            "trend_state": price_trend_query(Names(True), "Commodity3", "State1", None, 90),
+            "mandi": mandi_prices_query(Names(True), None, None, 100),
+            "mandi_state": mandi_prices_query(Names(True), "State2", None, 100),
+            "mandi_district": mandi_prices_query(Names(True), "State2", "District2_3", 100),
+            "mandi_next_page": mandi_prices_query(Names(True), None, None, 100, after=(day, 10 ** 6)),
+            "mandi_district_next_page": mandi_prices_query(Names(True), "State2", "District2_3", 100,
+                                                           after=(day, 10 ** 6)),
+            "mandi_page_end": mandi_page_end_query(Names(True), "State2", "District2_3", 100, after=(day, 10 ** 6)),
+        }
+        if trgm:
+            patterns = tuple([f"%{v}%" for v in values] for values in series[1:])
+            queries.update({
+                "history_patterns": (BATCH_HISTORY_QUERY, (series[0],) + patterns),
+                "trend_patterns": price_trend_query(Names(False), "modity3", "State1", "rict1_2", 90),
+                "mandi_patterns": mandi_prices_query(Names(False), "State2", "District2_3", 100),
+            })
+        else:
+            print("pg_trgm not available, skipping the ILIKE pattern queries")
+        failures = {name: scans for name, (query, params) in queries.items()
+                    if (scans := _seq_scans(cur, query, list(params)))}
+        cur.execute("SELECT count(*) FROM market_prices WHERE arrival_date = %s", (day,))
+        assert cur.fetchone()[0] > 0
+    conn.rollback()
+    assert not failures, f"sequential scans: {failures}"
@@ -0,0 +1,152 @@
+"""
+Incremental sync checks for fetch_market_prices.py, against the local fixture
+server and a scratch Postgres database (SYNC_TEST_DB_NAME, default
+SmartAgriSyncTest). Database checks are skipped when Postgres is unreachable.
+
+Usage:
+    cd backend
+    python -m pytest test_market_sync.py
+"""
+import os
+from datetime import date, timedelta
+from functools import partial
+
+import pandas as pd
+import pytest
+
+import fetch_market_prices as fmp
+from benchmarks.mandi_fixture import FixtureServer, make_records
+from utils import market_fetch
+from utils.market_loader import load_market_frame, parse_market_frame
+
+TODAY = date.today()
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    """Fresh market tables in the scratch database, with fetch_market_prices pointed at it."""
+    monkeypatch.setattr(fmp, "DB_NAME", os.getenv("SYNC_TEST_DB_NAME", "SmartAgriSyncTest"))
+    monkeypatch.setattr(fmp, "PAGE_SIZE", 100)
+    monkeypatch.setattr(fmp, "fetch_pages", partial(market_fetch.fetch_pages, retries=1, max_rps=0, backoff_base=0.01))
+    fmp.create_database_if_not_exists()
+    conn = fmp.get_db_connection()
+    if conn is None:
+        pytest.skip("Postgres unreachable")
+    with conn.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS market_prices, market_sync_state, market_price_daily_rollup")
+    conn.commit()
+    fmp.create_table_if_not_exists(conn)
+    yield conn
+    conn.close()
+
+
+def _count(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM market_prices")
+        return cur.fetchone()[0]
+
+
+def _unique(records):
+    """One record per market_prices key, so each page upserts distinct rows."""
+    seen = {}
+    for r in records:
+        seen.setdefault((r["state"], r["district"], r["market"], r["commodity"], r["variety"], r["arrival_date"]), r)
+    return list(seen.values())
+
+
+def test_plan():
+    fresh = {"watermark": None, "full_run": False, "run_date": None, "next_offset": None}
+    assert fmp.plan_sync(fresh, TODAY) == [(None, 0)]
+    synced = dict(fresh, watermark=TODAY - timedelta(days=1))
+    assert fmp.plan_sync(synced, TODAY) == [(TODAY - timedelta(days=d), 0) for d in (3, 2, 1, 0)]
+    assert fmp.plan_sync(synced, TODAY, full=True) == [(None, 0)]
+    crashed = dict(synced, run_date=TODAY - timedelta(days=1), next_offset=300)
+    assert fmp.plan_sync(crashed, TODAY) == [(TODAY - timedelta(days=1), 300), (TODAY, 0)]
+    assert fmp.plan_sync(dict(fresh, full_run=True, next_offset=700), TODAY) == [(None, 700)]
+
+
+def test_parse_market_frame():
+    records = [
+        {"state": "Kerala", "district": "Idukki", "market": "Kattappana", "commodity": "Cardamom",
+         "variety": "Bold", "grade": "FAQ", "arrival_date": "05/03/2024",
+         "min_price": "1000", "max_price": "NR", "modal_price": "1500.50"},
+        {"state": "Kerala", "arrival_date": "2024-03-05", "modal_price": "1"},
+        dict(commodity="Tea\tLeaf", arrival_date="06/03/2024", modal_price=900, variety=""),
+    ]
+    df = parse_market_frame(records + [dict(records[0], modal_price="1600")])
+    assert len(df) == 2
+    # The later duplicate wins; the ISO-dated record is dropped
+    cardamom = df[df['commodity'] == "Cardamom"].iloc[0]
+    assert cardamom['arrival_date'] == pd.Timestamp("2024-03-05")
+    assert cardamom['max_price'] is None and cardamom['modal_price'] == "1600"
+    assert parse_market_frame([]).empty
+
+
+def test_copy_load_round_trips_text_and_nulls(conn):
+    odd = {"state": "S\\1", "district": "D\t2", "market": "M\n3", "commodity": "C", "variety": "",
+           "grade": None, "arrival_date": "06/03/2024", "min_price": "NR", "max_price": "12.5", "modal_price": 10}
+    with conn:
+        with conn.cursor() as cur:
+            assert load_market_frame(cur, parse_market_frame([odd])) == (1, 0)
+            assert load_market_frame(cur, parse_market_frame([odd])) == (0, 0)
+            assert load_market_frame(cur, parse_market_frame([dict(odd, modal_price="11")])) == (0, 1)
+            cur.execute("SELECT state, district, market, variety, grade, min_price, max_price, modal_price "
+                        "FROM market_prices")
+            row = cur.fetchone()
+    assert row[:5] == ("S\\1", "D\t2", "M\n3", "", None)
+    assert row[5] is None and float(row[6]) == 12.5 and float(row[7]) == 11
+
+
+def _rollup_is_current(conn):
+    """The incrementally maintained rollup equals one aggregated from scratch."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT commodity, state, district, arrival_date, price_sum, price_count, min_price, max_price
+            FROM market_price_daily_rollup ORDER BY 1, 2, 3, 4
+        """)
+        rollup = cur.fetchall()
+        cur.execute("""
+            SELECT commodity, state, district, arrival_date,
+                   SUM(modal_price), COUNT(modal_price), MIN(min_price), MAX(max_price)
+            FROM market_prices GROUP BY 1, 2, 3, 4 ORDER BY 1, 2, 3, 4
+        """)
+        return len(rollup) > 0 and rollup == cur.fetchall()
+
+
+def test_incremental_sync_only_fetches_new_days_and_upserts(conn, monkeypatch):
+    history = _unique(make_records(1000, days=10, end=TODAY - timedelta(days=1)))
+    with FixtureServer(history) as server:
+        monkeypatch.setattr(fmp, "BASE_URL", server.url)
+        first = fmp.sync_market_prices(conn)
+    assert first["complete"] and first["inserted"] == _count(conn) == len(history)
+    assert fmp.load_sync_state(conn)["watermark"] == TODAY - timedelta(days=1)
+
+    new = _unique(make_records(150, days=1, seed=7, end=TODAY))
+    revised = dict(history[0], modal_price=str(int(history[0]["modal_price"]) + 55))
+    with FixtureServer(new + [revised] + history[1:]) as server:
+        monkeypatch.setattr(fmp, "BASE_URL", server.url)
+        second = fmp.sync_market_prices(conn)
+    assert second["complete"] and second["inserted"] == len(new) and second["updated"] == 1
+    # Only today and the overlap days were requested, never the whole resource
+    assert len(server.requests) < 10
+    assert fmp.load_sync_state(conn)["watermark"] == TODAY
+    assert _rollup_is_current(conn)
+
+
+def test_interrupted_sync_resumes_from_checkpoint(conn, monkeypatch):
+    records = _unique(make_records(1000, days=10))
+    with FixtureServer(records, failures={600: [503] * 5}) as server:
+        monkeypatch.setattr(fmp, "BASE_URL", server.url)
+        first = fmp.sync_market_prices(conn)
+    state = fmp.load_sync_state(conn)
+    assert not first["complete"] and state["full_run"] and state["next_offset"] == 600
+    assert state["watermark"] is None
+
+    with FixtureServer(records) as server:
+        monkeypatch.setattr(fmp, "BASE_URL", server.url)
+        second = fmp.sync_market_prices(conn)
+    assert second["complete"] and min(offset for offset, _ in server.requests) == 600
+    assert _count(conn) == len(records)
+    state = fmp.load_sync_state(conn)
+    assert state["next_offset"] is None and state["watermark"] == TODAY
+    assert _rollup_is_current(conn)
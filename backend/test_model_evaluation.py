@@ -0,0 +1,98 @@
+"""
+Fold layout and latency checks for utils.model_evaluation, and the
+budgeted model selection in train_model.
+
+Usage:
+    cd backend
+    python -m pytest test_model_evaluation.py
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import train_model
+from benchmarks.common import make_synthetic_model, make_synthetic_training_data
+from utils.compiled_forest import CompiledForest
+from utils.price_forecast import FEATURE_NAMES
+from utils.model_evaluation import (
+    feature_matrix,
+    fit_and_score,
+    measure_latency,
+    parse_params,
+    rolling_origin_folds,
+)
+
+warnings.filterwarnings('ignore')
+
+DATES = pd.date_range("2024-01-01", "2024-03-31")
+
+
+def test_folds_never_train_on_the_future():
+    folds = rolling_origin_folds(DATES, n_folds=4, test_days=7, min_train_days=14)
+    assert [f.index for f in folds] == [0, 1, 2, 3]
+    assert folds[-1].test_end == pd.Timestamp("2024-04-01")
+    for earlier, later in zip(folds, folds[1:]):
+        assert earlier.test_end == later.cutoff
+    assert all(f.cutoff > DATES.min() for f in folds)
+
+
+def test_folds_without_enough_history_are_dropped():
+    folds = rolling_origin_folds(DATES[:30], n_folds=4, test_days=7, min_train_days=14)
+    assert len(folds) == 2
+    try:
+        rolling_origin_folds(DATES[:10], n_folds=2, test_days=7, min_train_days=14)
+    except ValueError:
+        return
+    assert False, "expected ValueError"
+
+
+def test_parse_params():
+    assert parse_params("n_estimators=50, max_depth=None,max_features=sqrt,min_samples_leaf=0.01") == {
+        "n_estimators": 50, "max_depth": None, "max_features": "sqrt", "min_samples_leaf": 0.01,
+    }
+
+
+def test_fit_and_score_reports_served_cost():
+    df = make_synthetic_training_data(3000)
+    X, y = feature_matrix(df), df['modal_price'].to_numpy()
+    result, forest = fit_and_score({"n_estimators": 5, "max_depth": 6}, X[:2000], y[:2000], X[2000:], y[2000:])
+    assert result["trees"] == 5 and result["max_depth"] <= 6 and result["test_rows"] == 1000
+    assert result["r2"] > 0.5 and result["size_mb"] > 0
+    latency = measure_latency(forest, X, batch_size=100, repeat=20)
+    assert latency["single"]["p99_ms"] >= latency["single"]["p50_ms"] > 0
+    assert latency["batch"]["rows"] == 100
+
+
+def test_search_picks_most_accurate_candidate_within_budget():
+    df = make_synthetic_training_data(4000)
+    df['arrival_date'] = pd.Timestamp("2024-01-01") + pd.to_timedelta(df.index % 30, unit="D")
+    grid = train_model.SEARCH_GRID
+    train_model.SEARCH_GRID = {'n_estimators': [4, 8], 'max_depth': [3, None], 'min_samples_leaf': [1]}
+    try:
+        params, selection = train_model.select_model_params(df, p99_budget_ms=1e6, size_budget_mb=0.05)
+    finally:
+        train_model.SEARCH_GRID = grid
+    candidates = selection["candidates"]
+    within = [name for name, c in candidates.items() if c["within_budget"]]
+    assert selection["within_budget"] and selection["chosen"] in within
+    assert all(c["size_mb"] <= 0.05 for c in (candidates[name] for name in within))
+    assert selection["holdout"]["mae"] == min(candidates[name]["mae"] for name in within)
+    assert params == selection["params"] and params["max_depth"] == 3
+
+
+def test_final_refit_is_trimmed_to_the_size_budget():
+    model = make_synthetic_model(n_estimators=10, n_rows=2000, seed=3)
+    size_mb = CompiledForest.from_sklearn(model).nbytes / 1e6
+    assert train_model.trim_to_size_budget(model, size_mb) == size_mb and model.n_estimators == 10
+
+    trimmed_mb = train_model.trim_to_size_budget(model, size_mb * 0.55)
+    assert trimmed_mb <= size_mb * 0.55 and model.n_estimators == len(model.estimators_) < 10
+    # The first n trees are the forest sklearn fits with n_estimators=n
+    fewer = make_synthetic_model(n_estimators=model.n_estimators, n_rows=2000, seed=3)
+    X = make_synthetic_training_data(200, seed=4)[FEATURE_NAMES]
+    np.testing.assert_array_equal(model.predict(X), fewer.predict(X))
+
+    with pytest.raises(ValueError):
+        train_model.trim_to_size_budget(model, size_mb / 1000)
@@ -0,0 +1,116 @@
+"""
+Publish, swap, load and shadow checks for utils.model_registry.
+
+Usage:
+    cd backend
+    python -m pytest test_model_registry.py
+"""
+import os
+import shutil
+import tempfile
+import time
+import warnings
+from contextlib import contextmanager
+from datetime import datetime
+from types import SimpleNamespace
+
+import joblib
+from sklearn.preprocessing import LabelEncoder
+
+from benchmarks.common import make_synthetic_model
+from utils import entity_dictionary
+from utils.model_registry import ModelRegistry, publish_model, read_manifest, set_active_version, version_paths
+
+warnings.filterwarnings('ignore')
+
+REGISTRY = tempfile.mkdtemp()
+ENCODERS = os.path.join(REGISTRY, "encoders.pkl")
+joblib.dump({col: LabelEncoder().fit(["A", "B"]) for col in
+             ['state', 'district', 'market', 'commodity', 'variety', 'grade']}, ENCODERS)
+
+MODEL_A = make_synthetic_model(n_estimators=5, n_rows=2000, seed=1)
+MODEL_B = make_synthetic_model(n_estimators=5, n_rows=2000, seed=2)
+VERSION_A = publish_model(MODEL_A, ENCODERS, {"r2": 0.9}, activate=True, registry_dir=REGISTRY)
+VERSION_B = publish_model(MODEL_B, ENCODERS, registry_dir=REGISTRY)
+
+
+def test_publish_is_idempotent():
+    assert publish_model(MODEL_A, ENCODERS, registry_dir=REGISTRY) == VERSION_A
+    manifest = read_manifest(REGISTRY)
+    assert set(manifest["versions"]) == {VERSION_A, VERSION_B}
+    assert manifest["active"] == VERSION_A
+
+
+def test_swap_keeps_in_flight_model():
+    registry = ModelRegistry(REGISTRY)
+    swaps = []
+    registry.on_swap.append(lambda previous, version: swaps.append((previous, version)))
+    in_flight = registry.active()
+    assert in_flight.version == VERSION_A and in_flight.model.memory_mapped
+
+    set_active_version(VERSION_B, REGISTRY)
+    registry.reload()
+    assert registry.version == VERSION_B
+    assert swaps == [(VERSION_A, VERSION_B)]
+    assert in_flight.model.predict([[0] * 9])[0] == MODEL_A.predict([[0] * 9])[0]
+    set_active_version(VERSION_A, REGISTRY)
+
+
+def test_unknown_version_rejected():
+    try:
+        set_active_version("missing", REGISTRY)
+    except ValueError:
+        return
+    assert False, "expected ValueError"
+
+
+def test_missing_version_artifacts_do_not_fall_back(monkeypatch):
+    registry_dir = tempfile.mkdtemp()
+    version = publish_model(MODEL_A, ENCODERS, activate=True, registry_dir=registry_dir)
+    shutil.rmtree(version_paths(version, registry_dir)["forest"])
+    # The unversioned model in the working directory must not be served under the version's name
+    monkeypatch.chdir(tempfile.mkdtemp())
+    joblib.dump(MODEL_B, "price_model.pkl")
+    registry = ModelRegistry(registry_dir)
+    assert registry.active() is None
+    assert "No compiled price model" in registry.last_error
+
+
+class _Cursor:
+    def execute(self, query, params=None):
+        self.rows = [("Bazaar A", 10)] if "SELECT market," in query else []
+
+    def fetchall(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_shadow_scoring_records_deltas(monkeypatch):
+    @contextmanager
+    def market_db():
+        yield SimpleNamespace(cursor=_Cursor)
+
+    monkeypatch.setattr(entity_dictionary, "market_db", market_db)
+    monkeypatch.setattr(entity_dictionary, "load_aliases", lambda: {"commodity": {"bee": "B"}})
+    publish_model(MODEL_B, ENCODERS, shadow=True, registry_dir=REGISTRY)
+    registry = ModelRegistry(REGISTRY)
+    registry.active()
+    # The shadow resolves names from market_prices and aliases like the live dictionary
+    assert registry._shadow_entities.canonical('market', "bazaar a") == "Bazaar A"
+    assert registry._shadow_entities.encode('commodity', "Bee") == 1
+    req = SimpleNamespace(state="A", district="B", market="A", commodity="B", variety="A", grade="A")
+    live = [[{"predicted_price": 1000.0}] * 3]
+    assert registry.submit_shadow([req], [[1000.0, 990.0]], 3, datetime(2024, 1, 1), live, 1.0)
+    for _ in range(50):
+        if registry.shadow_stats.scored:
+            break
+        time.sleep(0.05)
+    summary = registry.shadow_stats.summary()
+    assert summary["version"] == VERSION_B and summary["scored"] == 1 and summary["errors"] == 0
+    assert summary["mean_abs_price_delta"] is not None
+    registry.shutdown()
@@ -0,0 +1,136 @@
+"""
+Routing, LRU and registry checks for utils.model_shards.
+
+Usage:
+    cd backend
+    python -m pytest test_model_shards.py
+"""
+import os
+import shutil
+import tempfile
+import threading
+import warnings
+
+import joblib
+import numpy as np
+from sklearn.preprocessing import LabelEncoder
+
+from benchmarks.common import make_synthetic_model
+from utils.compiled_forest import CompiledForest
+from utils.model_registry import ModelRegistry, publish_model
+from utils.model_shards import (
+    ShardedModel,
+    read_shard_index,
+    replace_shards,
+    shard_dirname,
+    with_shards,
+    write_shard_index,
+)
+from utils.price_forecast import UNSEEN_COMMODITY, forecast_arrays
+
+warnings.filterwarnings('ignore')
+
+ROOT = tempfile.mkdtemp()
+GLOBAL = CompiledForest.from_sklearn(make_synthetic_model(n_estimators=4, n_rows=2000, seed=1))
+GLOBAL.save(os.path.join(ROOT, "price_forest"))
+SHARDS = {code: CompiledForest.from_sklearn(make_synthetic_model(n_estimators=3, n_rows=1000, seed=10 + code))
+          for code in (3, 5, 7)}
+for code, forest in SHARDS.items():
+    forest.save(os.path.join(ROOT, "price_shards", shard_dirname(code)))
+write_shard_index(os.path.join(ROOT, "price_shards"),
+                  {code: {"version": f.digest()} for code, f in SHARDS.items()}, {"n_estimators": 3}, 1000)
+
+
+def _rows(codes):
+    return [(1, 2, 3, code, 1, 0) for code in codes]
+
+
+def test_forecast_routes_each_commodity_to_its_shard():
+    model = with_shards(GLOBAL, os.path.join(ROOT, "price_forest"))
+    assert isinstance(model, ShardedModel)
+    codes = [3, 9, 5, 3, 11]
+    histories = [[1000.0 + 10 * i, 990.0] for i in range(len(codes))]
+    _, points, stds = forecast_arrays(model, _rows(codes), histories, 5)
+    for i, code in enumerate(codes):
+        expected = SHARDS.get(code, GLOBAL)
+        _, p, s = forecast_arrays(expected, _rows([code]), [histories[i]], 5)
+        np.testing.assert_array_equal(points[i], p[0])
+        np.testing.assert_array_equal(stds[i], s[0])
+    assert model.stats()["global_fallbacks"] == 2
+
+
+def test_unseen_commodity_is_served_by_the_global_model():
+    root = tempfile.mkdtemp()
+    SHARDS[3].save(os.path.join(root, shard_dirname(0)))
+    write_shard_index(root, {0: {"version": SHARDS[3].digest()}}, {"n_estimators": 3}, 1000)
+    model = ShardedModel(GLOBAL, root, read_shard_index(root))
+    histories = [[1000.0, 990.0], [1000.0, 990.0]]
+    _, points, _ = forecast_arrays(model, _rows([0, UNSEEN_COMMODITY]), histories, 5)
+    # Class 0 gets its shard; the unseen commodity gets the global forest, fed 0 as before
+    np.testing.assert_array_equal(points[0], forecast_arrays(SHARDS[3], _rows([0]), histories[:1], 5)[1][0])
+    np.testing.assert_array_equal(points[1], forecast_arrays(GLOBAL, _rows([0]), histories[:1], 5)[1][0])
+    assert model.stats()["global_fallbacks"] == 1
+
+
+def test_lru_keeps_at_most_max_resident_shards():
+    model = with_shards(GLOBAL, os.path.join(ROOT, "price_forest"), max_resident=2)
+    # 3 is used again before 7 arrives, so 5 is evicted first, then 3
+    for code in (3, 5, 3, 7, 5):
+        assert model.shard_for(code) is not None
+    stats = model.stats()
+    assert stats["resident"] == 2 and stats["loads"] == 4 and stats["evictions"] == 2 and stats["hits"] == 1
+    assert model.shard_for(42) is None
+
+
+def test_counters_add_up_under_concurrent_lookups():
+    model = with_shards(GLOBAL, os.path.join(ROOT, "price_forest"), max_resident=2)
+    codes = [3, 5, 7, 9] * 50
+
+    def lookup():
+        for code in codes:
+            model.shard_for(code)
+
+    threads = [threading.Thread(target=lookup) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = model.stats()
+    assert stats["global_fallbacks"] == 8 * 50
+    assert stats["hits"] + stats["loads"] == 8 * 150
+    assert stats["resident"] <= 2
+
+
+def test_replace_shards_swaps_the_whole_directory():
+    root = tempfile.mkdtemp()
+    path = os.path.join(root, "price_shards")
+    shutil.copytree(os.path.join(ROOT, "price_shards"), path)
+    staging = tempfile.mkdtemp(dir=root)
+    SHARDS[5].save(os.path.join(staging, shard_dirname(5)))
+    version = write_shard_index(staging, {5: {"version": SHARDS[5].digest()}}, {"n_estimators": 3}, 1000)
+
+    replace_shards(staging, path)
+    assert read_shard_index(path)["version"] == version
+    assert sorted(os.listdir(path)) == ["c5", "index.json"]
+    assert sorted(os.listdir(root)) == ["price_shards"]
+
+
+def test_without_shards_the_global_model_is_served():
+    assert with_shards(GLOBAL, os.path.join(tempfile.mkdtemp(), "price_forest")) is GLOBAL
+
+
+def test_registry_publishes_and_loads_shards():
+    registry_dir = os.path.join(ROOT, "registry")
+    encoders = os.path.join(ROOT, "encoders.pkl")
+    joblib.dump({col: LabelEncoder().fit(["A", "B"]) for col in
+                 ['state', 'district', 'market', 'commodity', 'variety', 'grade']}, encoders)
+    plain = publish_model(GLOBAL, encoders, registry_dir=registry_dir)
+    sharded = publish_model(GLOBAL, encoders, activate=True, registry_dir=registry_dir,
+                            shards_path=os.path.join(ROOT, "price_shards"))
+    assert plain != sharded
+    assert read_shard_index(os.path.join(registry_dir, sharded, "price_shards"))["version"]
+
+    registry = ModelRegistry(registry_dir)
+    assert isinstance(registry.active().model, ShardedModel)
+    assert registry.status()["shards"]["shards"] == 3
+    registry.shutdown()
@@ -1,5 +1,9 @@
+import argparse
 import requests
 import json
+import time
+
+import numpy as np
 
 url = "http://localhost:8000/predict-price"
 
@@ -8,15 +12,73 @@ payload = {
     "state": "Assam",
     "district": "Nagaon",
     "market": "Dhing APMC",
-    "commodity": "Jute", 
+    "commodity": "Jute",
     "variety": "TD-5",
     "grade": "FAQ"
 }
 
-try:
-    response = requests.post(url, json=payload)
-    print("Status Code:", response.status_code)
-    print("Response JSON:")
-    print(json.dumps(response.json(), indent=2))
-except Exception as e:
-    print("Error:", e)
+
+def parse_server_timing(header):
+    stages = {}
+    for part in (header or "").split(","):
+        name, _, dur = part.strip().partition(";dur=")
+        if name and dur:
+            stages[name] = float(dur)
+    return stages
+
+
+def benchmark(n, days, vary_days=False):
+    """Send n requests asking for Server-Timing and print the per-stage breakdown."""
+    samples = {}
+    client_ms = []
+    # Repeats of one payload are answered from the forecast cache; "seen" shows how
+    # many requests actually reached each stage
+    for i in range(n):
+        body = dict(payload, days=(i % 30) + 1 if vary_days else days)
+        started = time.perf_counter()
+        response = requests.post(url, json=body, headers={"X-Server-Timing": "1"})
+        client_ms.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            print(f"Request {i} failed: {response.status_code} {response.text}")
+            return
+        for stage, ms in parse_server_timing(response.headers.get("Server-Timing")).items():
+            samples.setdefault(stage, []).append(ms)
+
+    horizon = "1-30 day horizons" if vary_days else f"{days}-day horizon"
+    print(f"\n{n} requests, {horizon} (ms, from Server-Timing)")
+    print(f"{'stage':>20} {'p50':>9} {'p95':>9} {'p99':>9} {'seen':>6}")
+    for stage, values in samples.items():
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        print(f"{stage:>20} {p50:>9.3f} {p95:>9.3f} {p99:>9.3f} {len(values):>6}")
+    p50, p95, p99 = np.percentile(client_ms, [50, 95, 99])
+    print(f"{'client round trip':>20} {p50:>9.3f} {p95:>9.3f} {p99:>9.3f} {n:>6}")
+
+    # Server-side histograms also include traffic from other clients
+    metrics = requests.get(url.replace("/predict-price", "/metrics/latency")).json()
+    print("\nServer histograms (/metrics/latency):")
+    for name, stats in metrics["stages"].items():
+        if name.startswith("predict_price."):
+            print(f"{name:>36} p50={stats['p50_ms']} p95={stats['p95_ms']} p99={stats['p99_ms']} n={stats['count']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Call /predict-price once, or benchmark it with --bench N")
+    parser.add_argument("--bench", type=int, default=0, help="Number of requests for the stage breakdown")
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--vary-days", action="store_true",
+                        help="Cycle through 1-30 day horizons so the first 30 requests miss the forecast cache")
+    parser.add_argument("--payload", help="JSON request body to use instead of the default one")
+    args = parser.parse_args()
+    if args.payload:
+        payload = json.loads(args.payload)
+
+    if args.bench:
+        benchmark(args.bench, args.days, args.vary_days)
+    else:
+        try:
+            response = requests.post(url, json=payload)
+            print("Status Code:", response.status_code)
+            print("Response JSON:")
+            print(json.dumps(response.json(), indent=2))
+        except Exception as e:
+            print("Error:", e)
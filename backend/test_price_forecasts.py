@@ -0,0 +1,139 @@
+"""
+Precomputed forecast checks: the lookup matches canonical names the way
+fetch_price_histories does, never serves a request with an unresolved
+name or a series with a newer arrival than it was forecast from, and the
+rows the nightly job writes round trip through it; active series carry
+their latest 7 prices whatever their date. Runs
+against a scratch Postgres database (FORECAST_TEST_DB_NAME, default
+SmartAgriForecastTest) and is skipped when Postgres is unreachable.
+
+Usage:
+    cd backend
+    python -m pytest test_price_forecasts.py
+"""
+import os
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+from psycopg2 import extras
+from sklearn.preprocessing import LabelEncoder
+
+import fetch_market_prices as fmp
+from api import PredictionRequest
+from utils.market_loader import load_market_frame, parse_market_frame
+from utils.price_forecast import UNSEEN_COMMODITY
+from tasks.price_forecasts import (
+    ACTIVE_SERIES_QUERY,
+    CREATE_TABLE_QUERY,
+    UPSERT_QUERY,
+    _encode_series,
+    _forecast_rows,
+    fetch_precomputed_forecast,
+)
+
+TODAY = datetime(2024, 3, 10, 9, 30)
+SERIES = {"state": "Maharashtra", "district": "Nashik", "market": "Lasalgaon APMC", "commodity": "Onion",
+          "variety": "Local", "grade": "FAQ", "latest_arrival_date": date(2024, 3, 9)}
+
+
+class Names:
+    """EntityDictionary stand-in resolving case-insensitively to the names of SERIES."""
+
+    def canonical(self, col, value):
+        return SERIES[col] if value.strip().lower() == SERIES[col].lower() else None
+
+
+def arrivals(days, **names):
+    """market_prices records for SERIES (or names overriding it) on each of days, priced by day."""
+    series = {col: SERIES[col] for col in ('state', 'district', 'market', 'commodity', 'variety', 'grade')}
+    return [{**series, **names, "arrival_date": day.strftime("%d/%m/%Y"), "modal_price": str(1000 + day.day)}
+            for day in days]
+
+
+def load(conn, records):
+    with conn.cursor() as cur:
+        load_market_frame(cur, parse_market_frame(records))
+    conn.commit()
+
+
+def request(**kwargs):
+    names = {col: SERIES[col].upper() for col in ('state', 'district', 'market', 'commodity', 'variety', 'grade')}
+    return PredictionRequest(**{**names, **kwargs})
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    """price_forecasts holding a 7-day horizon for SERIES, generated on TODAY by model v1 from its arrivals."""
+    monkeypatch.setattr(fmp, "DB_NAME", os.getenv("FORECAST_TEST_DB_NAME", "SmartAgriForecastTest"))
+    fmp.create_database_if_not_exists()
+    conn = fmp.get_db_connection()
+    if conn is None:
+        pytest.skip("Postgres unreachable")
+    dates = pd.date_range("2024-03-11", periods=7)
+    points = np.array([[1000.0 + i for i in range(7)]])
+    with conn.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS price_forecasts, market_prices, market_price_daily_rollup, "
+                    "market_sync_state CASCADE")
+        cur.execute(CREATE_TABLE_QUERY)
+        extras.execute_values(cur, UPSERT_QUERY, _forecast_rows([SERIES], (dates, points, None), TODAY.date(), "v1"))
+    conn.commit()
+    fmp.create_table_if_not_exists(conn)
+    load(conn, arrivals(pd.date_range("2024-03-03", "2024-03-09")))
+    yield conn
+    conn.close()
+
+
+def test_lookup_uses_canonical_names(conn):
+    predictions = fetch_precomputed_forecast(conn, request(), Names(), 7, "v1", TODAY)
+    assert [p["predicted_price"] for p in predictions] == [1000.0 + i for i in range(7)]
+    assert predictions[0]["date"] == "2024-03-11"
+    assert len(fetch_precomputed_forecast(conn, request(), Names(), 3, "v1", TODAY)) == 3
+
+
+def test_lookup_misses(conn):
+    # An unresolved name is matched by pattern on the live path, so it is never answered from here
+    assert fetch_precomputed_forecast(conn, request(market="Lasalgaon"), Names(), 7, "v1", TODAY) is None
+    assert fetch_precomputed_forecast(conn, request(grade="Unspecified"), Names(), 7, "v1", TODAY) is None
+    assert fetch_precomputed_forecast(conn, request(), None, 7, "v1", TODAY) is None
+    # Another model version, a longer horizon than stored, or yesterday's run
+    assert fetch_precomputed_forecast(conn, request(), Names(), 7, "v2", TODAY) is None
+    assert fetch_precomputed_forecast(conn, request(), Names(), 8, "v1", TODAY) is None
+    assert fetch_precomputed_forecast(conn, request(), Names(), 7, "v1", datetime(2024, 3, 11)) is None
+
+
+def test_lookup_misses_after_a_newer_arrival(conn):
+    # Another variety's arrival does not make SERIES stale; its own does
+    load(conn, arrivals([date(2024, 3, 10)], variety="Red"))
+    assert fetch_precomputed_forecast(conn, request(), Names(), 7, "v1", TODAY) is not None
+    load(conn, arrivals([date(2024, 3, 10)], grade="Non-FAQ"))
+    assert fetch_precomputed_forecast(conn, request(), Names(), 7, "v1", TODAY) is None
+
+
+def test_active_series_take_their_latest_prices(conn):
+    today = date.today()
+    old = [today - timedelta(days=90 + i) for i in range(6)]
+    load(conn, arrivals(old + [today - timedelta(days=2), today - timedelta(days=1)], market="Pimpalgaon"))
+    load(conn, arrivals(old, market="Vinchur"))
+    with conn.cursor() as cur:
+        cur.execute(ACTIVE_SERIES_QUERY, (30,))
+        columns = [d[0] for d in cur.description]
+        series = [dict(zip(columns, row)) for row in cur.fetchall()]
+    conn.commit()
+    # Only Pimpalgaon had an arrival in the window, but all 7 of its prices are used
+    assert [s['market'] for s in series] == ["Pimpalgaon"]
+    days = [today - timedelta(days=d) for d in (1, 2, 90, 91, 92, 93, 94)]
+    assert series[0]['prices'] == [1000 + day.day for day in days]
+    assert series[0]['latest_arrival_date'] == days[0] and series[0]['grade'] == "FAQ"
+
+
+def test_encode_series():
+    encoders = {col: LabelEncoder().fit(classes) for col, classes in {
+        'state': ['Karnataka', 'Maharashtra'], 'district': ['Nashik'], 'market': ['Lasalgaon APMC'],
+        'commodity': ['Onion', 'Tomato'], 'variety': ['Local'], 'grade': ['FAQ'],
+    }.items()}
+    assert _encode_series(encoders, [SERIES, {**SERIES, 'commodity': 'Tomato', 'grade': 'Unknown'},
+                                     {**SERIES, 'commodity': 'Garlic'}]) == [
+        (1, 0, 0, 0, 0, 0), (1, 0, 0, 1, 0, 0), (1, 0, 0, UNSEEN_COMMODITY, 0, 0),
+    ]
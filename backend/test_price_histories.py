@@ -0,0 +1,179 @@
+"""
+fetch_price_histories checks: a series with a name the entity dictionary
+cannot resolve still matches by pattern, and results come back in input
+order when canonical and pattern lookups are mixed; /predict-price/batch
+over it answers mixed valid and invalid items in input order, and
+/mandi-prices ETags are scoped to the filters and cursor and its page
+size is capped. Runs against a scratch Postgres database
+(HISTORY_TEST_DB_NAME, default SmartAgriHistoryTest) and is skipped when
+Postgres is unreachable.
+
+Usage:
+    cd backend
+    python -m pytest test_price_histories.py
+"""
+import os
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sklearn.preprocessing import LabelEncoder
+
+import api
+import fetch_market_prices as fmp
+from benchmarks.common import make_synthetic_model
+from utils.compiled_forest import CompiledForest
+from utils.entity_dictionary import EntityDictionary
+from utils.market_history import fetch_price_histories
+from utils.market_loader import load_market_frame, parse_market_frame
+from utils.model_registry import LoadedModel
+
+
+def series(**kwargs):
+    names = {"state": "Kerala", "district": "Idukki", "market": "Kumily North", "commodity": "Cardamom",
+             "variety": "Small"}
+    return SimpleNamespace(**{**names, **kwargs})
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    """Two Idukki markets whose names share "Kumily", in the scratch database."""
+    monkeypatch.setattr(fmp, "DB_NAME", os.getenv("HISTORY_TEST_DB_NAME", "SmartAgriHistoryTest"))
+    fmp.create_database_if_not_exists()
+    conn = fmp.get_db_connection()
+    if conn is None:
+        pytest.skip("Postgres unreachable")
+    with conn.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS market_prices, market_price_daily_rollup, market_sync_state CASCADE")
+    conn.commit()
+    fmp.create_table_if_not_exists(conn)
+    records = [
+        {"state": "Kerala", "district": "Idukki", "market": market, "commodity": "Cardamom",
+         "variety": "Small", "grade": "FAQ", "arrival_date": f"{day:02d}/03/2024",
+         "modal_price": str(price + day)}
+        for market, price in (("Kumily North", 2000), ("Kumily South", 3000))
+        for day in range(1, 6)
+    ]
+    with conn.cursor() as cur:
+        load_market_frame(cur, parse_market_frame(records))
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_unresolved_name_falls_back_to_patterns(conn):
+    entities = EntityDictionary.build(conn)
+    conn.commit()
+    # "Kumily" is in both market names, so the dictionary will not pick one
+    assert entities.canonical('market', "Kumily") is None
+
+    histories = fetch_price_histories(conn, [
+        series(),
+        series(market="Kumily"),
+        series(commodity="Saffron"),
+    ], entities)
+    conn.commit()
+
+    resolved, unresolved, unknown = histories
+    assert resolved.level == 1 and resolved.rows == [2005, 2004, 2003, 2002, 2001]
+    # Both Kumily markets match the pattern; with equality on NULL this fell through to the district average
+    assert unresolved.level == 1 and unresolved.rows == [3005, 2005, 3004, 2004, 3003, 2003, 3002]
+    assert unknown.level is None and unknown.rows == []
+
+    assert fetch_price_histories(conn, [series(market="Kumily")])[0] == unresolved
+
+
+def test_mixed_lookups_keep_input_order(conn):
+    entities = EntityDictionary.build(conn)
+    conn.commit()
+    items = [series(market="Kumily"), series(market="Kumily South"), series(commodity="Saffron"), series()]
+    histories = fetch_price_histories(conn, items, entities)
+    conn.commit()
+    # Pattern, canonical, no match, canonical: each answer lands at its own index
+    assert [h.level for h in histories] == [1, 1, None, 1]
+    assert [h.rows[0] if h.rows else None for h in histories] == [3005, 3005, None, 2005]
+    assert fetch_price_histories(conn, [], entities) == []
+
+
+@pytest.fixture
+def client(conn, monkeypatch):
+    """The API serving a small synthetic forest, with market lookups on the scratch database."""
+    encoders = {col: LabelEncoder().fit(classes) for col, classes in {
+        'state': ['Kerala'], 'district': ['Idukki'], 'market': ['Kumily North', 'Kumily South'],
+        'commodity': ['Cardamom'], 'variety': ['Small'], 'grade': ['FAQ'],
+    }.items()}
+    forest = CompiledForest.from_sklearn(make_synthetic_model(n_estimators=5, n_rows=1000))
+    entities = EntityDictionary.build(conn, encoders)
+    conn.commit()
+
+    @contextmanager
+    def scratch_db(timeout=None):
+        yield conn
+        conn.rollback()
+
+    monkeypatch.setattr(api.model_registry, "_active", LoadedModel("test", forest, encoders, "", 0.0))
+    monkeypatch.setattr(api, "get_entity_dictionary", lambda encoders=None: entities)
+    monkeypatch.setattr(api, "market_db", scratch_db)
+    return TestClient(api.app)
+
+
+def test_batch_mixes_valid_and_invalid_items(client):
+    names = {"state": "Kerala", "district": "Idukki", "commodity": "Cardamom", "variety": "Small", "grade": "FAQ"}
+    items = [
+        {**names, "market": "Kumily North", "days": 5},
+        {**names, "market": "Kumily North", "mode": "bogus"},
+        {**names, "market": "Kumily", "days": 5},
+        {**names, "market": "Kumily North", "commodity": "Saffron"},
+        {**names, "market": "Kumily North", "days": 3},
+    ]
+    response = client.post("/predict-price/batch", json={"items": items})
+    assert response.status_code == 200
+    body = response.json()
+    results = body["results"]
+    assert (body["count"], body["failed"]) == (5, 2)
+    assert [r["index"] for r in results] == [0, 1, 2, 3, 4]
+    assert [r["market"] for r in results] == [item["market"] for item in items]
+    assert [(r["error"] or {}).get("status_code") for r in results] == [None, 400, None, 404, None]
+    assert [len(r["predictions"]) for r in results] == [5, 0, 5, 0, 3]
+    assert [r["fallback_level"] for r in results] == ["exact", None, "exact", None, "exact"]
+
+    # Each item matches its single-item answer, whatever else was in the batch
+    for i in (0, 2, 4):
+        single = client.post("/predict-price", json=items[i]).json()
+        assert results[i]["predictions"] == single["predictions"], i
+    assert results[4]["predictions"] == results[0]["predictions"][:3]
+    assert results[2]["predictions"] != results[0]["predictions"]
+
+
+def test_mandi_etag_covers_filters_and_cursor(client, conn, monkeypatch):
+    monkeypatch.setattr(api, "get_pool", lambda: SimpleNamespace(getconn=fmp.get_db_connection))
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO market_sync_state (resource_id, watermark) VALUES ('test', '2024-03-05')")
+    conn.commit()
+
+    def get(**params):
+        return client.get("/mandi-prices", params={"limit": 2, **params})
+
+    first = get(state="Kerala")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and len(first.json()) == 2
+    # Same rows, differently spelled
+    assert get(state=" kerala ").headers["ETag"] == etag
+    assert client.get("/mandi-prices", params={"limit": 2, "state": "KERALA"},
+                      headers={"If-None-Match": etag}).status_code == 304
+
+    others = [get(), get(state="Kerala", district="Idukki"), get(state="Kerala", limit=3),
+              get(state="Kerala", cursor=first.headers["X-Next-Cursor"])]
+    tags = {response.headers["ETag"] for response in others}
+    assert len(tags) == len(others) and etag not in tags
+    for response in others:
+        assert client.get("/mandi-prices", params={"limit": 2, "state": "Kerala"},
+                          headers={"If-None-Match": response.headers["ETag"]}).status_code == 200
+
+
+def test_mandi_limit_is_capped(client, monkeypatch):
+    monkeypatch.setattr(api, "get_pool", lambda: SimpleNamespace(getconn=fmp.get_db_connection))
+    assert client.get("/mandi-prices", params={"limit": api.MANDI_PRICES_MAX_LIMIT + 1}).status_code == 422
+    response = client.get("/mandi-prices", params={"limit": api.MANDI_PRICES_MAX_LIMIT})
+    assert response.status_code == 200 and len(response.json()) == 10
@@ -0,0 +1,52 @@
+"""
+Stage timer checks: histograms, the Server-Timing header, and the
+LATENCY_METRICS_ENABLED off switch.
+
+Usage:
+    cd backend
+    python -m pytest test_stage_timing.py
+"""
+from utils import stage_timing
+from utils.stage_timing import LatencyHistogram, StageMetrics, StageTimer, stage_metrics, start_timer
+
+
+def test_histogram_percentiles():
+    hist = LatencyHistogram()
+    for ms in range(1, 101):
+        hist.record(float(ms))
+    snapshot = hist.snapshot()
+    assert snapshot["count"] == 100 and snapshot["max_ms"] == 100.0 and snapshot["mean_ms"] == 50.5
+    # Bucket upper bounds are ~10% apart
+    assert 50 <= snapshot["p50_ms"] <= 55 and 99 <= snapshot["p99_ms"] <= 100
+
+
+def test_stages_add_up_and_are_recorded():
+    metrics = StageMetrics()
+    timer = StageTimer("predict_price", metrics)
+    timer.add("forecast", 1.5)
+    timer.add("forecast", 2.0)
+    with timer.stage("encode"):
+        pass
+    stages = dict(timer.finish())
+    assert stages["forecast"] == 3.5 and set(stages) == {"forecast", "encode", "total"}
+    assert metrics.snapshot()["predict_price.forecast"]["count"] == 1
+    assert timer.server_timing().startswith("forecast;dur=3.500, encode;dur=")
+
+
+def test_metrics_off_switch(monkeypatch):
+    monkeypatch.setattr(stage_timing, "LATENCY_METRICS_ENABLED", False)
+
+    def recorded():
+        return [name for name in stage_metrics.snapshot() if name.startswith("off_switch.")]
+
+    assert not start_timer("off_switch").enabled
+    # A caller asking for Server-Timing still gets the header, but nothing is recorded
+    timer = start_timer("off_switch", force=True)
+    timer.add("forecast", 1.0)
+    timer.finish()
+    assert timer.enabled and "forecast;dur=1.000" in timer.server_timing()
+    assert recorded() == []
+
+    monkeypatch.setattr(stage_timing, "LATENCY_METRICS_ENABLED", True)
+    start_timer("off_switch").finish()
+    assert recorded() == ["off_switch.total"]
@@ -0,0 +1,91 @@
+"""
+train_model.load_data checks: rows streamed in several server-side cursor
+chunks come back with compact dtypes (categoricals, datetime64, float32)
+and the same values as a plain read of market_prices, and since limits
+the load to later arrivals. Runs against a scratch Postgres database
+(TRAINING_TEST_DB_NAME, default SmartAgriTrainingTest) and is skipped when
+Postgres is unreachable.
+
+Usage:
+    cd backend
+    python -m pytest test_training_loader.py
+"""
+import os
+from contextlib import contextmanager
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import fetch_market_prices as fmp
+import train_model
+from train_model import CATEGORICAL_COLS, load_data
+from utils.market_loader import load_market_frame, parse_market_frame
+
+COLUMNS = CATEGORICAL_COLS + ['arrival_date', 'modal_price']
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    """Two markets whose commodities differ, so chunks see different categories."""
+    monkeypatch.setattr(fmp, "DB_NAME", os.getenv("TRAINING_TEST_DB_NAME", "SmartAgriTrainingTest"))
+    fmp.create_database_if_not_exists()
+    conn = fmp.get_db_connection()
+    if conn is None:
+        pytest.skip("Postgres unreachable")
+    with conn.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS market_prices, market_price_daily_rollup, market_sync_state CASCADE")
+    conn.commit()
+    fmp.create_table_if_not_exists(conn)
+    records = [
+        {"state": "Maharashtra", "district": "Nashik", "market": market, "commodity": commodity,
+         "variety": "Local", "grade": "FAQ", "arrival_date": f"{day:02d}/03/2024",
+         "modal_price": str(price + day) if day != 4 else ""}
+        for market, commodity, price in (("Lasalgaon", "Onion", 1500), ("Pimpalgaon", "Tomato", 900))
+        for day in range(1, 8)
+    ]
+    with conn.cursor() as cur:
+        load_market_frame(cur, parse_market_frame(records))
+    conn.commit()
+
+    @contextmanager
+    def scratch_db(timeout=None):
+        yield conn
+        conn.rollback()
+
+    monkeypatch.setattr(train_model, "market_db", scratch_db)
+    yield conn
+    conn.close()
+
+
+def expected(conn, where=""):
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT {', '.join(COLUMNS)} FROM market_prices {where}")
+        rows = cur.fetchall()
+    conn.rollback()
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    df['arrival_date'] = pd.to_datetime(df['arrival_date'])
+    df['modal_price'] = df['modal_price'].astype('float64')
+    return df.sort_values(['market', 'arrival_date']).reset_index(drop=True)
+
+
+def test_chunks_stream_into_compact_dtypes(conn):
+    df = load_data(chunk_rows=3)
+    assert list(df.columns) == COLUMNS and len(df) == 14
+    assert all(isinstance(df[col].dtype, pd.CategoricalDtype) for col in CATEGORICAL_COLS)
+    assert list(df['commodity'].cat.categories) == ["Onion", "Tomato"]
+    assert pd.api.types.is_datetime64_dtype(df['arrival_date'])
+    assert df['modal_price'].dtype == np.float32 and df['modal_price'].isna().sum() == 2
+
+    loaded = df.astype({col: str for col in CATEGORICAL_COLS}).astype({'modal_price': 'float64'})
+    loaded = loaded.sort_values(['market', 'arrival_date']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(loaded, expected(conn), check_dtype=False)
+
+
+def test_since_loads_only_later_arrivals(conn):
+    df = load_data(chunk_rows=3, since=date(2024, 3, 5))
+    assert len(df) == 4 and df['arrival_date'].min() == pd.Timestamp("2024-03-06")
+
+    empty = load_data(since=date(2024, 3, 7))
+    assert empty.empty and list(empty.columns) == COLUMNS
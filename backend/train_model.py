@@ -1,3 +1,6 @@
+import argparse
+import itertools
+import numpy as np
 import pandas as pd
 import psycopg2
 import os
@@ -6,8 +9,20 @@ from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import r2_score, mean_absolute_error
 from sklearn.preprocessing import LabelEncoder
+from pandas.api.types import union_categoricals
 import joblib
+import shutil
+import tempfile
 import warnings
+from concurrent.futures import ProcessPoolExecutor
+from backtest import run_backtest
+from utils.compiled_forest import CompiledForest, export_forest
+from utils.db import market_db
+from utils.feature_store import compute_features, FeatureStore
+from utils.model_artifacts import COMPILED_DIRECT_MODEL_PATH, COMPILED_MODEL_PATH
+from utils.model_registry import publish_model, read_manifest
+from utils.model_shards import replace_shards, shard_dirname, shards_path_for, write_shard_index
+from utils.price_forecast import DIRECT_FEATURE_NAMES, FEATURE_NAMES, MAX_FORECAST_DAYS
 
 warnings.filterwarnings('ignore')
 
@@ -20,6 +35,41 @@ DB_PASS = os.getenv("DB_PASS", "password")
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = os.getenv("DB_PORT", "5432")
 
+# Rows per server-side cursor fetch when streaming the training set
+LOAD_CHUNK_ROWS = int(os.getenv("TRAIN_LOAD_CHUNK_ROWS", "200000"))
+CATEGORICAL_COLS = ['state', 'district', 'market', 'commodity', 'variety', 'grade']
+
+# Per-commodity shards: commodities with at least this many training rows get their own
+# smaller forest; the rest (and any shard that loses to the global model) use the global one
+SHARD_MIN_ROWS = int(os.getenv("TRAIN_SHARD_MIN_ROWS", "5000"))
+SHARD_TREES = int(os.getenv("TRAIN_SHARD_TREES", "30"))
+SHARD_WORKERS = int(os.getenv("TRAIN_SHARD_WORKERS", str(os.cpu_count() or 1)))
+SHARDS_PATH = shards_path_for(COMPILED_MODEL_PATH)
+
+DEFAULT_MODEL_PARAMS = {'n_estimators': 100}
+# --search tries every combination and keeps the most accurate one that fits the serving budget:
+# p99 model time of a default 7-day /predict-price request and compiled forest size
+SEARCH_GRID = {
+    'n_estimators': [25, 50, 100],
+    'max_depth': [12, 20, None],
+    'min_samples_leaf': [1, 5],
+}
+# --direct: a second forest that predicts the price horizon_days ahead from the origin's
+# latest price and 7-day average; a few sampled horizons per origin row bound its training set
+DIRECT_HORIZONS_PER_ROW = int(os.getenv("TRAIN_DIRECT_HORIZONS_PER_ROW", "4"))
+DIRECT_MAX_ROWS = int(os.getenv("TRAIN_DIRECT_MAX_ROWS", "2000000"))
+
+LATENCY_BUDGET_P99_MS = float(os.getenv("TRAIN_LATENCY_BUDGET_P99_MS", "25"))
+SIZE_BUDGET_MB = float(os.getenv("TRAIN_SIZE_BUDGET_MB", "64"))
+
+# Only the columns preprocess_data uses; prices arrive as float8 instead of Decimal objects
+TRAINING_QUERY = """
+    SELECT state, district, market, commodity, variety, grade, arrival_date, modal_price::float8
+    FROM market_prices
+"""
+# Feature store deltas only read days it has not seen yet
+TRAINING_SINCE_QUERY = TRAINING_QUERY + "    WHERE arrival_date > %s\n"
+
 def get_db_connection():
     return psycopg2.connect(
         dbname=DB_NAME,
@@ -29,52 +79,63 @@ def get_db_connection():
         port=DB_PORT
     )
 
-def load_data():
+def _compact_chunk(rows):
+    columns = list(zip(*rows))
+    chunk = {col: pd.Categorical(columns[i]) for i, col in enumerate(CATEGORICAL_COLS)}
+    chunk['arrival_date'] = np.array(columns[6], dtype='datetime64[D]')
+    # Mandi prices are whole rupees, exact in float32; preprocess_data widens it again
+    chunk['modal_price'] = np.array(columns[7], dtype=np.float32)
+    return chunk
+
+
+def _concat_chunks(chunks):
+    if not chunks:
+        return pd.DataFrame(columns=CATEGORICAL_COLS + ['arrival_date', 'modal_price'])
+    data = {}
+    for col in CATEGORICAL_COLS:
+        data[col] = union_categoricals([c.pop(col) for c in chunks], sort_categories=True)
+    data['arrival_date'] = pd.to_datetime(np.concatenate([c.pop('arrival_date') for c in chunks]))
+    data['modal_price'] = np.concatenate([c.pop('modal_price') for c in chunks])
+    return pd.DataFrame(data)
+
+
+def load_data(chunk_rows=LOAD_CHUNK_ROWS, since=None):
+    """Stream market_prices through a server-side cursor into compact dtypes.
+
+    Each chunk of rows is converted to categoricals, datetime64 and float32
+    as it arrives, so the full table never exists as Python objects at once.
+    With since, only rows with a later arrival_date are loaded.
+    """
     print("Loading data from database...")
-    conn = get_db_connection()
-    query = "SELECT * FROM market_prices ORDER BY arrival_date ASC"
-    df = pd.read_sql(query, conn)
-    conn.close()
+    chunks = []
+    # A named cursor keeps the result set on the server and fetches it in pieces
+    with market_db() as conn, conn.cursor(name="train_market_prices") as cur:
+        cur.itersize = chunk_rows
+        if since is None:
+            cur.execute(TRAINING_QUERY)
+        else:
+            cur.execute(TRAINING_SINCE_QUERY, (since,))
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                break
+            chunks.append(_compact_chunk(rows))
+            del rows
+    df = _concat_chunks(chunks)
+    print(f"Loaded {len(df)} rows ({df.memory_usage(deep=True).sum() / 1e6:.1f} MB in memory)")
     return df
 
 def preprocess_data(df):
     print("Preprocessing data...")
-    
-    # 1. Convert Date
-    df['arrival_date'] = pd.to_datetime(df['arrival_date'])
-    
-    # 2. Sort by key columns and date
-    df = df.sort_values(by=['state', 'district', 'market', 'commodity', 'variety', 'arrival_date'])
-    
-    # 3. Handle Missing Values (Interpolation)
-    # Group by specific variety in a market to interpolate logically
-    df['modal_price'] = df.groupby(['state', 'district', 'market', 'commodity', 'variety'])['modal_price'].transform(lambda x: x.interpolate(method='linear').bfill().ffill())
-    
-    # Drop rows where price is still null (if any groups were completely empty)
-    df = df.dropna(subset=['modal_price'])
-    
-    # 4. Feature Engineering
-    # We must group again to calculate rolling features correctly
-    grouper = df.groupby(['state', 'district', 'market', 'commodity', 'variety'])
-    
-    # Moving Average 7D
-    df['moving_avg_7d'] = grouper['modal_price'].transform(lambda x: x.rolling(window=7, min_periods=1).mean())
-    
-    # Price Lag 1D
-    df['price_lag_1d'] = grouper['modal_price'].transform(lambda x: x.shift(1))
-    
-    # Fill NaN created by lag (first day) with the price itself or 0
-    df['price_lag_1d'] = df['price_lag_1d'].fillna(df['modal_price'])
-    
-    # Is Weekend
-    df['is_weekend'] = df['arrival_date'].dt.dayofweek.apply(lambda x: 1 if x >= 5 else 0)
-    
-    # 5. Encoding
+    # Interpolation, 7-day moving average, 1-day lag and weekend flag per series
+    df = compute_features(df)
+    return encode_features(df)
+
+def encode_features(df, save_path='encoders.pkl'):
     # We need to save encoders to use them in the API later
     encoders = {}
-    categorical_cols = ['state', 'district', 'market', 'commodity', 'variety', 'grade']
     
-    for col in categorical_cols:
+    for col in CATEGORICAL_COLS:
         le = LabelEncoder()
         # Ensure we convert to string to handle mixed types if any
         df[col] = df[col].astype(str)
@@ -82,12 +143,226 @@ def preprocess_data(df):
         encoders[col] = le
     
     # Save encoders
-    joblib.dump(encoders, 'encoders.pkl')
-    print("Encoders saved to encoders.pkl")
+    if save_path:
+        joblib.dump(encoders, save_path)
+        print(f"Encoders saved to {save_path}")
     
     return df, encoders
 
-def train_model(df):
+def load_features(rebuild=False):
+    """Training features from the feature store, computing only rows newer than its last date."""
+    store = FeatureStore()
+    added = store.update(lambda since: load_data(since=since), rebuild=rebuild)
+    print(f"Feature store: {added} new rows, up to {store.last_date}")
+    return store.read()
+
+_shard_data = None
+
+
+def _init_shard_worker(data):
+    global _shard_data
+    _shard_data = data
+
+
+def _fit_shard(code, out_dir):
+    X_train, y_train, X_test, y_test, train_codes, test_codes = _shard_data
+    train, test = train_codes == code, test_codes == code
+    shard = RandomForestRegressor(n_estimators=SHARD_TREES, random_state=42, n_jobs=1)
+    shard.fit(X_train[train], y_train[train])
+    mae = mean_absolute_error(y_test[test], shard.predict(X_test[test])) if test.any() else None
+    forest = export_forest(shard, os.path.join(out_dir, shard_dirname(code)))
+    return code, {"version": forest.digest(), "rows": int(train.sum()), "n_trees": forest.n_trees,
+                  "nbytes": forest.nbytes, "mae": mae}
+
+
+def train_shards(X_train, X_test, y_train, y_test, y_pred, out_dir=SHARDS_PATH):
+    """Fit one forest per large commodity in worker processes and write them to out_dir.
+
+    A shard is kept only if it beats the global model's MAE on that commodity's
+    test rows. Returns out_dir, or None when no commodity got a shard.
+    """
+    commodity = X_train.columns.get_loc('commodity_encoded')
+    X_train, X_test = X_train.to_numpy(np.float64), X_test.to_numpy(np.float64)
+    y_train, y_test = y_train.to_numpy(np.float64), y_test.to_numpy(np.float64)
+    train_codes, test_codes = X_train[:, commodity].astype(int), X_test[:, commodity].astype(int)
+    codes, counts = np.unique(train_codes, return_counts=True)
+    eligible = [int(c) for c, n in zip(codes, counts) if n >= SHARD_MIN_ROWS]
+
+    if not eligible:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        print(f"No commodity has {SHARD_MIN_ROWS}+ training rows; serving the global model only")
+        return None
+
+    # Built next to out_dir and swapped in whole, so the live shards stay intact until then
+    parent = os.path.dirname(os.path.normpath(out_dir)) or "."
+    staging = tempfile.mkdtemp(prefix=f".{os.path.basename(os.path.normpath(out_dir))}-", dir=parent)
+    print(f"Training {len(eligible)} commodity shards with {SHARD_WORKERS} workers...")
+    data = (X_train, y_train, X_test, y_test, train_codes, test_codes)
+    shards = {}
+    try:
+        with ProcessPoolExecutor(max_workers=SHARD_WORKERS, initializer=_init_shard_worker, initargs=(data,)) as pool:
+            for code, info in pool.map(_fit_shard, eligible, [staging] * len(eligible)):
+                test = test_codes == code
+                global_mae = mean_absolute_error(y_test[test], y_pred[test]) if test.any() else None
+                if info["mae"] is None or global_mae is None or info["mae"] > global_mae:
+                    shutil.rmtree(os.path.join(staging, shard_dirname(code)))
+                    continue
+                info["global_mae"] = global_mae
+                shards[code] = info
+        if shards:
+            write_shard_index(staging, shards, {"n_estimators": SHARD_TREES}, SHARD_MIN_ROWS)
+            replace_shards(staging, out_dir)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    if not shards:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        print("No shard beat the global model; serving the global model only")
+        return None
+    print(f"Kept {len(shards)}/{len(eligible)} shards in {out_dir}/ "
+          f"({sum(s['nbytes'] for s in shards.values()) / 1e6:.1f} MB)")
+    return out_dir
+
+def select_model_params(df, p99_budget_ms=LATENCY_BUDGET_P99_MS, size_budget_mb=SIZE_BUDGET_MB, test_days=7):
+    """Backtest SEARCH_GRID on the newest test_days and pick the most accurate candidate within budget.
+
+    Returns (params, selection); selection records the budget, the choice and
+    every candidate's holdout numbers for the model manifest.
+    """
+    keys = list(SEARCH_GRID)
+    candidates = {}
+    for values in itertools.product(*(SEARCH_GRID[k] for k in keys)):
+        params = dict(zip(keys, values))
+        name = f"n{params['n_estimators']}_d{params['max_depth'] or 'max'}_l{params['min_samples_leaf']}"
+        candidates[name] = params
+
+    print(f"Searching {len(candidates)} candidates (p99 budget {p99_budget_ms} ms, size budget {size_budget_mb} MB)...")
+    summary, _ = run_backtest(df, candidates, n_folds=1, test_days=test_days, min_train_days=test_days)
+
+    def within(s):
+        return s["latency"]["request"]["p99_ms"] <= p99_budget_ms and s["size_mb"] <= size_budget_mb
+
+    fits = [name for name, s in summary.items() if within(s)]
+    if fits:
+        chosen = min(fits, key=lambda name: summary[name]["mae"])
+    else:
+        chosen = min(summary, key=lambda name: summary[name]["latency"]["request"]["p99_ms"])
+        print(f"Warning: no candidate meets the budget; using the fastest one ({chosen})")
+
+    def holdout(s):
+        return {
+            "mae": round(s["mae"], 4),
+            "r2": round(s["r2"], 4),
+            "request_p99_ms": round(s["latency"]["request"]["p99_ms"], 3),
+            "size_mb": round(s["size_mb"], 2),
+        }
+
+    selection = {
+        "budget": {"request_p99_ms": p99_budget_ms, "size_mb": size_budget_mb, "request_days": 7},
+        "chosen": chosen,
+        "within_budget": bool(fits),
+        "params": candidates[chosen],
+        "holdout_days": test_days,
+        "holdout": holdout(summary[chosen]),
+        "candidates": {name: dict(holdout(s), within_budget=within(s)) for name, s in summary.items()},
+    }
+    print(f"Selected {chosen}: {selection['holdout']}")
+    return candidates[chosen], selection
+
+def trim_to_size_budget(model, size_budget_mb):
+    """Drop trailing trees until the compiled forest fits size_budget_mb; returns its size in MB.
+
+    sklearn seeds trees in order from random_state, so a forest's first n
+    trees are the forest it would fit with n_estimators=n. The search sized
+    candidates fit on fewer rows, so the final refit can come out larger.
+    """
+    size_mb = CompiledForest.from_sklearn(model).nbytes / 1e6
+    while size_mb > size_budget_mb:
+        n_trees = len(model.estimators_)
+        keep = min(n_trees - 1, int(n_trees * size_budget_mb / size_mb))
+        if keep < 1:
+            raise ValueError(f"One tree is {size_mb:.1f} MB, over the {size_budget_mb} MB size budget")
+        print(f"Refit is {size_mb:.1f} MB, over the {size_budget_mb} MB size budget; keeping {keep} of {n_trees} trees")
+        model.estimators_ = model.estimators_[:keep]
+        model.n_estimators = keep
+        size_mb = CompiledForest.from_sklearn(model).nbytes / 1e6
+    return size_mb
+
+def build_direct_training_set(df, horizons_per_row=DIRECT_HORIZONS_PER_ROW, max_rows=DIRECT_MAX_ROWS, seed=42):
+    """DIRECT_FEATURE_NAMES rows plus target_price, the series' price horizon_days after each origin row.
+
+    The origin's modal_price and moving_avg_7d play the roles of the newest
+    history price and its window mean, as they do at serving time.
+    """
+    series = FEATURE_NAMES[:5]
+    rng = np.random.default_rng(seed)
+    # Sample origins up front so the expanded frame stays near max_rows before the join
+    n_origins = min(len(df), max(max_rows // horizons_per_row * 2, 1))
+    origins = df.iloc[np.sort(rng.choice(len(df), n_origins, replace=False))] if n_origins < len(df) else df
+    idx = np.repeat(np.arange(len(origins)), horizons_per_row)
+    horizons = rng.integers(1, MAX_FORECAST_DAYS + 1, size=len(idx))
+
+    direct = pd.DataFrame({col: origins[col].to_numpy()[idx] for col in FEATURE_NAMES[:6]})
+    direct['moving_avg_7d'] = origins['moving_avg_7d'].to_numpy()[idx]
+    direct['price_lag_1d'] = origins['modal_price'].to_numpy()[idx]
+    direct['horizon_days'] = horizons
+    direct['target_date'] = (pd.to_datetime(origins['arrival_date']).to_numpy()[idx]
+                             + pd.to_timedelta(horizons, unit='D').to_numpy())
+
+    targets = df[series + ['arrival_date', 'modal_price']].drop_duplicates(series + ['arrival_date'], keep='last')
+    targets = targets.rename(columns={'arrival_date': 'target_date', 'modal_price': 'target_price'})
+    targets['target_date'] = pd.to_datetime(targets['target_date']).astype(direct['target_date'].dtype)
+    direct = direct.merge(targets, on=series + ['target_date'], how='inner')
+    direct['is_weekend'] = (direct['target_date'].dt.dayofweek >= 5).astype(int)
+    if len(direct) > max_rows:
+        direct = direct.sample(max_rows, random_state=seed)
+    return direct.reset_index(drop=True)
+
+
+def train_direct_model(df, params=None, out_path=COMPILED_DIRECT_MODEL_PATH):
+    """Fit and export the direct multi-horizon forest; returns (out_path, metrics) or (None, None)."""
+    direct = build_direct_training_set(df)
+    if len(direct) < 100:
+        print("Not enough rows with a known future price to train the direct model")
+        return None, None
+    print(f"Training direct multi-horizon model on {len(direct)} (origin, horizon) rows...")
+    X_train, X_test, y_train, y_test = train_test_split(
+        direct[DIRECT_FEATURE_NAMES], direct['target_price'], test_size=0.2, random_state=42)
+    model = RandomForestRegressor(random_state=42, n_jobs=-1, **(params or DEFAULT_MODEL_PARAMS))
+    model.fit(X_train, y_train)
+    y_pred = model.predict(X_test)
+    r2, mae = r2_score(y_test, y_pred), mean_absolute_error(y_test, y_pred)
+    print(f"Direct model R2: {r2:.4f}  MAE: {mae:.4f}")
+    for low, high in ((1, 7), (8, 14), (15, MAX_FORECAST_DAYS)):
+        band = X_test['horizon_days'].between(low, high).to_numpy()
+        if band.any():
+            print(f"  horizon {low}-{high}d MAE: {mean_absolute_error(y_test[band], y_pred[band]):.4f}")
+
+    forest = export_forest(model, out_path)
+    print(f"Direct forest saved to {out_path}/ ({forest.nbytes / 1e6:.1f} MB)")
+    return out_path, {'r2': round(r2, 4), 'mae': round(mae, 4)}
+
+def save_model(model, metrics=None, shards_path=None, selection=None, direct_path=None):
+    joblib.dump(model, 'price_model.pkl')
+    print("Model saved to price_model.pkl")
+
+    # Flat array copy of the forest that the API memory-maps and serves without sklearn
+    forest = export_forest(model, COMPILED_MODEL_PATH)
+    print(f"Compiled forest saved to {COMPILED_MODEL_PATH}/ ({forest.nbytes / 1e6:.1f} MB)")
+    if selection:
+        # The search measured a model fit on fewer rows; record what is actually served
+        selection = dict(selection, final_size_mb=round(forest.nbytes / 1e6, 2))
+
+    # Versioned copy for hot reload: the first model goes live, later ones start in shadow
+    has_active = read_manifest().get("active") is not None
+    version = publish_model(forest, 'encoders.pkl', metrics, activate=not has_active, shadow=has_active,
+                            shards_path=shards_path, selection=selection, direct_path=direct_path)
+    if has_active:
+        print(f"Registered {version} as shadow model. Activate it with: python -m utils.model_registry activate {version}")
+    else:
+        print(f"Registered {version} as the active model")
+
+def train_model(df, params=None, selection=None, direct=False):
     print("Training model...")
     
     # Features
@@ -104,8 +379,13 @@ def train_model(df):
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
     
     # Train
-    model = RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=-1)
+    model = RandomForestRegressor(random_state=42, n_jobs=-1, **(params or DEFAULT_MODEL_PARAMS))
     model.fit(X_train, y_train)
+    if selection:
+        # The chosen params met the size budget on the search's smaller fit; hold the served model to it too
+        trim_to_size_budget(model, selection["budget"]["size_mb"])
+        if model.n_estimators != selection["params"].get("n_estimators"):
+            selection = dict(selection, final_params=dict(selection["params"], n_estimators=model.n_estimators))
     
     # Evaluate
     y_pred = model.predict(X_test)
@@ -113,23 +393,50 @@ def train_model(df):
     mae = mean_absolute_error(y_test, y_pred)
     
     print(f"Model Evaluation:\nR2 Score: {r2:.4f}\nMAE: {mae:.4f}")
+
+    metrics = {'r2': round(r2, 4), 'mae': round(mae, 4)}
+
+    shards_path = train_shards(X_train, X_test, y_train, y_test, y_pred)
+    direct_path = None
+    if direct:
+        direct_path, direct_metrics = train_direct_model(df, params)
+        if direct_metrics:
+            metrics['direct'] = direct_metrics
+    else:
+        # A direct forest from an earlier run would not match these encoders
+        shutil.rmtree(COMPILED_DIRECT_MODEL_PATH, ignore_errors=True)
     
     if r2 > 0.85:
         print("Model performance meets criteria (>0.85). Saving model...")
-        joblib.dump(model, 'price_model.pkl')
-        print("Model saved to price_model.pkl")
+        save_model(model, metrics, shards_path, selection, direct_path)
     else:
         print("Model performance did not meet criteria (>0.85). Model NOT saved.")
         # Optional: Save anyway for the user to proceed with Mission 4 even if result is poor?
         # The prompt says "If the score is above 0.85", but strictly adhering might block Mission 4.
         # I will save it anyway for flow continuity but warn the user.
         print("Warning: Saving model anyway for demonstration purposes (Mission 4).")
-        joblib.dump(model, 'price_model.pkl')
+        save_model(model, metrics, shards_path, selection, direct_path)
 
 if __name__ == "__main__":
-    df = load_data()
+    parser = argparse.ArgumentParser(description="Train the price model")
+    parser.add_argument("--rebuild-features", action="store_true",
+                        help="Recompute every feature instead of only rows newer than the feature store")
+    parser.add_argument("--direct", action="store_true",
+                        help="Also train the direct multi-horizon model (requests choose it with mode=direct)")
+    parser.add_argument("--search", action="store_true",
+                        help="Pick tree count, depth and min leaf size by backtest within the serving budget")
+    parser.add_argument("--p99-budget-ms", type=float, default=LATENCY_BUDGET_P99_MS,
+                        help="p99 model latency of a 7-day forecast request allowed by --search")
+    parser.add_argument("--size-budget-mb", type=float, default=SIZE_BUDGET_MB,
+                        help="Compiled forest size allowed by --search")
+    args = parser.parse_args()
+
+    df = load_features(rebuild=args.rebuild_features)
     if df.empty:
         print("No data found in database. Please run the fetch script first.")
     else:
-        df_processed, _ = preprocess_data(df)
-        train_model(df_processed)
+        df_processed, _ = encode_features(df)
+        params, selection = None, None
+        if args.search:
+            params, selection = select_model_params(df_processed, args.p99_budget_ms, args.size_budget_mb)
+        train_model(df_processed, params, selection, direct=args.direct)
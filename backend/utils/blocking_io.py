@@ -0,0 +1,93 @@
+"""
+Blocking calls from async code: Supabase/PostgREST queries, weather and
+Twilio HTTP requests, Gemini.
+
+`async def` endpoints run on the event loop, so a synchronous call made
+there stalls every other request in the worker until it returns. They
+await run_blocking() instead, which runs the call on a dedicated pool of
+BLOCKING_IO_WORKERS threads:
+
+    response = await run_blocking(query.execute)
+
+Calls beyond the pool size queue in submission order. Sync (`def`)
+endpoints such as the market-price ones already run in Starlette's thread
+pool and do not need this; keeping these calls on their own pool means a
+burst of slow PostgREST responses cannot starve those either. Queue time
+goes to the "blocking_io.wait" latency histogram; stats() has the gauges.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, TypeVar
+
+from utils.stage_timing import stage_metrics
+
+BLOCKING_IO_WORKERS = int(os.getenv("BLOCKING_IO_WORKERS", "32"))
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+_queued = 0
+_running = 0
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=BLOCKING_IO_WORKERS, thread_name_prefix="blocking-io")
+    return _executor
+
+
+async def run_blocking(func: Callable[..., T], *args, **kwargs) -> T:
+    """Run func(*args, **kwargs) on the blocking I/O pool and await its result."""
+    global _queued
+    submitted = time.perf_counter()
+    pending = [True]  # counted in _queued until a worker picks it up or the caller gives up
+
+    def call():
+        global _queued, _running
+        stage_metrics.histogram("blocking_io.wait").record((time.perf_counter() - submitted) * 1000)
+        with _lock:
+            if pending[0]:
+                pending[0] = False
+                _queued -= 1
+            _running += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with _lock:
+                _running -= 1
+
+    with _lock:
+        _queued += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(get_executor(), call)
+    finally:
+        with _lock:
+            if pending[0]:
+                pending[0] = False
+                _queued -= 1
+
+
+def stats() -> Dict:
+    with _lock:
+        return {
+            "workers": BLOCKING_IO_WORKERS,
+            "running": _running,
+            "queued": _queued,
+            "wait": stage_metrics.histogram("blocking_io.wait").snapshot(),
+        }
+
+
+def shutdown() -> None:
+    """Stop the pool; queued calls are cancelled, running ones finish in their threads."""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
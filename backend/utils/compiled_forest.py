@@ -0,0 +1,243 @@
+"""
+Array-based RandomForest evaluator.
+
+Flattens every tree of a fitted RandomForestRegressor into contiguous NumPy
+arrays so predictions can be made without sklearn at request time.
+
+Export a trained model:
+    cd backend
+    python -m utils.compiled_forest price_model.pkl price_forest
+
+A directory target stores one .npy file per array so workers can open it
+with mmap_mode and share the pages through the OS page cache; a .npz target
+is a single (private, fully read) archive. Both are replaced atomically, so
+a worker loading while an export is rewritten never sees a partial one.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+ARRAY_NAMES = ("feature", "threshold", "left", "right", "value", "roots")
+META_FILE = "meta.json"
+
+
+class CompiledForest:
+    """All trees of a forest laid out as flat node arrays.
+
+    Leaves point to themselves, so every row can walk every tree for a fixed
+    number of steps (the forest's max depth) without per-node branching.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, n_features):
+        self.feature = np.ascontiguousarray(feature, dtype=np.int32)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.left = np.ascontiguousarray(left, dtype=np.int32)
+        self.right = np.ascontiguousarray(right, dtype=np.int32)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.int32)
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in ARRAY_NAMES)
+
+    @property
+    def memory_mapped(self) -> bool:
+        return isinstance(self.value.base, np.memmap)
+
+    def digest(self) -> str:
+        """Short content hash of the node arrays, stable across save formats."""
+        h = hashlib.sha256()
+        for name in ARRAY_NAMES:
+            h.update(np.ascontiguousarray(getattr(self, name)).tobytes())
+        h.update(f"{self.max_depth}:{self.n_features}".encode())
+        return h.hexdigest()[:16]
+
+    @classmethod
+    def from_sklearn(cls, model) -> "CompiledForest":
+        """Flatten a fitted single-output RandomForestRegressor."""
+        if not hasattr(model, "estimators_"):
+            raise ValueError("Model has no estimators_; only fitted tree ensembles can be compiled")
+        if getattr(model, "n_outputs_", 1) != 1:
+            raise ValueError("Only single-output forests are supported")
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for est in model.estimators_:
+            tree = est.tree_
+            n = tree.node_count
+            node_ids = np.arange(n, dtype=np.int64)
+            is_leaf = tree.children_left == -1
+
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+            values.append(tree.value[:, 0, 0])
+            roots.append(offset)
+
+            max_depth = max(max_depth, tree.max_depth)
+            offset += n
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            value=np.concatenate(values),
+            roots=np.array(roots),
+            max_depth=max_depth,
+            n_features=model.n_features_in_,
+        )
+
+    def tree_predictions(self, X) -> np.ndarray:
+        """Per-tree predictions for every row of X, shape (n_trees, n_rows)."""
+        X = np.asarray(X)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected 2D input with {self.n_features} features, got shape {X.shape}")
+
+        # sklearn compares float32 inputs against float64 thresholds
+        X_flat = X.astype(np.float32).astype(np.float64).ravel()
+        row_offsets = (np.arange(X.shape[0]) * self.n_features)[None, :]
+
+        node = np.repeat(self.roots[:, None], X.shape[0], axis=1)
+        for _ in range(self.max_depth):
+            go_left = X_flat[row_offsets + self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        return self.value[node]
+
+    def predict(self, X) -> np.ndarray:
+        """Mean over trees, summed in the same order as RandomForestRegressor.predict."""
+        return np.add.reduce(self.tree_predictions(X), axis=0) / self.n_trees
+
+    def save(self, path: str) -> None:
+        """Write the forest to a .npz file or an export directory, atomically.
+
+        A directory export keeps its arrays in a subdirectory named by the
+        digest. The subdirectory is staged under a temporary name and
+        renamed in complete, then published by replacing meta.json in a
+        single rename, so a reader sees the old export or the new one and
+        never a mix. The previous arrays are kept for a reader that read
+        meta.json just before the swap, and a worker that still has older
+        arrays mapped keeps its inodes after they are removed.
+        """
+        if path.endswith(".npz"):
+            fd, tmp = tempfile.mkstemp(suffix=".npz", dir=os.path.dirname(path) or ".")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.savez(
+                        f,
+                        max_depth=np.array(self.max_depth),
+                        n_features=np.array(self.n_features),
+                        **{name: getattr(self, name) for name in ARRAY_NAMES},
+                    )
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+            return
+
+        os.makedirs(path, exist_ok=True)
+        version = self.digest()
+        arrays = os.path.join(path, version)
+        staging = tempfile.mkdtemp(prefix=".tmp-", dir=path)
+        try:
+            for name in ARRAY_NAMES:
+                np.save(os.path.join(staging, f"{name}.npy"), getattr(self, name))
+            try:
+                os.rename(staging, arrays)
+            except OSError:
+                # The same forest was saved before; its directory is complete
+                if not os.path.isdir(arrays):
+                    raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        previous = _read_meta(path).get("arrays")
+        meta = {"max_depth": self.max_depth, "n_features": self.n_features, "version": version, "arrays": version}
+        with open(os.path.join(path, META_FILE + ".tmp"), "w") as f:
+            json.dump(meta, f)
+        os.replace(os.path.join(path, META_FILE + ".tmp"), os.path.join(path, META_FILE))
+
+        for entry in os.listdir(path):
+            full = os.path.join(path, entry)
+            if entry in (version, previous) or entry.startswith(".tmp-"):
+                continue
+            if os.path.isdir(full):
+                shutil.rmtree(full, ignore_errors=True)
+            elif entry.endswith(".npy") and previous is not None:
+                # Top-level arrays of an export from before the subdirectory layout
+                os.unlink(full)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "CompiledForest":
+        """Load a saved forest; directory exports are memory-mapped read-only by default."""
+        if os.path.isdir(path):
+            with open(os.path.join(path, META_FILE)) as f:
+                meta = json.load(f)
+            # Older exports keep the arrays next to meta.json
+            arrays = os.path.join(path, meta.get("arrays", ""))
+            mode = "r" if mmap else None
+            return cls(
+                max_depth=meta["max_depth"],
+                n_features=meta["n_features"],
+                **{name: np.load(os.path.join(arrays, f"{name}.npy"), mmap_mode=mode) for name in ARRAY_NAMES},
+            )
+
+        with np.load(path) as data:
+            return cls(
+                max_depth=int(data["max_depth"]),
+                n_features=int(data["n_features"]),
+                **{name: data[name] for name in ARRAY_NAMES},
+            )
+
+
+def _read_meta(path: str) -> dict:
+    try:
+        with open(os.path.join(path, META_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def saved_forest_version(path: str):
+    """Version recorded by a directory export, or None."""
+    return _read_meta(path).get("version")
+
+
+def export_forest(model, path: str, n_probe: int = 1000, seed: int = 0) -> CompiledForest:
+    """Compile a fitted forest, check it against model.predict and save it to `path`.
+
+    This is the only place sklearn validates inputs; the saved arrays are
+    served as-is afterwards.
+    """
+    compiled = CompiledForest.from_sklearn(model)
+
+    rng = np.random.default_rng(seed)
+    probe = rng.normal(0, 1000, size=(n_probe, compiled.n_features))
+    expected = np.stack([est.predict(probe.astype(np.float32)) for est in model.estimators_])
+    if not np.array_equal(compiled.tree_predictions(probe), expected):
+        raise ValueError("Compiled forest does not reproduce the sklearn tree outputs")
+
+    compiled.save(path)
+    return compiled
+
+
+if __name__ == "__main__":
+    import joblib
+
+    src = sys.argv[1] if len(sys.argv) > 1 else "price_model.pkl"
+    dst = sys.argv[2] if len(sys.argv) > 2 else "price_forest"
+    forest = export_forest(joblib.load(src), dst)
+    print(f"Exported {forest.n_trees} trees ({forest.nbytes / 1e6:.1f} MB, max depth {forest.max_depth}) to {dst}")
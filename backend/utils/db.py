@@ -0,0 +1,333 @@
+"""
+Connections to the Postgres database holding market_prices.
+
+get_market_db_connection() opens a dedicated connection, for batch jobs and
+CLIs that hold one for minutes (ingest, schema migration, exports to file).
+
+Request paths borrow from the process-wide pool instead, so a request pays
+for a connection handshake only when the pool grows:
+
+    with market_db() as conn:
+        ...
+
+The API opens the pool in its lifespan (open_pool / close_pool); elsewhere
+it is created on first use. Connections are handed out most recently used
+first, pinged with SELECT 1 when they have been idle for
+DB_POOL_CHECK_IDLE_SECONDS, replaced after DB_POOL_MAX_AGE_SECONDS, and
+rolled back and reset to default session settings when returned. When all
+DB_POOL_MAX connections are busy, callers queue in arrival order for up to
+DB_POOL_TIMEOUT_SECONDS and then get PoolTimeout. Wait times go to the "db_pool.wait" latency
+histogram; stats() has the in-use, idle and waiting gauges.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import psycopg2
+from psycopg2 import extensions
+
+from utils.stage_timing import stage_metrics
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "10"))
+DB_POOL_MAX_AGE_SECONDS = float(os.getenv("DB_POOL_MAX_AGE_SECONDS", "1800"))
+DB_POOL_CHECK_IDLE_SECONDS = float(os.getenv("DB_POOL_CHECK_IDLE_SECONDS", "30"))
+
+
+def get_market_db_connection():
+    """Dedicated connection to the Postgres database holding market_prices."""
+    return psycopg2.connect(
+        dbname=os.getenv("DB_NAME", "SmartAgriDB"),
+        user=os.getenv("DB_USER", "postgres"),
+        password=os.getenv("DB_PASS", "password"),
+        host=os.getenv("DB_HOST", "localhost"),
+        port=os.getenv("DB_PORT", "5432"),
+        sslmode='prefer'
+    )
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PooledConnection:
+    """A borrowed connection: behaves like the psycopg2 connection, except
+    that close() hands it back to the pool. `with conn:` keeps psycopg2's
+    meaning (commit or roll back the transaction)."""
+
+    def __init__(self, pool: "MarketDBPool", raw, created: float):
+        self._pool = pool
+        self._raw = raw
+        self._created = created
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get("_raw")
+        if raw is None:
+            raise psycopg2.InterfaceError("connection already returned to the pool")
+        return getattr(raw, name)
+
+    @property
+    def closed(self) -> int:
+        return 1 if self._raw is None else self._raw.closed
+
+    def close(self) -> None:
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool._release(raw, self._created)
+
+    def __enter__(self):
+        self._raw.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._raw.__exit__(exc_type, exc, tb)
+
+
+class _Waiter:
+    """A getconn blocked on a full pool; _release hands it a connection (or an empty slot) directly."""
+
+    __slots__ = ("event", "handoff")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.handoff = None
+
+
+# Handoff meaning "a slot freed up, open a new connection in it"
+_NEW_SLOT = object()
+
+
+class MarketDBPool:
+    """Bounded, thread-safe pool of market database connections.
+
+    Callers blocked on a full pool are served in arrival order: a returned
+    connection goes straight to the longest waiter instead of back on the
+    idle stack, so a thread that just released one cannot jump the queue.
+    """
+
+    def __init__(self, minconn: int = DB_POOL_MIN, maxconn: int = DB_POOL_MAX,
+                 timeout: float = DB_POOL_TIMEOUT_SECONDS, max_age: float = DB_POOL_MAX_AGE_SECONDS,
+                 check_idle: float = DB_POOL_CHECK_IDLE_SECONDS, connect=get_market_db_connection):
+        self.minconn = min(minconn, maxconn)
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_age = max_age
+        self.check_idle = check_idle
+        self._connect = connect
+        self._lock = threading.Lock()
+        self._idle = deque()     # (raw, created, last_used), most recently returned on the right
+        self._waiters = deque()  # _Waiter per blocked getconn, oldest on the left
+        self._size = 0           # open connections (and slots being opened), idle or in use
+        self._in_use = 0
+        self._closed = False
+        self.counters = {"created": 0, "recycled": 0, "health_check_failures": 0, "timeouts": 0, "discarded": 0}
+
+    def open(self) -> "MarketDBPool":
+        """Open minconn connections up front, so the first requests do not pay for them."""
+        opened = []
+        while self._size + len(opened) < self.minconn:
+            opened.append((self._new_connection(), time.monotonic()))
+        with self._lock:
+            for raw, created in opened:
+                self._size += 1
+                self._idle.append((raw, created, created))
+        return self
+
+    def _new_connection(self):
+        raw = self._connect()
+        with self._lock:
+            self.counters["created"] += 1
+        return raw
+
+    def getconn(self, timeout: Optional[float] = None) -> PooledConnection:
+        """Borrow a connection; close() on it returns it. Raises PoolTimeout when none frees up in time."""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        entry = waiter = None
+        with self._lock:
+            if self._closed:
+                raise psycopg2.InterfaceError("connection pool is closed")
+            if self._idle and not self._waiters:
+                entry = self._idle.pop()
+                self._in_use += 1
+            elif self._size < self.maxconn:
+                entry = _NEW_SLOT
+                self._size += 1
+                self._in_use += 1
+            else:
+                waiter = _Waiter()
+                self._waiters.append(waiter)
+        if waiter is not None:
+            waiter.event.wait(timeout)
+            with self._lock:
+                entry = waiter.handoff
+                if entry is None:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                    if self._closed:
+                        raise psycopg2.InterfaceError("connection pool is closed")
+                    self.counters["timeouts"] += 1
+                    raise PoolTimeout(f"No market database connection free within {timeout:.1f}s "
+                                      f"({self.maxconn} in use)")
+        try:
+            raw = None
+            if entry is not _NEW_SLOT:
+                raw, created, last_used = entry
+                now = time.monotonic()
+                if now - created > self.max_age:
+                    self._discard(raw, "recycled")
+                    raw = None
+                elif now - last_used > self.check_idle and not self._ping(raw):
+                    raw = None
+            if raw is None:
+                raw, created = self._new_connection(), time.monotonic()
+        except BaseException:
+            with self._lock:
+                self._vacate()
+            raise
+        stage_metrics.histogram("db_pool.wait").record((time.monotonic() - started) * 1000)
+        return PooledConnection(self, raw, created)
+
+    def _vacate(self) -> None:
+        """Give up a borrowed slot whose connection is gone; the oldest waiter opens a new one in it. Holds _lock."""
+        if self._waiters and not self._closed:
+            waiter = self._waiters.popleft()
+            waiter.handoff = _NEW_SLOT
+            waiter.event.set()
+        else:
+            self._size -= 1
+            self._in_use -= 1
+
+    def _ping(self, raw) -> bool:
+        try:
+            with raw.cursor() as cur:
+                cur.execute("SELECT 1")
+            raw.rollback()
+            return True
+        except psycopg2.Error:
+            self._discard(raw, "health_check_failures")
+            return False
+
+    def _discard(self, raw, counter: str) -> None:
+        with self._lock:
+            self.counters[counter] += 1
+        try:
+            raw.close()
+        except psycopg2.Error:
+            pass
+
+    def _release(self, raw, created: float) -> None:
+        reason = None
+        if raw.closed or self._closed:
+            reason = "discarded"
+        elif time.monotonic() - created > self.max_age:
+            reason = "recycled"
+        else:
+            try:
+                if raw.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    raw.rollback()
+                if raw.autocommit or raw.readonly or raw.deferrable or raw.isolation_level is not None:
+                    raw.set_session(isolation_level="DEFAULT", readonly="DEFAULT",
+                                    deferrable="DEFAULT", autocommit=False)
+            except psycopg2.Error:
+                reason = "discarded"
+        if reason is not None:
+            self._discard(raw, reason)
+        with self._lock:
+            if reason is not None:
+                self._vacate()
+            elif self._waiters and not self._closed:
+                waiter = self._waiters.popleft()
+                waiter.handoff = (raw, created, time.monotonic())
+                waiter.event.set()
+            else:
+                self._in_use -= 1
+                self._idle.append((raw, created, time.monotonic()))
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def health(self) -> Dict:
+        """Round trip through a pooled connection; reports ok and latency instead of raising."""
+        started = time.perf_counter()
+        try:
+            with self.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+            return {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 3)}
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "min": self.minconn,
+                "max": self.maxconn,
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": len(self._waiters),
+                **self.counters,
+                "wait": stage_metrics.histogram("db_pool.wait").snapshot(),
+            }
+
+    def close(self) -> None:
+        """Close idle connections and fail the waiters now; borrowed ones are closed as they come back."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            waiters, self._waiters = list(self._waiters), deque()
+            self._size -= len(idle)
+        for waiter in waiters:
+            waiter.event.set()
+        for raw, _, _ in idle:
+            try:
+                raw.close()
+            except psycopg2.Error:
+                pass
+
+
+_pool: Optional[MarketDBPool] = None
+_pool_lock = threading.Lock()
+
+
+def open_pool(**kwargs) -> MarketDBPool:
+    """Create (or return) the process-wide pool and open its minimum connections."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = MarketDBPool(**kwargs)
+        pool = _pool
+    return pool.open()
+
+
+def get_pool() -> MarketDBPool:
+    """The process-wide pool, created without pre-opened connections on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = MarketDBPool()
+    return _pool
+
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+
+def market_db(timeout: Optional[float] = None):
+    """Context manager borrowing a market database connection from the process-wide pool."""
+    return get_pool().connection(timeout)
@@ -0,0 +1,285 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, NamedTuple, Optional
+
+from utils.db import market_db
+
+logger = logging.getLogger(__name__)
+
+ENTITY_COLUMNS = ['state', 'district', 'market', 'commodity', 'variety', 'grade']
+
+# Optional {"column": {"alias": "Canonical Name"}} overrides, e.g. local-language names
+ENTITY_ALIASES_PATH = os.getenv("ENTITY_ALIASES_PATH", "entity_aliases.json")
+
+# Minimum trigram similarity (same measure as pg_trgm) for a typo to resolve
+TRIGRAM_THRESHOLD = 0.5
+TRIGRAM_MARGIN = 0.1
+# Rebuild from market_prices after this long so newly ingested names resolve
+ENTITY_DICTIONARY_TTL_SECONDS = float(os.getenv("ENTITY_DICTIONARY_TTL_SECONDS", "3600"))
+MAX_MEMOIZED_LOOKUPS = 10000
+
+DISTINCT_NAMES_QUERY = """
+    SELECT {column}, COUNT(*) FROM market_prices
+    WHERE {column} IS NOT NULL
+    GROUP BY {column}
+"""
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_PARENTHETICAL = re.compile(r"\(.*?\)")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_name(name: Optional[str]) -> str:
+    """Case-, punctuation- and whitespace-insensitive key for a market name."""
+    if not name:
+        return ""
+    name = _PUNCTUATION.sub(" ", str(name).casefold())
+    return _SPACES.sub(" ", name).strip()
+
+
+def _trigrams(key: str) -> set:
+    # pg_trgm style: each word padded with two leading spaces and one trailing space
+    grams = set()
+    for word in key.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class Entity(NamedTuple):
+    name: Optional[str]    # spelling stored in market_prices, None if never seen there
+    encoded: int           # LabelEncoder index, 0 when the training data never saw it
+    match: str             # exact, alias, substring or fuzzy
+
+
+class _ColumnIndex:
+    def __init__(self):
+        self.keys: Dict[str, str] = {}          # normalized key -> canonical name
+        self.encoded: Dict[str, int] = {}       # normalized key -> encoder index
+        self.aliases: Dict[str, str] = {}       # normalized alias -> normalized key
+        self.trigrams: Dict[str, List[str]] = defaultdict(list)
+        self.resolved: Dict[str, tuple] = {}    # memoized normalized input -> (key, match)
+
+    def add_key(self, key: str, name: Optional[str] = None) -> None:
+        if key not in self.keys and key not in self.encoded:
+            for gram in _trigrams(key):
+                self.trigrams[gram].append(key)
+        if name is not None:
+            self.keys.setdefault(key, name)
+
+    def lookup(self, key: str):
+        if key in self.keys or key in self.encoded:
+            return key, "exact"
+        if key in self.aliases:
+            return self.aliases[key], "alias"
+        if key in self.resolved:
+            return self.resolved[key]
+
+        found = (None, None)
+        # ILIKE '%name%' semantics, but only when the substring is unambiguous
+        containing = [k for k in self.keys if key in k]
+        if len(containing) == 1:
+            found = (containing[0], "substring")
+        else:
+            grams = _trigrams(key)
+            shared = Counter(k for gram in grams for k in self.trigrams.get(gram, ()))
+            best, best_score, runner_up = None, 0.0, 0.0
+            for candidate, common in shared.items():
+                score = common / (len(grams) + len(_trigrams(candidate)) - common)
+                if score > best_score:
+                    best, best_score, runner_up = candidate, score, best_score
+                elif score > runner_up:
+                    runner_up = score
+            # A close second means the input is ambiguous; better no match than a wrong one
+            if best is not None and best_score >= TRIGRAM_THRESHOLD and best_score - runner_up >= TRIGRAM_MARGIN:
+                found = (best, "fuzzy")
+        if len(self.resolved) >= MAX_MEMOIZED_LOOKUPS:
+            self.resolved.clear()
+        self.resolved[key] = found
+        return found
+
+
+class EntityDictionary:
+    """Canonical names for the categorical market columns.
+
+    Built from the distinct values in market_prices and the classes the
+    LabelEncoders were fitted on. Inputs resolve through normalized keys,
+    aliases, unambiguous substrings and finally trigram similarity, so
+    queries can compare indexed columns with equality and encoding is a
+    dict lookup.
+    """
+
+    def __init__(self):
+        self._columns = {col: _ColumnIndex() for col in ENTITY_COLUMNS}
+        self._lock = threading.Lock()
+        self.built_at = time.monotonic()
+        self.encoders = None   # the LabelEncoders the encoded indexes came from
+
+    @classmethod
+    def build(cls, conn=None, encoders=None, aliases: Optional[Dict[str, Dict[str, str]]] = None):
+        entities = cls()
+        entities.encoders = encoders
+        if conn is not None:
+            with conn.cursor() as cur:
+                for col in ENTITY_COLUMNS:
+                    cur.execute(DISTINCT_NAMES_QUERY.format(column=col))
+                    # Most frequent spelling wins when several normalize to the same key
+                    for name, _ in sorted(cur.fetchall(), key=lambda r: -r[1]):
+                        key = normalize_name(name)
+                        if key:
+                            entities._columns[col].add_key(key, name)
+        for col, le in (encoders or {}).items():
+            if col not in entities._columns:
+                continue
+            index = entities._columns[col]
+            for i, name in enumerate(le.classes_):
+                key = normalize_name(name)
+                if key:
+                    index.add_key(key)
+                    # The exact class wins over a differently-cased duplicate
+                    if name == index.keys.get(key, name) or key not in index.encoded:
+                        index.encoded[key] = i
+        entities._add_derived_aliases()
+        for col, mapping in (aliases or {}).items():
+            for alias, name in mapping.items():
+                entities.add_alias(col, alias, name)
+        return entities
+
+    def _add_derived_aliases(self) -> None:
+        # "Paddy(Dhan)(Common)" is also reachable as "paddy"
+        for index in self._columns.values():
+            for key, name in list(index.keys.items()):
+                short = normalize_name(_PARENTHETICAL.sub(" ", name))
+                if short and short != key and short not in index.keys:
+                    index.aliases.setdefault(short, key)
+
+    def add_alias(self, column: str, alias: str, name: str) -> None:
+        index = self._columns[column]
+        key = normalize_name(name)
+        if key in index.keys or key in index.encoded:
+            with self._lock:
+                index.aliases[normalize_name(alias)] = key
+                index.resolved.clear()
+
+    def resolve(self, column: str, value: Optional[str]) -> Entity:
+        index = self._columns[column]
+        key = normalize_name(value)
+        if not key:
+            return Entity(None, 0, "none")
+        with self._lock:
+            found, match = index.lookup(key)
+        if found is None:
+            return Entity(None, 0, "none")
+        return Entity(index.keys.get(found), index.encoded.get(found, 0), match)
+
+    def encode(self, column: str, value: Optional[str], unseen: int = 0) -> int:
+        """Encoder index of value, or unseen when the encoders were never fitted on it."""
+        index = self._columns[column]
+        key = normalize_name(value)
+        if not key:
+            return unseen
+        with self._lock:
+            found, _ = index.lookup(key)
+        return index.encoded.get(found, unseen) if found is not None else unseen
+
+    def canonical(self, column: str, value: Optional[str]) -> Optional[str]:
+        return self.resolve(column, value).name
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            col: {
+                "names": len(index.keys),
+                "encoded": len(index.encoded),
+                "aliases": len(index.aliases),
+                "memoized": len(index.resolved),
+            }
+            for col, index in self._columns.items()
+        }
+
+
+def load_aliases(path: str = ENTITY_ALIASES_PATH) -> Dict[str, Dict[str, str]]:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"Could not read entity aliases from {path}: {e}")
+        return {}
+
+
+_dictionary: Optional[EntityDictionary] = None
+_dictionary_lock = threading.Lock()
+_rebuild: Optional[threading.Thread] = None
+
+
+def _build(encoders, current: Optional[EntityDictionary], max_age: float) -> EntityDictionary:
+    try:
+        with market_db() as conn:
+            built = EntityDictionary.build(conn, encoders, load_aliases())
+        logger.info(f"Entity dictionary built: {built.stats()}")
+        return built
+    except Exception as e:
+        logger.warning(f"Entity dictionary build failed: {e}")
+        if current is not None and current.encoders is encoders:
+            built = current
+        else:
+            # Encoder classes alone still give O(1) encoding; names stay unresolved
+            built = EntityDictionary.build(None, encoders, load_aliases())
+        # Retry in a minute instead of on every request
+        built.built_at = time.monotonic() - max(max_age - 60, 0)
+        return built
+
+
+def build_entity_dictionary(encoders=None) -> EntityDictionary:
+    """Unshared dictionary for encoders other than the serving model's, e.g. a shadow candidate's."""
+    return _build(encoders, None, ENTITY_DICTIONARY_TTL_SECONDS)
+
+
+def _rebuild_in_background(current: EntityDictionary, encoders, max_age: float) -> None:
+    global _dictionary
+    built = _build(encoders, current, max_age)
+    with _dictionary_lock:
+        if _dictionary is current:
+            _dictionary = built
+
+
+def get_entity_dictionary(encoders=None, max_age: float = ENTITY_DICTIONARY_TTL_SECONDS) -> EntityDictionary:
+    """Shared dictionary, rebuilt once it is older than max_age.
+
+    The first call, and the first call with different encoders (after a
+    model swap), build synchronously so indexes always come from the
+    encoders asked for. After that an expired dictionary keeps being served
+    while a background thread rebuilds it from market_prices, so requests
+    never wait on the DISTINCT scans. When market_prices cannot be read the
+    previous dictionary is kept if it has the same encoders; otherwise an
+    encoder-only one is returned whose names never resolve, so callers fall
+    back to pattern matching.
+    """
+    global _dictionary, _rebuild
+    current = _dictionary
+    swapped = current is not None and encoders is not None and current.encoders is not encoders
+    if current is not None and not swapped and time.monotonic() - current.built_at < max_age:
+        return current
+    with _dictionary_lock:
+        if _dictionary is None or (encoders is not None and _dictionary.encoders is not encoders):
+            _dictionary = _build(encoders, _dictionary, max_age)
+        elif _dictionary is current and (_rebuild is None or not _rebuild.is_alive()):
+            if encoders is None:
+                encoders = current.encoders
+            _rebuild = threading.Thread(target=_rebuild_in_background, args=(current, encoders, max_age),
+                                        name="entity-dictionary-rebuild", daemon=True)
+            _rebuild.start()
+        return _dictionary
+
+
+def invalidate_entity_dictionary() -> None:
+    """Rebuild (in the background) on next use, e.g. after new market rows were ingested."""
+    with _dictionary_lock:
+        if _dictionary is not None:
+            _dictionary.built_at = float("-inf")
@@ -0,0 +1,351 @@
+"""
+Training features computed with native grouped operations and cached on disk.
+
+compute_features() replaces the per-group Python lambdas that preprocess_data
+used to run. FeatureStore keeps its output as one Parquet file per month under
+FEATURE_STORE_DIR, plus the last few prices of every series, so a retrain only
+computes features for rows from the sync's overlap window onwards.
+
+Usage:
+    cd backend
+    python -m utils.feature_store            # bring the store up to date
+    python -m utils.feature_store --rebuild  # recompute everything
+"""
+import json
+import logging
+import os
+import tempfile
+from datetime import date, timedelta
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.price_forecast import HISTORY_WINDOW
+
+logger = logging.getLogger(__name__)
+
+FEATURE_STORE_DIR = os.getenv("FEATURE_STORE_DIR", "feature_store")
+# Bump when compute_features or the stored layout changes so stale stores are rebuilt instead of mixed
+FEATURE_VERSION = 3
+# Days before last_date reloaded on every update, matching the window fetch_market_prices re-fetches
+# for late and revised records
+SYNC_OVERLAP_DAYS = int(os.getenv("MARKET_SYNC_OVERLAP_DAYS", "2"))
+
+SERIES_KEYS = ['state', 'district', 'market', 'commodity', 'variety']
+KEY_COLS = SERIES_KEYS + ['grade']
+FEATURE_COLS = ['modal_price', 'moving_avg_7d', 'price_lag_1d', 'is_weekend']
+STORED_COLS = KEY_COLS + ['arrival_date'] + FEATURE_COLS
+
+META_FILE = "meta.json"
+TAIL_FILE = "tail.parquet"
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as exc:
+        raise RuntimeError("The feature store needs pyarrow: pip install pyarrow") from exc
+
+
+def _interpolate(prices: np.ndarray, group_ids: np.ndarray) -> np.ndarray:
+    """Linear interpolation inside each series, then bfill/ffill at the edges.
+
+    Same result as x.interpolate('linear').bfill().ffill() per group: gaps are
+    filled from the neighbouring valid prices by row position, leading gaps take
+    the first valid price and trailing gaps the last one.
+    """
+    valid = ~np.isnan(prices)
+    if valid.all():
+        return prices
+    pos = np.arange(len(prices), dtype=np.float64)
+    frame = pd.DataFrame({
+        "pos": np.where(valid, pos, np.nan),
+        "price": prices,
+    })
+    grouped = frame.groupby(group_ids, sort=False)
+    prev = grouped.ffill().to_numpy()
+    nxt = grouped.bfill().to_numpy()
+    prev_pos, prev_price = prev[:, 0], prev[:, 1]
+    next_pos, next_price = nxt[:, 0], nxt[:, 1]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = (next_price - prev_price) / (next_pos - prev_pos)
+        between = slope * (pos - prev_pos) + prev_price
+    has_prev = ~np.isnan(prev_pos)
+    has_next = ~np.isnan(next_pos)
+    filled = np.where(has_prev & has_next, between, np.where(has_prev, prev_price, next_price))
+    return np.where(valid, prices, filled)
+
+
+def compute_features(df: pd.DataFrame, context: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Add moving_avg_7d, price_lag_1d and is_weekend to raw market_prices rows.
+
+    Rows are sorted by series and date and modal_price is interpolated within
+    each series, as preprocess_data always did. The 7-day moving average is the
+    sum of the current and up to six previous prices, newest first, divided by
+    how many there are -- the same arithmetic the API uses when it forecasts.
+
+    context holds already-processed earlier rows (SERIES_KEYS, arrival_date,
+    modal_price) to seed the lag and moving average of a delta; those rows are
+    dropped from the result.
+    """
+    df = df.copy()
+    df['arrival_date'] = pd.to_datetime(df['arrival_date'])
+    df['modal_price'] = df['modal_price'].astype('float64')
+    df['_context'] = False
+    if context is not None and len(context):
+        context = context[SERIES_KEYS + ['arrival_date', 'modal_price']].copy()
+        context['_context'] = True
+        for col in KEY_COLS:
+            if col in df and isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype(str)
+        df = pd.concat([context, df], ignore_index=True)
+
+    # Context rows come first, so on equal dates they stay ahead of the new rows
+    df = df.sort_values(by=SERIES_KEYS + ['arrival_date'], kind='stable').reset_index(drop=True)
+    group_ids = df.groupby(SERIES_KEYS, observed=True, sort=False).ngroup().to_numpy()
+
+    df['modal_price'] = _interpolate(df['modal_price'].to_numpy(), group_ids)
+    keep = ~np.isnan(df['modal_price'].to_numpy())
+    if not keep.all():
+        df = df[keep].reset_index(drop=True)
+        group_ids = group_ids[keep]
+
+    prices = df['modal_price'].to_numpy()
+    shifted = pd.Series(prices).groupby(group_ids, sort=False)
+    total = prices.copy()
+    count = np.ones(len(prices))
+    lag = None
+    for k in range(1, HISTORY_WINDOW):
+        previous = shifted.shift(k).to_numpy()
+        if lag is None:
+            lag = previous
+        present = ~np.isnan(previous)
+        total += np.where(present, previous, 0.0)
+        count += present
+    df['moving_avg_7d'] = total / count
+    df['price_lag_1d'] = np.where(np.isnan(lag), prices, lag)
+    df['is_weekend'] = (df['arrival_date'].dt.dayofweek >= 5).astype(np.int64)
+
+    df = df[~df['_context'].to_numpy()].drop(columns='_context')
+    return df.reset_index(drop=True)
+
+
+class FeatureStore:
+    """Month-partitioned Parquet store of compute_features output.
+
+    Layout under root:
+        month=YYYY-MM.parquet  features for rows arriving that month
+        tail.parquet           per series, the last HISTORY_WINDOW - 1 settled rows before
+                               the reload window, plus every later row
+        meta.json              last stored arrival_date, reload window start, row count,
+                               FEATURE_VERSION
+
+    Every update reloads the rows of the last overlap_days before last_date,
+    so rows the sync added late or revised inside that window replace the
+    stored ones. Rows backfilled further back are not picked up; run with
+    rebuild=True after such a backfill.
+    """
+
+    def __init__(self, root: str = FEATURE_STORE_DIR):
+        self.root = root
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def meta(self) -> dict:
+        try:
+            with open(self._path(META_FILE)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if meta.get("version") != FEATURE_VERSION:
+            return {}
+        return meta
+
+    @property
+    def last_date(self) -> Optional[date]:
+        value = self.meta().get("last_date")
+        return date.fromisoformat(value) if value else None
+
+    def months(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name[len("month="):-len(".parquet")]
+            for name in os.listdir(self.root)
+            if name.startswith("month=") and name.endswith(".parquet")
+        )
+
+    def _write_parquet(self, df: pd.DataFrame, name: str) -> None:
+        # Write next to the target and rename so readers never see half a file
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        os.close(fd)
+        try:
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, self._path(name))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _write_meta(self, meta: dict) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp, self._path(META_FILE))
+
+    def _clear(self) -> None:
+        for month in self.months():
+            os.unlink(self._path(f"month={month}.parquet"))
+        for name in (TAIL_FILE, META_FILE):
+            if os.path.exists(self._path(name)):
+                os.unlink(self._path(name))
+
+    def _tail(self) -> Optional[pd.DataFrame]:
+        path = self._path(TAIL_FILE)
+        return pd.read_parquet(path) if os.path.exists(path) else None
+
+    @staticmethod
+    def _next_tail(rows: pd.DataFrame, reload_from: date) -> pd.DataFrame:
+        """Rows the next update needs, from this update's input rows (raw_price) and features (modal_price).
+
+        Rows after the newest reported price of their series are pending: their
+        interpolated price depends on prices that have not arrived yet, so the
+        next update recomputes them from the raw price. Rows after reload_from
+        are reloaded by the next update and kept only so an overlap window
+        that shrinks still finds its context. Before both, the last
+        HISTORY_WINDOW - 1 settled rows seed the lag and moving average.
+        """
+        rows = rows.sort_values(by=SERIES_KEYS + ['arrival_date'], kind='stable').reset_index(drop=True)
+        group_ids = rows.groupby(SERIES_KEYS, sort=False).ngroup().to_numpy()
+        backwards = pd.Series(group_ids[::-1])
+        reported_after = pd.Series(rows['raw_price'].notna().to_numpy()[::-1]).groupby(backwards).cumsum()
+        pending = (reported_after.to_numpy() == 0)[::-1]
+        settled = ~pending & (rows['arrival_date'].dt.date <= reload_from).to_numpy()
+        settled_after = pd.Series(settled[::-1]).groupby(backwards).cumsum().to_numpy()[::-1]
+        keep = ~settled | (settled_after <= HISTORY_WINDOW - 1)
+        tail = rows[keep].copy()
+        tail['pending'] = pending[keep]
+        return tail.reset_index(drop=True)
+
+    def update(self, loader: Callable[[Optional[date]], pd.DataFrame], rebuild: bool = False,
+               overlap_days: int = SYNC_OVERLAP_DAYS) -> int:
+        """Compute and store features for rows from overlap_days before last_date onwards.
+
+        loader(since) returns raw market_prices rows with arrival_date > since
+        (all rows when since is None). The reloaded rows, and pending rows
+        kept in the tail, are recomputed and replace their stored features.
+        Returns the net number of rows added.
+        """
+        _require_pyarrow()
+        meta = {} if rebuild else self.meta()
+        last_date = date.fromisoformat(meta["last_date"]) if meta.get("last_date") else None
+        since = None
+        if last_date is not None:
+            since = last_date - timedelta(days=overlap_days)
+            # The tail only holds context from where the previous update expected to reload
+            since = max(since, date.fromisoformat(meta.get("reload_from", since.isoformat())))
+        os.makedirs(self.root, exist_ok=True)
+        if since is None:
+            self._clear()
+
+        raw = loader(since)
+        if raw.empty:
+            logger.info("Feature store up to date (last_date=%s)", last_date)
+            return 0
+        raw = raw[KEY_COLS + ['arrival_date', 'modal_price']].copy()
+        for col in KEY_COLS:
+            raw[col] = raw[col].astype(str)
+        raw['arrival_date'] = pd.to_datetime(raw['arrival_date'])
+        raw['modal_price'] = raw['modal_price'].astype('float64')
+
+        context = None
+        tail = self._tail() if since is not None else None
+        if tail is not None:
+            # Later rows were just reloaded (anything after last_date is left over from an interrupted update)
+            tail = tail[tail['arrival_date'].dt.date <= since]
+            context = tail[~tail['pending']]
+            pending = tail.loc[tail['pending'], KEY_COLS + ['arrival_date', 'raw_price']]
+            raw = pd.concat([pending.rename(columns={'raw_price': 'modal_price'}), raw], ignore_index=True)
+        features = compute_features(raw, context)
+        for col in KEY_COLS:
+            features[col] = features[col].astype(str)
+        features = features[STORED_COLS]
+
+        dates = features['arrival_date'].dt
+        parts = {
+            f"{yyyymm // 100:04d}-{yyyymm % 100:02d}": part
+            for yyyymm, part in features.groupby(dates.year * 100 + dates.month, sort=True)
+        }
+        existing = set(self.months())
+        # Stored months holding reloaded rows are rewritten even if none of those rows came back
+        reloaded = {month for month in existing if since is not None and month >= f"{since:%Y-%m}"}
+        replaced = 0
+        for month in sorted(set(parts) | reloaded):
+            name = f"month={month}.parquet"
+            part = parts.get(month, features.iloc[:0])
+            if month in existing:
+                stored = pd.read_parquet(self._path(name))
+                kept = stored[stored['arrival_date'].dt.date <= since]
+                # Pending rows stored by earlier updates are replaced by their recomputed features
+                row_key = KEY_COLS + ['arrival_date']
+                redone = pd.MultiIndex.from_frame(kept[row_key]).isin(pd.MultiIndex.from_frame(part[row_key]))
+                kept = kept[~redone]
+                replaced += len(stored) - len(kept)
+                part = pd.concat([kept, part], ignore_index=True)
+            if part.empty:
+                os.unlink(self._path(name))
+                continue
+            self._write_parquet(part, name)
+
+        computed = raw.rename(columns={'modal_price': 'raw_price'}).merge(
+            features[KEY_COLS + ['arrival_date', 'modal_price']], on=KEY_COLS + ['arrival_date'], how='left')
+        if context is not None:
+            settled = context[KEY_COLS + ['arrival_date', 'modal_price', 'raw_price']]
+            computed = pd.concat([settled, computed], ignore_index=True)
+        # Loaded rows count even while pending, so the next loader call does not return them again
+        new_last_date = raw['arrival_date'].max().date()
+        if last_date is not None:
+            new_last_date = max(new_last_date, last_date)
+        reload_from = new_last_date - timedelta(days=overlap_days)
+        tail = self._next_tail(computed, reload_from)
+        self._write_parquet(tail, TAIL_FILE)
+
+        added = len(features) - replaced
+        self._write_meta({
+            "version": FEATURE_VERSION,
+            "last_date": new_last_date.isoformat(),
+            "reload_from": reload_from.isoformat(),
+            "rows": meta.get("rows", 0) + added,
+            "series": int(tail[SERIES_KEYS].drop_duplicates().shape[0]),
+        })
+        logger.info("Stored features for %d rows after %s", len(features), since)
+        return added
+
+    def read(self) -> pd.DataFrame:
+        """All stored features, sorted by series and date like preprocess_data output."""
+        _require_pyarrow()
+        months = self.months()
+        if not months:
+            return pd.DataFrame(columns=STORED_COLS)
+        df = pd.concat(
+            [pd.read_parquet(self._path(f"month={m}.parquet")) for m in months], ignore_index=True
+        )
+        return df.sort_values(by=SERIES_KEYS + ['arrival_date'], kind='stable').reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from train_model import load_data
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(description="Update the training feature store")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute features for every row")
+    parser.add_argument("--root", default=FEATURE_STORE_DIR)
+    args = parser.parse_args()
+
+    store = FeatureStore(args.root)
+    added = store.update(lambda since: load_data(since=since), rebuild=args.rebuild)
+    print(f"Added {added} rows; store now covers up to {store.last_date} ({store.meta().get('rows', 0)} rows)")
@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, Hashable, Iterable, Optional, Sequence
+
+
+def forecast_cache_key(encoded: Sequence[int], forecast_days: int, mode: str, model_version: Optional[str],
+                       latest_arrival_date: Optional[date], day: date, prices: Sequence[float]) -> tuple:
+    """Cache key for one /predict-price forecast.
+
+    The resolved history is part of the key: unknown names all encode to 0,
+    so the encoded series alone does not identify what was forecast. The
+    model version and the day keep entries from outliving a model swap or
+    the date the forecast starts from.
+    """
+    return (tuple(encoded), forecast_days, mode, model_version, latest_arrival_date, day, tuple(prices))
+
+
+class ForecastCache:
+    """Thread-safe in-process LRU cache with a per-entry TTL.
+
+    Entries are tagged with the commodity they were computed for so the
+    ingestion job can drop forecasts that new market rows may have changed.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 6 * 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value, _ = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, commodity: Optional[str] = None) -> None:
+        if self.max_entries <= 0:
+            return
+        tag = commodity.strip().lower() if commodity else None
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value, tag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_commodities(self, commodities: Iterable[str]) -> int:
+        """Drop entries whose requested commodity matches any of the given names.
+
+        Requests match commodities with ILIKE '%name%', so an entry is dropped
+        when its commodity is a substring of an ingested commodity name.
+        """
+        names = [c.strip().lower() for c in commodities if c]
+        with self._lock:
+            stale = [
+                key for key, (_, _, tag) in self._entries.items()
+                if tag is None or any(tag in name for name in names)
+            ]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self.invalidations += count
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,103 @@
+"""
+Paging, streaming and conditional GET for /mandi-prices.
+
+Pages are keyset-paginated on (arrival_date, id), newest first: a cursor
+holds the key of the last row of the previous page, so every page is an
+index range scan however deep the client goes. Rows are read through a
+server-side cursor and written to the response as a JSON array in chunks
+of MANDI_STREAM_BATCH_ROWS, so memory per request does not grow with the
+page size.
+
+The ETag is derived from the ingest watermark in market_sync_state, whose
+updated_at moves with every batch the sync commits, and from the request's
+normalized filters and cursor; a client sending it back in If-None-Match
+for the same page gets 304 Not Modified until new rows land.
+"""
+import base64
+import binascii
+import hashlib
+import json
+import os
+from datetime import date
+from decimal import Decimal
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+MANDI_STREAM_BATCH_ROWS = int(os.getenv("MANDI_STREAM_BATCH_ROWS", "500"))
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(key: Tuple[date, int]) -> str:
+    arrival_date, row_id = key
+    return base64.urlsafe_b64encode(f"{arrival_date.isoformat()}|{row_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[date, int]:
+    """(arrival_date, id) from a cursor produced by encode_cursor; InvalidCursor otherwise."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        arrival_date, row_id = raw.split("|")
+        return date.fromisoformat(arrival_date), int(row_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+
+
+def ingest_etag(cur, scope: Sequence = ()) -> Optional[str]:
+    """ETag for the current ingest watermark and the request scope, or None before the first sync.
+
+    scope holds what selects the rows (normalized filters, page size,
+    cursor), so two different pages never share a tag.
+    """
+    cur.execute("SELECT to_regclass('market_sync_state')")
+    if cur.fetchone()[0] is None:
+        return None
+    cur.execute("SELECT max(watermark), max(updated_at) FROM market_sync_state")
+    watermark, updated_at = cur.fetchone()
+    if updated_at is None:
+        return None
+    key = json.dumps([str(watermark), updated_at.isoformat(), *scope], default=str)
+    digest = hashlib.sha1(key.encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    if not if_none_match or not etag:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def stream_rows(conn, query: str, params: list, columns: List[str],
+                batch_rows: int = MANDI_STREAM_BATCH_ROWS) -> Iterator[str]:
+    """Run query on a server-side cursor and yield its rows as chunks of one JSON array.
+
+    Owns conn: the read transaction is ended and the connection closed
+    when the stream finishes or the client goes away.
+    """
+    try:
+        with conn.cursor(name="mandi_prices") as cur:
+            cur.itersize = batch_rows
+            cur.execute(query, params)
+            yield "["
+            first = True
+            while True:
+                rows = cur.fetchmany(batch_rows)
+                if not rows:
+                    break
+                chunk = ",".join(json.dumps(dict(zip(columns, row)), default=_json_value) for row in rows)
+                yield chunk if first else "," + chunk
+                first = False
+            yield "]"
+    finally:
+        conn.rollback()
+        conn.close()
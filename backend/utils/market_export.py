@@ -0,0 +1,214 @@
+"""
+Columnar bulk export of market_prices as Arrow IPC streams or Parquet.
+
+Rows matching a date range (and optionally a state and commodity) are read
+in keyset chunks of MARKET_EXPORT_BATCH_ROWS on (arrival_date, id): each
+chunk is one COPY ... TO STDOUT, parsed by pyarrow's CSV reader straight
+into columns, and written out as an Arrow record batch (a Parquet row group)
+before the next chunk is read. Memory stays bounded by the chunk size
+however long the range is, and no per-row Python objects are built. The
+repeated name columns are dictionary encoded, and prices are plain doubles.
+All chunks are read from one REPEATABLE READ snapshot.
+
+    python -m utils.market_export --start 2024-05-01 --end 2024-05-31 -o may.parquet
+    python -m utils.market_export --format arrow --state Kerala --start 2024-05-01 -o kerala.arrows
+
+Used by GET /market-prices/export. Needs pyarrow (see require_pyarrow()).
+"""
+import io
+import os
+from datetime import date
+from typing import Iterator, List, Optional, Tuple
+
+from utils.market_history import name_filters
+
+MARKET_EXPORT_BATCH_ROWS = int(os.getenv("MARKET_EXPORT_BATCH_ROWS", "65536"))
+# Parquet pages are compressed; Arrow streams stay uncompressed for readers without codec support
+MARKET_EXPORT_PARQUET_COMPRESSION = os.getenv("MARKET_EXPORT_PARQUET_COMPRESSION", "zstd")
+
+FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+NAME_COLUMNS = ['state', 'district', 'market', 'commodity', 'variety', 'grade']
+PRICE_COLUMNS = ['min_price', 'max_price', 'modal_price']
+
+
+def require_pyarrow():
+    """Raise RuntimeError unless pyarrow is installed.
+
+    Called before an export starts: stream_export is a generator, so a
+    failed import inside it would only surface after the response began.
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as exc:
+        raise RuntimeError("Market price export needs pyarrow: pip install pyarrow") from exc
+
+
+def export_schema():
+    import pyarrow as pa
+
+    return pa.schema(
+        [pa.field('id', pa.int64(), nullable=False)]
+        + [pa.field(col, pa.dictionary(pa.int32(), pa.string())) for col in NAME_COLUMNS]
+        + [pa.field('arrival_date', pa.date32(), nullable=False)]
+        + [pa.field(col, pa.float64()) for col in PRICE_COLUMNS]
+    )
+
+
+def export_filters(entities, start: date, end: date, state: Optional[str] = None,
+                   commodity: Optional[str] = None) -> Tuple[str, list]:
+    """WHERE clause (and params) for rows with start <= arrival_date <= end.
+
+    State and commodity match the canonical name when they resolve, and
+    case-insensitively otherwise (no wildcards: an export filter is exact).
+    """
+    where, params = name_filters(entities, (("state", state, state), ("commodity", commodity, commodity)))
+    return f"arrival_date BETWEEN %s AND %s{where}", [start, end] + params
+
+
+def chunk_query(where: str, params: list, after: Optional[Tuple[date, int]], limit: int) -> Tuple[str, list]:
+    """COPY of the next `limit` rows after the (arrival_date, id) key `after`, as CSV."""
+    prices = ", ".join(f"{col}::float8" for col in PRICE_COLUMNS)
+    keyset = ""
+    if after is not None:
+        keyset = " AND (arrival_date, id) > (%s, %s)"
+        params = params + list(after)
+    query = f"""
+        COPY (
+            SELECT id, {", ".join(NAME_COLUMNS)}, arrival_date, {prices}
+            FROM market_prices WHERE {where}{keyset}
+            ORDER BY arrival_date, id LIMIT %s
+        ) TO STDOUT WITH (FORMAT csv)
+    """
+    return query, params + [limit]
+
+
+def record_batches(conn, where: str, params: list, batch_rows: int = MARKET_EXPORT_BATCH_ROWS) -> Iterator:
+    """Yield one Arrow record batch per keyset chunk of matching rows, in (arrival_date, id) order."""
+    import pyarrow.csv as pcsv
+
+    schema = export_schema()
+    read_options = pcsv.ReadOptions(column_names=schema.names)
+    # COPY writes NULL as an empty field and '' as a quoted one
+    convert_options = pcsv.ConvertOptions(column_types={field.name: field.type for field in schema},
+                                          strings_can_be_null=True, quoted_strings_can_be_null=False)
+    after = None
+    with conn.cursor() as cur:
+        while True:
+            buf = io.BytesIO()
+            query, query_params = chunk_query(where, params, after, batch_rows)
+            cur.copy_expert(cur.mogrify(query, query_params).decode(), buf)
+            if not buf.tell():
+                break
+            buf.seek(0)
+            table = pcsv.read_csv(buf, read_options=read_options, convert_options=convert_options)
+            yield from table.cast(schema).combine_chunks().to_batches()
+            if table.num_rows < batch_rows:
+                break
+            after = (table.column('arrival_date')[-1].as_py(), table.column('id')[-1].as_py())
+
+
+class _ChunkSink:
+    """Write-only file that hands back what was written since the last drain.
+
+    Keeps the running position for tell(), which the Parquet writer needs
+    for the offsets in its footer.
+    """
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def writable(self) -> bool:
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_export(conn, where: str, params: list, fmt: str = "parquet",
+                  batch_rows: int = MARKET_EXPORT_BATCH_ROWS) -> Iterator[bytes]:
+    """Encode the matching rows as an Arrow IPC stream or a Parquet file, yielding bytes per batch.
+
+    Owns conn, which must not be in a transaction yet: the export reads
+    from one read-only snapshot, and the connection is closed when it
+    finishes or the consumer stops.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {sorted(FORMATS)}")
+    sink = _ChunkSink()
+    out = pa.PythonFile(sink, mode="w")
+    schema = export_schema()
+    try:
+        conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        if fmt == "parquet":
+            writer = pq.ParquetWriter(out, schema, compression=MARKET_EXPORT_PARQUET_COMPRESSION)
+        else:
+            writer = pa.ipc.new_stream(out, schema)
+        for batch in record_batches(conn, where, params, batch_rows):
+            if fmt == "parquet":
+                writer.write_batch(batch, row_group_size=batch.num_rows)
+            else:
+                writer.write_batch(batch)
+            yield sink.drain()
+        writer.close()
+        yield sink.drain()
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from datetime import timedelta
+
+    from utils.db import get_market_db_connection
+    from utils.entity_dictionary import EntityDictionary
+
+    parser = argparse.ArgumentParser(description="Export market_prices as Parquet or an Arrow IPC stream")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="parquet")
+    parser.add_argument("--start", type=date.fromisoformat, help="First arrival date (default: 30 days ago)")
+    parser.add_argument("--end", type=date.fromisoformat, help="Last arrival date (default: today)")
+    parser.add_argument("--state")
+    parser.add_argument("--commodity")
+    parser.add_argument("-o", "--output", required=True, help="File to write")
+    args = parser.parse_args()
+    require_pyarrow()
+
+    end = args.end or date.today()
+    start = args.start or end - timedelta(days=30)
+    conn = get_market_db_connection()
+    entities = EntityDictionary.build(conn)
+    where, params = export_filters(entities, start, end, args.state, args.commodity)
+    conn.commit()
+    started = time.perf_counter()
+    size = 0
+    with open(args.output, "wb") as f:
+        for chunk in stream_export(conn, where, params, args.format):
+            f.write(chunk)
+            size += len(chunk)
+    print(f"Wrote {size / 1e6:.1f} MB to {args.output} in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,234 @@
+"""
+Concurrent, retrying page fetcher for the data.gov.in mandi price resource.
+
+fetch_pages() keeps up to MARKET_FETCH_CONCURRENCY page requests in flight
+over one pooled httpx client instead of walking offsets one at a time.
+Timeouts, connection errors, 429 and 5xx responses are retried with
+full-jitter exponential backoff (a Retry-After header is honoured, and a 429
+pauses every worker), and request starts are spaced to MARKET_FETCH_MAX_RPS.
+Fetched pages go through a bounded queue to a single writer callback running
+in a worker thread, so a slow database slows the fetchers down rather than
+buffering the whole resource in memory.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+MARKET_FETCH_CONCURRENCY = int(os.getenv("MARKET_FETCH_CONCURRENCY", "4"))
+MARKET_FETCH_MAX_RPS = float(os.getenv("MARKET_FETCH_MAX_RPS", "4"))
+MARKET_FETCH_RETRIES = int(os.getenv("MARKET_FETCH_RETRIES", "5"))
+MARKET_FETCH_TIMEOUT_SECONDS = float(os.getenv("MARKET_FETCH_TIMEOUT_SECONDS", "30"))
+MARKET_FETCH_QUEUE_SIZE = int(os.getenv("MARKET_FETCH_QUEUE_SIZE", "8"))
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 60.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class PageFetchError(Exception):
+    """A page still failed after every retry."""
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE_SECONDS, cap: float = BACKOFF_MAX_SECONDS) -> float:
+    """Full jitter: uniform over [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _retry_after(resp: httpx.Response) -> Optional[float]:
+    try:
+        return max(float(resp.headers["Retry-After"]), 0.0)
+    except (KeyError, ValueError):
+        # Missing, or an HTTP date; the jittered backoff applies instead
+        return None
+
+
+class RateLimiter:
+    """Spaces request starts at least 1/max_rps apart across all workers.
+
+    pause() holds every worker back, e.g. for a 429's Retry-After.
+    """
+
+    def __init__(self, max_rps: float):
+        self.interval = 1.0 / max_rps if max_rps > 0 else 0.0
+        self._next = 0.0
+        self._paused_until = 0.0
+
+    async def wait(self):
+        while True:
+            now = time.monotonic()
+            start = max(self._next, self._paused_until)
+            if start <= now:
+                self._next = now + self.interval
+                return
+            await asyncio.sleep(start - now)
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+async def fetch_page(client: httpx.AsyncClient, url: str, params: Dict, limiter: RateLimiter,
+                     retries: int = MARKET_FETCH_RETRIES, backoff_base: float = BACKOFF_BASE_SECONDS,
+                     stats: Optional[Dict] = None) -> Dict:
+    """GET one page and return its JSON body, retrying transient failures."""
+    stats = stats if stats is not None else {"requests": 0, "retries": 0}
+    error = None
+    for attempt in range(retries + 1):
+        await limiter.wait()
+        stats["requests"] += 1
+        delay = backoff_delay(attempt, backoff_base)
+        try:
+            resp = await client.get(url, params=params)
+            if resp.status_code not in RETRY_STATUSES:
+                # Other 4xx (bad key, bad resource) will not get better on retry
+                resp.raise_for_status()
+                return resp.json()
+            error = f"HTTP {resp.status_code}"
+            retry_after = _retry_after(resp)
+            if retry_after is not None:
+                delay = retry_after
+            if resp.status_code == 429:
+                limiter.pause(delay)
+        except httpx.TransportError as e:
+            error = f"{type(e).__name__}: {e}"
+        except ValueError as e:
+            # data.gov.in occasionally answers 200 with an HTML error page
+            error = f"invalid JSON: {e}"
+        if attempt < retries:
+            stats["retries"] += 1
+            await asyncio.sleep(delay)
+    raise PageFetchError(f"offset {params.get('offset')}: {error} after {retries + 1} attempts")
+
+
+async def fetch_pages(url: str, params: Dict, on_page: Optional[Callable[[int, List[Dict]], Optional[int]]] = None,
+                      limit: int = 1000, start_offset: int = 0,
+                      stop_when: Optional[Callable[[List[Dict]], bool]] = None,
+                      concurrency: int = MARKET_FETCH_CONCURRENCY, max_rps: float = MARKET_FETCH_MAX_RPS,
+                      retries: int = MARKET_FETCH_RETRIES, timeout: float = MARKET_FETCH_TIMEOUT_SECONDS,
+                      queue_size: int = MARKET_FETCH_QUEUE_SIZE,
+                      backoff_base: float = BACKOFF_BASE_SECONDS,
+                      on_batch: Optional[Callable[[List[Tuple[int, List[Dict]]]], Optional[int]]] = None,
+                      batch_rows: int = 0) -> Dict:
+    """Fetch every page of a data.gov.in resource and pass each to on_page(offset, records).
+
+    on_page runs in a worker thread, one page at a time, in completion order
+    (not offset order); its return value is summed into stats["written"].
+    on_batch, if given instead, receives [(offset, records)]: every page
+    already waiting in the queue, up to batch_rows records, so a slow writer
+    gets fewer, larger batches.
+    The first page is fetched alone so its "total" can bound the offsets.
+    Offsets stop being scheduled past a short or empty page, or past a page
+    for which stop_when(records) is true. With concurrency > 1 later pages
+    may be in flight by then: those arriving after the stop_when page are
+    dropped (counted in stats["dropped_pages"]), but one that completed
+    before it has already been handed on, so stop_when bounds the fetch
+    rather than filtering records exactly. A page that still fails after
+    every retry is listed in stats["failed_offsets"] and the run continues,
+    unless it is the first page or the total is unknown, in which case
+    nothing beyond it is scheduled. An exception from on_page stops the run
+    and is re-raised.
+    """
+    stats = {"pages": 0, "records": 0, "written": 0, "requests": 0, "retries": 0, "dropped_pages": 0,
+             "failed_offsets": []}
+    state = {"next": start_offset, "end": None, "stopped_at": None, "total": None, "error": None}
+    limiter = RateLimiter(max_rps)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(queue_size, 1))
+    started = time.perf_counter()
+
+    def stop_at(offset):
+        state["end"] = offset if state["end"] is None else min(state["end"], offset)
+
+    def deliver(batch):
+        if on_batch is not None:
+            return on_batch(batch)
+        return sum(on_page(offset, records) or 0 for offset, records in batch)
+
+    async def writer():
+        finished = False
+        while not finished:
+            item = await queue.get()
+            if item is None:
+                return
+            batch, rows = [item], len(item[1])
+            while rows < batch_rows and not queue.empty():
+                item = queue.get_nowait()
+                if item is None:
+                    finished = True
+                    break
+                batch.append(item)
+                rows += len(item[1])
+            if state["error"] is not None:
+                continue  # Drain so no fetcher blocks on a full queue
+            try:
+                written = await asyncio.to_thread(deliver, batch)
+            except Exception as e:
+                state["error"] = e
+                continue
+            stats["pages"] += len(batch)
+            stats["records"] += rows
+            stats["written"] += written or 0
+
+    async def fetch(client, offset):
+        try:
+            data = await fetch_page(client, url, dict(params, limit=limit, offset=offset), limiter,
+                                    retries, backoff_base, stats)
+        except (PageFetchError, httpx.HTTPStatusError) as e:
+            logger.warning(f"Giving up on offset {offset}: {e}")
+            stats["failed_offsets"].append(offset)
+            if state["total"] is None:
+                stop_at(offset)
+            return None
+        records = data.get("records") or []
+        if state["stopped_at"] is not None and offset >= state["stopped_at"]:
+            # Requested before an earlier page met stop_when
+            if records:
+                stats["dropped_pages"] += 1
+            return data
+        if len(records) < limit:
+            stop_at(offset + len(records))
+        elif stop_when is not None and stop_when(records):
+            stop_at(offset + limit)
+            if state["stopped_at"] is None or offset + limit < state["stopped_at"]:
+                state["stopped_at"] = offset + limit
+        if records:
+            await queue.put((offset, records))
+        return data
+
+    async def fetcher(client):
+        while state["error"] is None:
+            offset = state["next"]
+            if state["end"] is not None and offset >= state["end"]:
+                return
+            state["next"] += limit
+            await fetch(client, offset)
+
+    writer_task = asyncio.create_task(writer())
+    client = httpx.AsyncClient(
+        timeout=httpx.Timeout(timeout, connect=min(timeout, 10.0)),
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+    )
+    try:
+        state["next"] += limit
+        first = await fetch(client, start_offset)
+        try:
+            state["total"] = int(first["total"])
+            stop_at(state["total"])
+        except (KeyError, TypeError, ValueError):
+            pass  # No total: stop at the first short or empty page instead
+        if first is not None:
+            await asyncio.gather(*(fetcher(client) for _ in range(max(concurrency, 1))))
+    finally:
+        await client.aclose()
+        await queue.put(None)
+        await writer_task
+
+    if state["error"] is not None:
+        raise state["error"]
+    stats["failed_offsets"].sort()
+    stats["seconds"] = time.perf_counter() - started
+    return stats
@@ -0,0 +1,287 @@
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+# Fallback levels used by predict_price when looking up recent prices:
+#   1 exact series, 2 market + commodity, 3 district average,
+#   4 state average, 5 global commodity average
+FALLBACK_LEVELS = {
+    1: "exact",
+    2: "market",
+    3: "district_avg",
+    4: "state_avg",
+    5: "global_avg",
+}
+
+
+class PriceHistory(NamedTuple):
+    level: Optional[int]
+    rows: List
+    latest_arrival_date: Optional[date]
+
+    @property
+    def level_name(self) -> Optional[str]:
+        return FALLBACK_LEVELS.get(self.level)
+
+
+# Every level is gated on the previous ones coming back empty (Postgres turns
+# the gate into a one-time filter, so skipped levels never scan), and the
+# whole lookup is a single round trip for any number of series. {op} is "="
+# for canonical names (index friendly) or "ILIKE" for raw request patterns.
+# Levels 1-2 read raw rows; the averaging levels 3-5 read the daily rollup
+# (utils/market_rollup.py).
+_HISTORY_QUERY_TEMPLATE = """
+    WITH req AS (
+        SELECT * FROM unnest(
+            %s::int[], %s::text[], %s::text[], %s::text[], %s::text[], %s::text[], %s::text[]
+        ) AS r(idx, state, district, district_any, market, commodity, variety)
+    )
+    SELECT req.idx,
+           CASE WHEN l1.prices IS NOT NULL THEN 1
+                WHEN l2.prices IS NOT NULL THEN 2
+                WHEN l3.prices IS NOT NULL THEN 3
+                WHEN l4.prices IS NOT NULL THEN 4
+                WHEN l5.prices IS NOT NULL THEN 5
+           END AS level,
+           COALESCE(l1.prices, l2.prices, l3.prices, l4.prices, l5.prices) AS prices,
+           COALESCE(l1.latest, l2.latest, l3.latest, l4.latest, l5.latest) AS latest_arrival_date
+    FROM req
+    CROSS JOIN LATERAL (
+        SELECT array_agg(price ORDER BY arrival_date DESC) AS prices, MAX(arrival_date) AS latest
+        FROM (
+            SELECT modal_price AS price, arrival_date FROM market_prices
+            WHERE state {op} req.state AND district {op} req.district AND market {op} req.market
+              AND commodity {op} req.commodity AND variety {op} req.variety
+            ORDER BY arrival_date DESC LIMIT 7
+        ) t
+    ) l1
+    CROSS JOIN LATERAL (
+        SELECT array_agg(price ORDER BY arrival_date DESC) AS prices, MAX(arrival_date) AS latest
+        FROM (
+            SELECT modal_price AS price, arrival_date FROM market_prices
+            WHERE l1.prices IS NULL
+              AND state {op} req.state AND district {op} req.district AND market {op} req.market
+              AND commodity {op} req.commodity
+            ORDER BY arrival_date DESC LIMIT 7
+        ) t
+    ) l2
+    CROSS JOIN LATERAL (
+        SELECT array_agg(price ORDER BY arrival_date DESC) AS prices, MAX(arrival_date) AS latest
+        FROM (
+            SELECT {avg} AS price, arrival_date FROM market_price_daily_rollup
+            WHERE l1.prices IS NULL AND l2.prices IS NULL
+              AND state {op} req.state AND district {op} req.district_any
+              AND commodity {op} req.commodity
+            GROUP BY arrival_date
+            ORDER BY arrival_date DESC LIMIT 7
+        ) t
+    ) l3
+    CROSS JOIN LATERAL (
+        SELECT array_agg(price ORDER BY arrival_date DESC) AS prices, MAX(arrival_date) AS latest
+        FROM (
+            SELECT {avg} AS price, arrival_date FROM market_price_daily_rollup
+            WHERE l1.prices IS NULL AND l2.prices IS NULL AND l3.prices IS NULL
+              AND state {op} req.state AND commodity {op} req.commodity
+            GROUP BY arrival_date
+            ORDER BY arrival_date DESC LIMIT 7
+        ) t
+    ) l4
+    CROSS JOIN LATERAL (
+        SELECT array_agg(price ORDER BY arrival_date DESC) AS prices, MAX(arrival_date) AS latest
+        FROM (
+            SELECT {avg} AS price, arrival_date FROM market_price_daily_rollup
+            WHERE l1.prices IS NULL AND l2.prices IS NULL AND l3.prices IS NULL AND l4.prices IS NULL
+              AND commodity {op} req.commodity
+            GROUP BY arrival_date
+            ORDER BY arrival_date DESC LIMIT 7
+        ) t
+    ) l5
+    ORDER BY req.idx
+"""
+
+# AVG(modal_price) over the rows behind the rollup groups being summed
+ROLLUP_AVG = "SUM(price_sum) / NULLIF(SUM(price_count), 0)"
+
+BATCH_HISTORY_QUERY = _HISTORY_QUERY_TEMPLATE.format(op="ILIKE", avg=ROLLUP_AVG)
+CANONICAL_HISTORY_QUERY = _HISTORY_QUERY_TEMPLATE.format(op="=", avg=ROLLUP_AVG)
+
+
+def name_filters(entities, filters) -> Tuple[str, list]:
+    """AND clauses for (column, value, pattern) filters: equality on the
+    canonical name where it resolves, ILIKE pattern otherwise."""
+    sql, params = "", []
+    for col, value, pattern in filters:
+        if not value:
+            continue
+        name = entities.canonical(col, value)
+        if name is not None:
+            sql += f" AND {col} = %s"
+            params.append(name)
+        else:
+            sql += f" AND {col} ILIKE %s"
+            params.append(pattern)
+    return sql, params
+
+
+def price_trend_query(entities, commodity: str, state: str, district: Optional[str], days: int) -> Tuple[str, list]:
+    """Daily average/min/max prices for /market-prices/trends, from the daily rollup."""
+    where, params = name_filters(entities, (
+        ("commodity", commodity, f"%{commodity}%"),
+        ("state", state, state),
+        ("district", district, f"%{district}%"),
+    ))
+    query = f"""
+        SELECT arrival_date, {ROLLUP_AVG} as avg_price,
+               MIN(min_price) as min_price, MAX(max_price) as max_price
+        FROM market_price_daily_rollup
+        WHERE 1=1{where}
+          AND arrival_date >= CURRENT_DATE - %s * INTERVAL '1 day'
+        GROUP BY arrival_date
+        ORDER BY arrival_date ASC
+    """
+    return query, params + [days]
+
+
+MANDI_COLUMNS = ['id', 'state', 'district', 'market', 'commodity', 'variety', 'grade',
+                 'arrival_date', 'min_price', 'max_price', 'modal_price']
+
+
+def _mandi_where(entities, state: Optional[str], district: Optional[str],
+                 after: Optional[Tuple[date, int]]) -> Tuple[str, list]:
+    where, params = name_filters(entities, (("state", state, state), ("district", district, district)))
+    if after is not None:
+        where += " AND (arrival_date, id) < (%s, %s)"
+        params += list(after)
+    return where, params
+
+
+def mandi_scope(entities, state: Optional[str], district: Optional[str], limit: int,
+                after: Optional[Tuple[date, int]] = None) -> list:
+    """What selects a /mandi-prices page, normalized the way _mandi_where matches it.
+
+    Resolved names become their canonical spelling and unresolved ones are
+    casefolded (ILIKE ignores case), so spellings that select the same rows
+    give the same scope.
+    """
+    scope = []
+    for col, value in (("state", state), ("district", district)):
+        name = entities.canonical(col, value) if value else None
+        scope.append(["=", name] if name is not None else ["ILIKE", value.casefold() if value else None])
+    return scope + [limit, list(after) if after else None]
+
+
+def mandi_prices_query(entities, state: Optional[str], district: Optional[str], limit: int,
+                       after: Optional[Tuple[date, int]] = None) -> Tuple[str, list]:
+    """A page of /mandi-prices rows, newest first, keyset-paginated on (arrival_date, id).
+
+    `after` is the (arrival_date, id) of the last row of the previous page.
+    """
+    where, params = _mandi_where(entities, state, district, after)
+    query = f"""
+        SELECT {", ".join(MANDI_COLUMNS)} FROM market_prices WHERE 1=1{where}
+        ORDER BY arrival_date DESC, id DESC LIMIT %s
+    """
+    return query, params + [limit]
+
+
+def mandi_page_end_query(entities, state: Optional[str], district: Optional[str], limit: int,
+                         after: Optional[Tuple[date, int]] = None) -> Tuple[str, list]:
+    """Keys of the page's last row and of the row after it.
+
+    Reads only (arrival_date, id), which the mandi indexes cover; two rows
+    back means there is a next page starting after the first of them.
+    """
+    where, params = _mandi_where(entities, state, district, after)
+    query = f"""
+        SELECT arrival_date, id FROM market_prices WHERE 1=1{where}
+        ORDER BY arrival_date DESC, id DESC OFFSET %s LIMIT 2
+    """
+    return query, params + [max(limit - 1, 0)]
+
+
+SERIES_COLUMNS = ('state', 'district', 'market', 'commodity', 'variety')
+
+
+def canonical_names(s, entities, columns: Sequence[str] = SERIES_COLUMNS) -> Optional[Dict[str, str]]:
+    """Canonical spelling of each of s's names, or None unless every one resolves.
+
+    Only then may a lookup compare with equality: an unresolved name has no
+    canonical spelling to compare against and has to keep its ILIKE pattern.
+    """
+    if entities is None:
+        return None
+    names = {col: entities.canonical(col, getattr(s, col)) for col in columns}
+    if any(name is None for name in names.values()):
+        return None
+    return names
+
+
+def _fuzzy(s: str) -> str:
+    return f"%{s}%"
+
+
+def _pattern_params(series: Sequence) -> tuple:
+    return (
+        [s.state for s in series],
+        [s.district for s in series],
+        [_fuzzy(s.district) for s in series],
+        [_fuzzy(s.market) for s in series],
+        [_fuzzy(s.commodity) for s in series],
+        [_fuzzy(s.variety) for s in series],
+    )
+
+
+def _canonical_params(names: Sequence[Dict[str, str]]) -> tuple:
+    return (
+        [n['state'] for n in names],
+        [n['district'] for n in names],
+        [n['district'] for n in names],
+        [n['market'] for n in names],
+        [n['commodity'] for n in names],
+        [n['variety'] for n in names],
+    )
+
+
+def fetch_price_histories(conn, series: Sequence, entities=None) -> List[PriceHistory]:
+    """Resolve recent price histories for many series in a single statement.
+
+    `series` items need state, district, market, commodity and variety attributes
+    (e.g. PredictionRequest). Returns one PriceHistory per item in input order,
+    holding the newest-first rows found at the most specific non-empty fallback
+    level; level is None when nothing matched.
+
+    With an EntityDictionary, series whose names all resolve are matched by
+    equality on canonical names; the rest (or all, without one) keep the
+    ILIKE '%name%' patterns in a second statement. A single unresolved name
+    is enough to need the patterns, since equality against NULL matches
+    nothing.
+    """
+    if not series:
+        return []
+
+    canonical, names, pattern = [], [], []
+    for i, s in enumerate(series):
+        resolved = canonical_names(s, entities)
+        if resolved is not None:
+            canonical.append(i)
+            names.append(resolved)
+        else:
+            pattern.append(i)
+
+    rows = []
+    cur = conn.cursor()
+    try:
+        for query, indexes, params in (
+            (CANONICAL_HISTORY_QUERY, canonical, lambda: _canonical_params(names)),
+            (BATCH_HISTORY_QUERY, pattern, lambda: _pattern_params([series[i] for i in pattern])),
+        ):
+            if indexes:
+                cur.execute(query, (indexes,) + params())
+                rows.extend(cur.fetchall())
+    finally:
+        cur.close()
+
+    histories = [PriceHistory(None, [], None)] * len(series)
+    for idx, level, prices, latest_arrival_date in rows:
+        if level is not None:
+            histories[idx] = PriceHistory(level, list(prices), latest_arrival_date)
+    return histories
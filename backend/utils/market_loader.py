@@ -0,0 +1,111 @@
+"""
+Bulk loading of data.gov.in records into market_prices.
+
+parse_market_frame() turns a page of API records into typed columns with
+vectorized date parsing and numeric validation. load_market_frame() streams
+them with COPY FROM STDIN into a session-private staging table and merges
+that into market_prices with one INSERT ... SELECT ... ON CONFLICT per
+batch, so Postgres sees one round trip for the rows and one set-based
+statement instead of a multi-row VALUES list built in Python. The groups
+the merge changed are then refreshed in market_price_daily_rollup.
+"""
+import io
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from utils.market_rollup import CREATE_TOUCHED, LOCK_ROLLUP, TOUCHED_TABLE, refresh_touched
+from utils.market_schema import ensure_partitions
+
+KEY_COLUMNS = ['state', 'district', 'market', 'commodity', 'variety', 'arrival_date']
+TEXT_COLUMNS = ['state', 'district', 'market', 'commodity', 'variety', 'grade']
+PRICE_COLUMNS = ['min_price', 'max_price', 'modal_price']
+COLUMNS = TEXT_COLUMNS + ['arrival_date'] + PRICE_COLUMNS
+STAGING_TABLE = "market_prices_stage"
+NULL = r"\N"
+
+# Temporary tables are never WAL-logged and are private to the session, so
+# concurrent loaders cannot see each other's staged rows
+CREATE_STAGING = f"""
+CREATE TEMPORARY TABLE IF NOT EXISTS {STAGING_TABLE} (
+    state TEXT, district TEXT, market TEXT, commodity TEXT, variety TEXT, grade TEXT,
+    arrival_date DATE, min_price NUMERIC, max_price NUMERIC, modal_price NUMERIC
+)
+"""
+
+_cols = ", ".join(COLUMNS)
+COPY_STAGING = f"COPY {STAGING_TABLE} ({_cols}) FROM STDIN WITH (FORMAT csv, NULL '{NULL}')"
+_key_match = " AND ".join(f"m.{col} = s.{col}" for col in KEY_COLUMNS)
+# Unchanged rows are skipped by the WHERE. RETURNING cannot read xmax on a
+# partitioned table, so updates are told apart by counting the staged keys
+# that already exist (same snapshot as the insert). The rollup groups of the
+# inserted and changed rows are recorded for refresh_touched().
+MERGE_STAGING = f"""
+WITH existing AS (
+    SELECT count(*) AS n FROM {STAGING_TABLE} s JOIN market_prices m ON {_key_match}
+), merged AS (
+    INSERT INTO market_prices ({_cols})
+    SELECT {_cols} FROM {STAGING_TABLE}
+    ON CONFLICT (state, district, market, commodity, variety, arrival_date) DO UPDATE
+    SET grade = EXCLUDED.grade, min_price = EXCLUDED.min_price,
+        max_price = EXCLUDED.max_price, modal_price = EXCLUDED.modal_price
+    WHERE (market_prices.grade, market_prices.min_price, market_prices.max_price, market_prices.modal_price)
+          IS DISTINCT FROM (EXCLUDED.grade, EXCLUDED.min_price, EXCLUDED.max_price, EXCLUDED.modal_price)
+    RETURNING commodity, state, district, arrival_date
+), touched AS (
+    INSERT INTO {TOUCHED_TABLE}
+    SELECT DISTINCT commodity, state, district, arrival_date FROM merged
+    WHERE commodity IS NOT NULL AND state IS NOT NULL AND district IS NOT NULL
+)
+SELECT (SELECT count(*) FROM {STAGING_TABLE}) - (SELECT n FROM existing), (SELECT count(*) FROM merged)
+"""
+
+
+def parse_market_frame(records: List[Dict]) -> pd.DataFrame:
+    """API records -> one row per market_prices key, in COLUMNS order.
+
+    Records without a DD/MM/YYYY arrival_date are dropped; prices that are
+    not numbers become NULL. The last record for a key wins, since one
+    merge cannot update the same row twice.
+    """
+    df = pd.DataFrame.from_records(records, columns=COLUMNS) if records else pd.DataFrame(columns=COLUMNS)
+    df['arrival_date'] = pd.to_datetime(df['arrival_date'], format="%d/%m/%Y", errors='coerce')
+    df = df[df['arrival_date'].notna()]
+    for col in PRICE_COLUMNS:
+        # Keep the feed's own spelling of valid numbers so NUMERIC stores them exactly
+        raw = df[col].astype(object)
+        df[col] = raw.where(pd.to_numeric(raw, errors='coerce').notna(), None)
+    return df.drop_duplicates(subset=KEY_COLUMNS, keep='last').reset_index(drop=True)
+
+
+def copy_payload(df: pd.DataFrame) -> str:
+    """Rows of df as CSV for COPY ... (FORMAT csv, NULL '\\N').
+
+    A NULL marker other than the empty string keeps None and '' apart, which
+    matters for the text columns of the unique key.
+    """
+    if df.empty:
+        return ""
+    return df[COLUMNS].to_csv(header=False, index=False, na_rep=NULL, date_format="%Y-%m-%d")
+
+
+def load_market_frame(cur, df: pd.DataFrame) -> Tuple[int, int]:
+    """COPY df into the staging table and merge it into market_prices.
+
+    Monthly partitions the rows need are created first, and the daily
+    rollup is refreshed for the groups that changed. Runs in the caller's
+    transaction; returns (inserted, updated).
+    """
+    if df.empty:
+        return 0, 0
+    ensure_partitions(cur, df['arrival_date'].dt.date.unique())
+    cur.execute(CREATE_STAGING)
+    cur.execute(CREATE_TOUCHED)
+    cur.execute(f"TRUNCATE {STAGING_TABLE}, {TOUCHED_TABLE}")
+    cur.copy_expert(COPY_STAGING, io.StringIO(copy_payload(df)))
+    cur.execute(LOCK_ROLLUP)
+    cur.execute(MERGE_STAGING)
+    inserted, merged = cur.fetchone()
+    refresh_touched(cur)
+    cur.execute(f"TRUNCATE {STAGING_TABLE}")
+    return int(inserted), int(merged - inserted)
@@ -0,0 +1,157 @@
+"""
+Daily price rollup: one row per (commodity, state, district, arrival_date)
+holding the sum and count of modal_price and the min/max of min_price and
+max_price over that day's market_prices rows.
+
+/market-prices/trends and fallback levels 3-5 of predict_price average
+over whole districts, states or commodities, so they read this table: a
+90-day state trend groups a few rows per day instead of every market and
+variety. Averages are SUM(price_sum) / SUM(price_count), which equals
+AVG(modal_price) over the underlying rows.
+
+The loader keeps it current: the merge records which groups it inserted or
+changed, and refresh_touched() recomputes just those groups from
+market_prices (rows are never deleted, so a group never disappears).
+Rows with a NULL commodity, state or district are left out; the feed
+always fills them. The table is created, and filled from existing rows,
+by fetch_market_prices, market_schema.migrate() and API startup.
+
+    python -m utils.market_rollup --rebuild [--since YYYY-MM-DD]
+"""
+from datetime import date
+from typing import Optional
+
+ROLLUP_TABLE = "market_price_daily_rollup"
+# Session-private list of groups the current load changed
+TOUCHED_TABLE = "market_rollup_touched"
+GROUP_COLUMNS = ['commodity', 'state', 'district', 'arrival_date']
+
+CREATE_ROLLUP = f"""
+CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+    commodity TEXT NOT NULL,
+    state TEXT NOT NULL,
+    district TEXT NOT NULL,
+    arrival_date DATE NOT NULL,
+    price_sum NUMERIC,
+    price_count INTEGER NOT NULL,
+    min_price NUMERIC,
+    max_price NUMERIC,
+    PRIMARY KEY (commodity, state, district, arrival_date)
+)
+"""
+
+# The primary key serves district level lookups; these let state and
+# commodity level ones read days newest first without a sort
+INDEXES = [
+    ("commodity_state_date_idx", "(commodity, state, arrival_date) INCLUDE (price_sum, price_count, min_price, max_price)"),
+    ("commodity_date_idx", "(commodity, arrival_date) INCLUDE (price_sum, price_count)"),
+]
+
+CREATE_TOUCHED = f"""
+CREATE TEMPORARY TABLE IF NOT EXISTS {TOUCHED_TABLE} (
+    commodity TEXT, state TEXT, district TEXT, arrival_date DATE
+)
+"""
+
+_group = ", ".join(GROUP_COLUMNS)
+_aggregates = "SUM(m.modal_price), COUNT(m.modal_price), MIN(m.min_price), MAX(m.max_price)"
+_upsert = f"""
+ON CONFLICT ({_group}) DO UPDATE
+SET price_sum = EXCLUDED.price_sum, price_count = EXCLUDED.price_count,
+    min_price = EXCLUDED.min_price, max_price = EXCLUDED.max_price
+"""
+
+REFRESH_TOUCHED = f"""
+INSERT INTO {ROLLUP_TABLE} ({_group}, price_sum, price_count, min_price, max_price)
+SELECT m.commodity, m.state, m.district, m.arrival_date, {_aggregates}
+FROM (SELECT DISTINCT {_group} FROM {TOUCHED_TABLE}) t
+JOIN market_prices m ON m.commodity = t.commodity AND m.state = t.state
+                    AND m.district = t.district AND m.arrival_date = t.arrival_date
+GROUP BY m.commodity, m.state, m.district, m.arrival_date
+{_upsert}
+"""
+
+REBUILD = f"""
+INSERT INTO {ROLLUP_TABLE} ({_group}, price_sum, price_count, min_price, max_price)
+SELECT m.commodity, m.state, m.district, m.arrival_date, {_aggregates}
+FROM market_prices m
+WHERE m.commodity IS NOT NULL AND m.state IS NOT NULL AND m.district IS NOT NULL
+  AND m.arrival_date >= %s
+GROUP BY m.commodity, m.state, m.district, m.arrival_date
+{_upsert}
+"""
+
+# Serializes loads that touch the rollup: each refresh recomputes groups from
+# what it can see, so two concurrent loads could otherwise each miss the
+# other's rows. Held until the loading transaction commits.
+LOCK_ROLLUP = f"SELECT pg_advisory_xact_lock(hashtext('{ROLLUP_TABLE}'))"
+
+
+def create_rollup(cur) -> bool:
+    """Create the rollup table and its indexes; a new table is filled from market_prices.
+
+    Returns True when the table was created.
+    """
+    cur.execute("SELECT to_regclass(%s)", (ROLLUP_TABLE,))
+    created = cur.fetchone()[0] is None
+    cur.execute(CREATE_ROLLUP)
+    for suffix, columns in INDEXES:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {ROLLUP_TABLE}_{suffix} ON {ROLLUP_TABLE} {columns}")
+    if created:
+        cur.execute("SELECT to_regclass('market_prices')")
+        if cur.fetchone()[0] is not None:
+            rebuild_rollup(cur)
+    return created
+
+
+def ensure_rollup(conn) -> bool:
+    """create_rollup() in its own transaction, serialized with loads and with
+    other processes doing the same (e.g. several API workers starting up)."""
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(LOCK_ROLLUP)
+            return create_rollup(cur)
+
+
+def rebuild_rollup(cur, since: Optional[date] = None) -> int:
+    """Recompute the rollup from market_prices, for every day or from `since` on.
+
+    Returns the number of rollup rows written.
+    """
+    if since is None:
+        cur.execute(f"TRUNCATE {ROLLUP_TABLE}")
+    else:
+        cur.execute(f"DELETE FROM {ROLLUP_TABLE} WHERE arrival_date >= %s", (since,))
+    cur.execute(REBUILD, (since or date.min,))
+    count = cur.rowcount
+    cur.execute(f"ANALYZE {ROLLUP_TABLE}")
+    return count
+
+
+def refresh_touched(cur) -> int:
+    """Recompute the groups listed in the touched table and clear it; returns rollup rows written."""
+    cur.execute(REFRESH_TOUCHED)
+    count = cur.rowcount
+    cur.execute(f"TRUNCATE {TOUCHED_TABLE}")
+    return count
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from utils.db import get_market_db_connection
+
+    parser = argparse.ArgumentParser(description="Rebuild the daily market price rollup")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute the rollup from market_prices")
+    parser.add_argument("--since", type=date.fromisoformat, help="Only recompute days on or after this date")
+    args = parser.parse_args()
+
+    conn = get_market_db_connection()
+    with conn:
+        with conn.cursor() as cur:
+            if not create_rollup(cur) and args.rebuild:
+                print(f"Rebuilt {rebuild_rollup(cur, args.since)} rollup rows")
+            cur.execute(f"SELECT count(*), min(arrival_date), max(arrival_date) FROM {ROLLUP_TABLE}")
+            rows, first, last = cur.fetchone()
+            print(f"{ROLLUP_TABLE}: {rows} rows, {first} .. {last}")
+    conn.close()
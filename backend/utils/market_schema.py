@@ -0,0 +1,273 @@
+"""
+Schema for market_prices: monthly range partitions on arrival_date plus the
+indexes the API's hot queries need.
+
+    market_prices              partitioned parent, PRIMARY KEY (id, arrival_date)
+    market_prices_pYYYYMM      one partition per month
+    market_prices_default      catches dates outside every monthly partition
+
+Indexes are declared on the parent, so every partition gets them:
+    unique key (state, district, market, commodity, variety, arrival_date) INCLUDE modal_price
+        exact-series history (fallback levels 1-2), ON CONFLICT target
+    (commodity, state, district, arrival_date) INCLUDE market and prices
+        district/state averages (levels 3-4) and /market-prices/trends
+    (commodity, arrival_date) INCLUDE modal_price    global average (level 5)
+    (state, district, arrival_date, id)              /mandi-prices pages by state/district
+    (arrival_date, id)                               /mandi-prices unfiltered, training deltas
+    pg_trgm GIN on state, district, market, commodity, for the ILIKE
+        patterns used when a name does not resolve to a canonical spelling
+        (skipped, with a warning, where the extension is not available or
+        the role may not create it)
+
+ensure_partitions() is called by the loader before each merge, so months
+are created ahead of the rows that need them; partitions for
+MARKET_PARTITION_MONTHS_AHEAD months past today are created up front.
+migrate() converts an existing unpartitioned table in one transaction and
+creates the daily rollup if it is missing.
+
+    python -m utils.market_schema --migrate [--drop-legacy]
+    python -m utils.market_schema --status
+"""
+import os
+from datetime import date
+from typing import Iterable, List, Optional
+
+import psycopg2.errors
+
+from utils import market_rollup
+
+TABLE = "market_prices"
+LEGACY_TABLE = "market_prices_legacy"
+DEFAULT_PARTITION = f"{TABLE}_default"
+MARKET_PARTITION_MONTHS_AHEAD = int(os.getenv("MARKET_PARTITION_MONTHS_AHEAD", "2"))
+# A fresh database gets empty partitions back to this many months
+MARKET_PARTITION_MONTHS_BACK = int(os.getenv("MARKET_PARTITION_MONTHS_BACK", "24"))
+TRGM_COLUMNS = ['state', 'district', 'market', 'commodity']
+
+CREATE_PARTITIONED = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id SERIAL,
+    state TEXT,
+    district TEXT,
+    market TEXT,
+    commodity TEXT,
+    variety TEXT,
+    grade TEXT,
+    arrival_date DATE NOT NULL,
+    min_price NUMERIC,
+    max_price NUMERIC,
+    modal_price NUMERIC,
+    PRIMARY KEY (id, arrival_date),
+    UNIQUE (state, district, market, commodity, variety, arrival_date) INCLUDE (modal_price)
+) PARTITION BY RANGE (arrival_date)
+"""
+
+INDEXES = [
+    ("commodity_state_district_date_idx",
+     "(commodity, state, district, arrival_date) INCLUDE (market, modal_price, min_price, max_price)"),
+    ("commodity_date_idx", "(commodity, arrival_date) INCLUDE (modal_price)"),
+    ("state_district_date_id_idx", "(state, district, arrival_date, id)"),
+    ("date_id_idx", "(arrival_date, id)"),
+]
+
+
+def month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def add_months(d: date, n: int) -> date:
+    """First day of the month n months after (or before, for negative n) d's month."""
+    index = d.year * 12 + d.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_p{month.year:04d}{month.month:02d}"
+
+
+def months_between(first: date, last: date) -> List[date]:
+    """First day of every month from first's month through last's month."""
+    months, month = [], month_start(first)
+    while month <= last:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def table_kind(cur, table: str = TABLE) -> Optional[str]:
+    """'partitioned', 'plain', or None when the table does not exist."""
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return "partitioned" if row[0] == "p" else "plain"
+
+
+def has_trgm(cur) -> bool:
+    """Enable pg_trgm if possible; False when the server does not ship it or
+    the role may not create it. A failed CREATE EXTENSION is rolled back to a
+    savepoint, so the caller's transaction carries on."""
+    cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+    if cur.fetchone():
+        return True
+    cur.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    if not cur.fetchone():
+        return False
+    cur.execute("SAVEPOINT create_trgm")
+    try:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except psycopg2.errors.InsufficientPrivilege:
+        cur.execute("ROLLBACK TO SAVEPOINT create_trgm")
+        return False
+    cur.execute("RELEASE SAVEPOINT create_trgm")
+    return True
+
+
+def create_indexes(cur, table: str = TABLE) -> List[str]:
+    """Create the secondary indexes that are missing; returns the names created."""
+    created = []
+    statements = [(f"{table}_{suffix}", f"CREATE INDEX IF NOT EXISTS {table}_{suffix} ON {table} {columns}")
+                  for suffix, columns in INDEXES]
+    if has_trgm(cur):
+        statements += [(f"{table}_{col}_trgm_idx",
+                        f"CREATE INDEX IF NOT EXISTS {table}_{col}_trgm_idx ON {table} USING gin ({col} gin_trgm_ops)")
+                       for col in TRGM_COLUMNS]
+    else:
+        print("Warning: pg_trgm is not available; ILIKE '%name%' lookups will not be index-assisted.")
+    for name, statement in statements:
+        cur.execute("SELECT to_regclass(%s)", (name,))
+        if cur.fetchone()[0] is None:
+            cur.execute(statement)
+            created.append(name)
+    return created
+
+
+def _create_partition(cur, month: date, table: str = TABLE):
+    """Create and attach one monthly partition, moving its rows out of the default partition.
+
+    The partition is built standalone and then attached, which locks the
+    parent less strongly than CREATE TABLE ... PARTITION OF.
+    """
+    name, end = partition_name(month), add_months(month, 1)
+    default = f"{table}_default"
+    cur.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)")
+    cur.execute(f"ALTER TABLE {name} ADD CONSTRAINT {name}_range "
+                f"CHECK (arrival_date >= %s AND arrival_date < %s)", (month, end))
+    if table_kind(cur, default) is not None:
+        cur.execute(f"""
+            WITH moved AS (DELETE FROM {default} WHERE arrival_date >= %s AND arrival_date < %s RETURNING *)
+            INSERT INTO {name} SELECT * FROM moved
+        """, (month, end))
+    cur.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", (month, end))
+    # The CHECK only existed to skip the validation scan on attach
+    cur.execute(f"ALTER TABLE {name} DROP CONSTRAINT {name}_range")
+
+
+def ensure_partitions(cur, dates: Iterable, table: str = TABLE) -> List[str]:
+    """Create the monthly partitions the given arrival dates fall in; no-op on an unpartitioned table."""
+    months = sorted({month_start(d) for d in dates if d is not None})
+    if not months or table_kind(cur, table) != "partitioned":
+        return []
+    names = [partition_name(m) for m in months]
+    cur.execute("SELECT relname FROM pg_class WHERE relname = ANY(%s)", (names,))
+    existing = {row[0] for row in cur.fetchall()}
+    created = []
+    for month, name in zip(months, names):
+        if name not in existing:
+            _create_partition(cur, month, table)
+            created.append(name)
+    return created
+
+
+def create_schema(cur, first: Optional[date] = None, last: Optional[date] = None, table: str = TABLE):
+    """Partitioned table, default partition, monthly partitions for first..last and indexes."""
+    today = date.today()
+    first = first or add_months(today, -MARKET_PARTITION_MONTHS_BACK)
+    last = last or add_months(today, MARKET_PARTITION_MONTHS_AHEAD)
+    cur.execute(CREATE_PARTITIONED.format(table=table))
+    cur.execute(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")
+    ensure_partitions(cur, months_between(first, last), table)
+    create_indexes(cur, table)
+
+
+def migrate(conn, drop_legacy: bool = False) -> dict:
+    """Move an unpartitioned market_prices into the partitioned layout.
+
+    Runs in one transaction: the old table is renamed to market_prices_legacy,
+    the partitioned table is created under the old name with partitions
+    covering the data, rows are copied with their ids, the id sequence is
+    moved past them, and indexes are built after the copy. Readers wait on
+    the rename lock for the duration instead of seeing a partial table.
+
+    The daily rollup (utils/market_rollup.py) is created and filled too when
+    it does not exist yet, since the trend and fallback queries read it.
+    """
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(market_rollup.LOCK_ROLLUP)
+            kind = table_kind(cur)
+            if kind == "partitioned":
+                return {"migrated": False, "indexes": create_indexes(cur), "rollup_created": market_rollup.create_rollup(cur)}
+            if kind is None:
+                create_schema(cur)
+                return {"migrated": False, "created": True, "rollup_created": market_rollup.create_rollup(cur)}
+            cur.execute(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE")
+            cur.execute(f"SELECT min(arrival_date), max(arrival_date), count(*) FROM {TABLE}")
+            first, last, rows = cur.fetchone()
+            cur.execute(f"ALTER TABLE {TABLE} RENAME TO {LEGACY_TABLE}")
+            today = date.today()
+            cur.execute(CREATE_PARTITIONED.format(table=TABLE))
+            cur.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT")
+            last = add_months(max(last or today, today), MARKET_PARTITION_MONTHS_AHEAD)
+            ensure_partitions(cur, months_between(first or today, last))
+            cur.execute(f"""
+                INSERT INTO {TABLE} (id, state, district, market, commodity, variety, grade,
+                                     arrival_date, min_price, max_price, modal_price)
+                SELECT id, state, district, market, commodity, variety, grade,
+                       arrival_date, min_price, max_price, modal_price
+                FROM {LEGACY_TABLE} WHERE arrival_date IS NOT NULL
+            """)
+            copied = cur.rowcount
+            cur.execute(f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                        f"GREATEST((SELECT max(id) FROM {TABLE}), 1))", (TABLE,))
+            indexes = create_indexes(cur)
+            cur.execute(f"ANALYZE {TABLE}")
+            rollup_created = market_rollup.create_rollup(cur)
+            if drop_legacy:
+                cur.execute(f"DROP TABLE {LEGACY_TABLE}")
+    return {"migrated": True, "rows": rows, "copied": copied, "indexes": indexes,
+            "rollup_created": rollup_created, "legacy_dropped": drop_legacy}
+
+
+def status(cur) -> dict:
+    kind = table_kind(cur)
+    info = {"table": kind}
+    if kind == "partitioned":
+        cur.execute("""
+            SELECT c.relname, c.reltuples::bigint FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname
+        """, (TABLE,))
+        info["partitions"] = {name: rows for name, rows in cur.fetchall()}
+    cur.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s ORDER BY indexname", (TABLE,))
+    info["indexes"] = [row[0] for row in cur.fetchall()]
+    return info
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from utils.db import get_market_db_connection
+
+    parser = argparse.ArgumentParser(description="Create or migrate the partitioned market_prices schema")
+    parser.add_argument("--migrate", action="store_true", help="Partition an existing table (or create a fresh one)")
+    parser.add_argument("--drop-legacy", action="store_true", help="Drop market_prices_legacy after migrating")
+    parser.add_argument("--status", action="store_true", help="Show partitions and indexes")
+    args = parser.parse_args()
+
+    conn = get_market_db_connection()
+    if args.migrate:
+        print(json.dumps(migrate(conn, drop_legacy=args.drop_legacy), indent=2, default=str))
+    with conn.cursor() as cur:
+        print(json.dumps(status(cur), indent=2, default=str))
+    conn.close()
@@ -0,0 +1,78 @@
+import hashlib
+import os
+from typing import Dict, Optional
+
+import joblib
+
+from utils.compiled_forest import CompiledForest, saved_forest_version
+
+PRICE_MODEL_PATH = 'price_model.pkl'
+# Directory export (one memory-mapped .npy per array); the .npz is the older single-file export
+COMPILED_MODEL_PATH = 'price_forest'
+LEGACY_COMPILED_MODEL_PATH = 'price_forest.npz'
+# Optional direct multi-horizon forest, saved next to the recursive one
+COMPILED_DIRECT_MODEL_PATH = 'price_forest_direct'
+ENCODERS_PATH = 'encoders.pkl'
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> Optional[str]:
+    """Short content hash of a model artifact, or None if it does not exist."""
+    if not path or not os.path.isfile(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def load_price_model(compiled_path: str = COMPILED_MODEL_PATH, model_path: str = PRICE_MODEL_PATH):
+    """Prefer the exported array forest; compile price_model.pkl in memory otherwise.
+
+    Directory exports are memory-mapped, so every process serving the same
+    files shares one copy of the node arrays through the page cache. Only
+    the unversioned price_forest falls back to the older files; any other
+    compiled_path, e.g. a registry version's, must exist.
+    """
+    if compiled_path != COMPILED_MODEL_PATH:
+        if not (os.path.isdir(compiled_path) or os.path.isfile(compiled_path)):
+            raise FileNotFoundError(f"No compiled price model at {compiled_path}")
+        return CompiledForest.load(compiled_path)
+    for path in (compiled_path, LEGACY_COMPILED_MODEL_PATH):
+        if os.path.isdir(path) or os.path.isfile(path):
+            return CompiledForest.load(path)
+
+    sk_model = joblib.load(model_path)
+    try:
+        return CompiledForest.from_sklearn(sk_model)
+    except ValueError as e:
+        print(f"Serving {model_path} through sklearn: {e}")
+        return sk_model
+
+
+def load_direct_model(compiled_path: str = COMPILED_MODEL_PATH) -> Optional[CompiledForest]:
+    """The direct multi-horizon forest exported alongside compiled_path, if any."""
+    path = os.path.join(os.path.dirname(os.path.normpath(compiled_path)), COMPILED_DIRECT_MODEL_PATH)
+    return CompiledForest.load(path) if os.path.isdir(path) else None
+
+
+def price_model_version(compiled_path: str = COMPILED_MODEL_PATH, model_path: str = PRICE_MODEL_PATH) -> Optional[str]:
+    return (
+        saved_forest_version(compiled_path)
+        or file_sha256(LEGACY_COMPILED_MODEL_PATH)
+        or file_sha256(model_path)
+    )
+
+
+def process_memory() -> Dict[str, Optional[float]]:
+    """RSS and PSS of this process in MB (Linux). PSS splits shared pages between their users."""
+    memory = {"rss_mb": None, "pss_mb": None}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss"):
+                    memory[f"{key.lower()}_mb"] = round(int(rest.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return memory
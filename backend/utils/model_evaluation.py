@@ -0,0 +1,139 @@
+"""
+Time-ordered evaluation helpers for price model candidates.
+
+Folds are rolling-origin: each one trains on every day before a cutoff and
+tests on the test_days that follow, so no future price leaks into training.
+Inference cost is measured on the CompiledForest the API actually serves.
+"""
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_absolute_error, r2_score
+
+from utils.compiled_forest import CompiledForest
+from utils.price_forecast import FEATURE_NAMES, HISTORY_WINDOW, forecast_arrays, predict_with_spread
+
+RANDOM_STATE = 42
+
+
+class Fold(NamedTuple):
+    index: int
+    cutoff: pd.Timestamp
+    test_end: pd.Timestamp
+
+
+def rolling_origin_folds(dates, n_folds: int, test_days: int, min_train_days: int = 14) -> List[Fold]:
+    """The last n_folds windows of test_days each, oldest first.
+
+    Folds whose training span would be shorter than min_train_days are dropped.
+    """
+    dates = pd.to_datetime(pd.Series(dates))
+    first = dates.min().normalize()
+    end = dates.max().normalize() + pd.Timedelta(days=1)
+    folds = []
+    for k in range(n_folds, 0, -1):
+        cutoff = end - pd.Timedelta(days=k * test_days)
+        if (cutoff - first).days < min_train_days:
+            continue
+        folds.append(Fold(len(folds), cutoff, cutoff + pd.Timedelta(days=test_days)))
+    if not folds:
+        raise ValueError(
+            f"Not enough history for a {test_days}-day fold after {min_train_days} training days"
+        )
+    return folds
+
+
+def parse_params(spec: str) -> Dict[str, object]:
+    """'n_estimators=50,max_depth=16' -> {'n_estimators': 50, 'max_depth': 16}."""
+    params: Dict[str, object] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        key, _, raw = item.partition("=")
+        value: object = raw
+        for cast in (int, float):
+            try:
+                value = cast(raw)
+                break
+            except ValueError:
+                pass
+        if raw == "None":
+            value = None
+        params[key.strip()] = value
+    return params
+
+
+def make_model(params: Dict[str, object], n_jobs: int = 1) -> RandomForestRegressor:
+    return RandomForestRegressor(random_state=RANDOM_STATE, n_jobs=n_jobs, **params)
+
+
+def fit_and_score(params, X_train, y_train, X_test, y_test, n_jobs: int = 1) -> Tuple[Dict, CompiledForest]:
+    """Fit one candidate and return its accuracy, fit time and served artifact size."""
+    model = make_model(params, n_jobs)
+    started = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - started
+    y_pred = model.predict(X_test)
+    forest = CompiledForest.from_sklearn(model)
+    return {
+        "mae": float(mean_absolute_error(y_test, y_pred)),
+        "r2": float(r2_score(y_test, y_pred)),
+        "fit_seconds": fit_seconds,
+        "train_rows": len(y_train),
+        "test_rows": len(y_test),
+        "size_mb": forest.nbytes / 1e6,
+        "trees": forest.n_trees,
+        "max_depth": forest.max_depth,
+    }, forest
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    p50, p99 = np.percentile(samples, [50, 99])
+    return {"p50_ms": float(p50), "p99_ms": float(p99)}
+
+
+def measure_latency(model, X, batch_size: int = 256, repeat: int = 200, request_days: int = 7,
+                    seed: int = 0) -> Dict[str, Optional[Dict[str, float]]]:
+    """Latency of predict_with_spread for one row (one predict_price forecast
+    step) and for batch_size rows (one /predict-price/batch step), and of a
+    whole request_days forecast for one series, which is what a default
+    /predict-price request spends in the model."""
+    X = np.asarray(X, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(X), repeat)
+    # Warm up caches (and the page cache for memory-mapped forests)
+    predict_with_spread(model, X[:1])
+
+    single = []
+    for i in rows:
+        started = time.perf_counter()
+        predict_with_spread(model, X[i:i + 1])
+        single.append((time.perf_counter() - started) * 1000)
+
+    lag = FEATURE_NAMES.index('price_lag_1d')
+    request = []
+    for i in rows:
+        # Encoded names from a real row, its lag price as a flat history
+        encoded, history = [X[i, :6]], [[X[i, lag]] * HISTORY_WINDOW]
+        started = time.perf_counter()
+        forecast_arrays(model, encoded, history, request_days)
+        request.append((time.perf_counter() - started) * 1000)
+
+    batch = None
+    if len(X) >= batch_size:
+        samples = []
+        for _ in range(max(repeat // 10, 5)):
+            start = int(rng.integers(0, len(X) - batch_size + 1))
+            started = time.perf_counter()
+            predict_with_spread(model, X[start:start + batch_size])
+            samples.append((time.perf_counter() - started) * 1000)
+        batch = _percentiles(samples)
+        batch["rows"] = batch_size
+    return {"single": _percentiles(single), "request": dict(_percentiles(request), days=request_days),
+            "batch": batch}
+
+
+def feature_matrix(df: pd.DataFrame) -> np.ndarray:
+    """Rows in the column order predict_price builds its feature vectors in."""
+    return df[FEATURE_NAMES].to_numpy(dtype=np.float64)
@@ -0,0 +1,416 @@
+"""
+Versioned price model registry with hot swap and shadow scoring.
+
+Layout (MODEL_REGISTRY_DIR, default model_registry/):
+    manifest.json            {"active": "<version>", "shadow": "<version>" | null, "versions": {...}}
+    <version>/price_forest/  memory-mapped CompiledForest export
+    <version>/price_shards/  optional per-commodity shards (see utils/model_shards.py)
+    <version>/price_forest_direct/  optional direct multi-horizon forest
+    <version>/encoders.pkl
+
+Versions are the forest content digest, so publishing the same model twice is
+a no-op. Each API worker re-reads the manifest on a timer (or when asked
+through /admin/models) and swaps its active model by replacing one
+reference; requests already running keep the model they started with.
+
+Manage from the backend directory:
+    python -m utils.model_registry publish price_model.pkl encoders.pkl [--shards price_shards]
+        [--direct price_forest_direct] [--activate | --shadow]
+    python -m utils.model_registry activate <version>
+    python -m utils.model_registry shadow <version|none>
+    python -m utils.model_registry list
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import joblib
+import numpy as np
+
+from utils.compiled_forest import CompiledForest
+from utils.entity_dictionary import EntityDictionary, build_entity_dictionary
+from utils.model_artifacts import (
+    COMPILED_DIRECT_MODEL_PATH,
+    COMPILED_MODEL_PATH,
+    ENCODERS_PATH,
+    load_direct_model,
+    load_price_model,
+    price_model_version,
+)
+from utils.model_shards import SHARDS_DIRNAME, read_shard_index, with_shards
+from utils.price_forecast import UNSEEN_COMMODITY, forecast_prices
+
+logger = logging.getLogger(__name__)
+
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", "model_registry")
+MANIFEST_FILE = "manifest.json"
+# Shadow forecasts waiting to run; beyond this live traffic is sampled, never slowed down
+SHADOW_MAX_PENDING = int(os.getenv("MODEL_SHADOW_MAX_PENDING", "8"))
+SHADOW_SAMPLES = 1000
+
+
+class LoadedModel(NamedTuple):
+    version: Optional[str]
+    model: Any
+    encoders: Any
+    loaded_at: str
+    load_seconds: float
+    direct: Any = None
+
+
+def read_manifest(registry_dir: str = MODEL_REGISTRY_DIR) -> Dict:
+    try:
+        with open(os.path.join(registry_dir, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"active": None, "shadow": None, "versions": {}}
+
+
+def write_manifest(manifest: Dict, registry_dir: str = MODEL_REGISTRY_DIR) -> None:
+    os.makedirs(registry_dir, exist_ok=True)
+    path = os.path.join(registry_dir, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    # Readers see either the old or the new manifest, never a partial one
+    os.replace(path + ".tmp", path)
+
+
+def version_paths(version: str, registry_dir: str = MODEL_REGISTRY_DIR) -> Dict[str, str]:
+    base = os.path.join(registry_dir, version)
+    return {
+        "forest": os.path.join(base, "price_forest"),
+        "shards": os.path.join(base, SHARDS_DIRNAME),
+        "direct": os.path.join(base, COMPILED_DIRECT_MODEL_PATH),
+        "encoders": os.path.join(base, "encoders.pkl"),
+    }
+
+
+def publish_model(model, encoders_path: str = ENCODERS_PATH, metrics: Optional[Dict] = None,
+                  activate: bool = False, shadow: bool = False, registry_dir: str = MODEL_REGISTRY_DIR,
+                  shards_path: Optional[str] = None, selection: Optional[Dict] = None,
+                  direct_path: Optional[str] = None) -> str:
+    """Add a fitted forest (sklearn or CompiledForest), its encoders, optional
+    per-commodity shards and an optional direct multi-horizon forest to the
+    registry. selection records how the model's hyperparameters were chosen
+    (see train_model.select_model_params)."""
+    forest = model if isinstance(model, CompiledForest) else CompiledForest.from_sklearn(model)
+    shard_index = read_shard_index(shards_path) if shards_path else None
+    version = forest.digest()
+    if shard_index and shard_index.get("shards"):
+        # Same global forest with different shards is a different model
+        version = hashlib.sha256(f"{version}:{shard_index['version']}".encode()).hexdigest()[:16]
+    else:
+        shard_index = None
+    direct = CompiledForest.load(direct_path) if direct_path else None
+    if direct is not None:
+        version = hashlib.sha256(f"{version}:direct:{direct.digest()}".encode()).hexdigest()[:16]
+    paths = version_paths(version, registry_dir)
+
+    manifest = read_manifest(registry_dir)
+    if version not in manifest["versions"]:
+        forest.save(paths["forest"])
+        if shard_index:
+            shutil.copytree(shards_path, paths["shards"], dirs_exist_ok=True)
+        if direct is not None:
+            direct.save(paths["direct"])
+        shutil.copyfile(encoders_path, paths["encoders"])
+        manifest["versions"][version] = {
+            "created_at": datetime.now().isoformat(),
+            "n_trees": forest.n_trees,
+            "nbytes": forest.nbytes,
+            "shards": len(shard_index["shards"]) if shard_index else 0,
+            "direct": direct is not None,
+            "metrics": metrics or {},
+        }
+        if selection:
+            manifest["versions"][version]["selection"] = selection
+    if activate:
+        manifest["active"] = version
+        if manifest.get("shadow") == version:
+            manifest["shadow"] = None
+    elif shadow and manifest.get("active") != version:
+        manifest["shadow"] = version
+    write_manifest(manifest, registry_dir)
+    return version
+
+
+def set_active_version(version: str, registry_dir: str = MODEL_REGISTRY_DIR) -> Dict:
+    manifest = read_manifest(registry_dir)
+    if version not in manifest["versions"]:
+        raise ValueError(f"Unknown model version '{version}'")
+    manifest["previous"] = manifest.get("active")
+    manifest["active"] = version
+    if manifest.get("shadow") == version:
+        manifest["shadow"] = None
+    write_manifest(manifest, registry_dir)
+    return manifest
+
+
+def set_shadow_version(version: Optional[str], registry_dir: str = MODEL_REGISTRY_DIR) -> Dict:
+    manifest = read_manifest(registry_dir)
+    if version is not None and version not in manifest["versions"]:
+        raise ValueError(f"Unknown model version '{version}'")
+    manifest["shadow"] = version
+    write_manifest(manifest, registry_dir)
+    return manifest
+
+
+def active_artifact_paths(registry_dir: str = MODEL_REGISTRY_DIR):
+    """(version, forest path, encoders path) of the active model, or the unversioned files."""
+    version = read_manifest(registry_dir).get("active")
+    if version:
+        paths = version_paths(version, registry_dir)
+        return version, paths["forest"], paths["encoders"]
+    return price_model_version(), COMPILED_MODEL_PATH, ENCODERS_PATH
+
+
+def _load(version: Optional[str], forest_path: str, encoders_path: str) -> LoadedModel:
+    started = time.perf_counter()
+    model = with_shards(load_price_model(compiled_path=forest_path), forest_path)
+    direct = load_direct_model(forest_path)
+    encoders = joblib.load(encoders_path)
+    return LoadedModel(version, model, encoders, datetime.now().isoformat(), round(time.perf_counter() - started, 4),
+                       direct)
+
+
+def _percentiles(samples) -> Dict[str, Optional[float]]:
+    if not samples:
+        return {"p50": None, "p95": None}
+    arr = np.asarray(samples)
+    return {"p50": round(float(np.percentile(arr, 50)), 3), "p95": round(float(np.percentile(arr, 95)), 3)}
+
+
+class ShadowStats:
+    """Latency and prediction deltas of a candidate model against the live one."""
+
+    def __init__(self, version: str):
+        self.version = version
+        self.started_at = datetime.now().isoformat()
+        self.scored = 0
+        self.errors = 0
+        self.dropped = 0
+        self.last_error: Optional[str] = None
+        self.live_ms = deque(maxlen=SHADOW_SAMPLES)
+        self.shadow_ms = deque(maxlen=SHADOW_SAMPLES)
+        self.abs_delta = deque(maxlen=SHADOW_SAMPLES)
+        self.pct_delta = deque(maxlen=SHADOW_SAMPLES)
+        self._lock = threading.Lock()
+
+    def record(self, live_ms: float, shadow_ms: float, live: List[float], shadow: List[float]) -> None:
+        live_arr, shadow_arr = np.asarray(live), np.asarray(shadow)
+        diff = np.abs(shadow_arr - live_arr)
+        with self._lock:
+            self.scored += 1
+            self.live_ms.append(live_ms)
+            self.shadow_ms.append(shadow_ms)
+            self.abs_delta.append(float(diff.mean()))
+            self.pct_delta.append(float((diff / np.maximum(np.abs(live_arr), 1e-9)).mean() * 100))
+
+    def record_dropped(self) -> None:
+        with self._lock:
+            self.dropped += 1
+
+    def record_error(self, error: Exception) -> None:
+        with self._lock:
+            self.errors += 1
+            self.last_error = str(error)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            live, shadow = _percentiles(self.live_ms), _percentiles(self.shadow_ms)
+            return {
+                "version": self.version,
+                "started_at": self.started_at,
+                "scored": self.scored,
+                "errors": self.errors,
+                "dropped": self.dropped,
+                "error_rate": round(self.errors / (self.scored + self.errors), 4) if self.scored + self.errors else None,
+                "last_error": self.last_error,
+                "live_ms": live,
+                "shadow_ms": shadow,
+                "latency_delta_ms_p50": round(shadow["p50"] - live["p50"], 3) if live["p50"] is not None else None,
+                "mean_abs_price_delta": round(float(np.mean(self.abs_delta)), 4) if self.abs_delta else None,
+                "mean_pct_price_delta": round(float(np.mean(self.pct_delta)), 4) if self.pct_delta else None,
+            }
+
+
+class ModelRegistry:
+    """Per-process view of the registry: the active model plus an optional shadow."""
+
+    def __init__(self, registry_dir: str = MODEL_REGISTRY_DIR):
+        self.registry_dir = registry_dir
+        self._active: Optional[LoadedModel] = None
+        self._shadow: Optional[LoadedModel] = None
+        self._shadow_entities: Optional[EntityDictionary] = None
+        self.shadow_stats: Optional[ShadowStats] = None
+        self._manifest_mtime: Optional[float] = None
+        self._lock = threading.Lock()
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow-model")
+        self._shadow_slots = threading.BoundedSemaphore(SHADOW_MAX_PENDING)
+        self.swaps = 0
+        self.last_error: Optional[str] = None
+        self.on_swap = []
+
+    @property
+    def version(self) -> Optional[str]:
+        """Version of the loaded active model, without triggering a load."""
+        return self._active.version if self._active else None
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.registry_dir, MANIFEST_FILE)
+
+    def active(self) -> Optional[LoadedModel]:
+        """Active model, loaded on first use. None if nothing could be loaded."""
+        if self._active is None:
+            self.reload()
+        return self._active
+
+    def warm(self) -> threading.Thread:
+        thread = threading.Thread(target=self.active, name="warm-price-model", daemon=True)
+        thread.start()
+        return thread
+
+    def reload(self, force: bool = False) -> Dict[str, Any]:
+        """Re-read the manifest and swap in the active/shadow versions it names."""
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self._manifest_path())
+            except OSError:
+                mtime = None
+            manifest = read_manifest(self.registry_dir)
+            self._manifest_mtime = mtime
+
+            try:
+                version, forest_path, encoders_path = active_artifact_paths(self.registry_dir)
+                if force or self._active is None or self._active.version != version:
+                    previous = self._active.version if self._active else None
+                    loaded = _load(version, forest_path, encoders_path)
+                    # A single reference assignment: in-flight requests keep their model
+                    self._active = loaded
+                    self.last_error = None
+                    logger.info(f"Price model {version} active (was {previous}, loaded in {loaded.load_seconds}s)")
+                    if previous is not None:
+                        self.swaps += 1
+                        for callback in self.on_swap:
+                            callback(previous, version)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Price model load failed, keeping {self._active.version if self._active else None}: {e}")
+
+            shadow_version = manifest.get("shadow")
+            try:
+                if not shadow_version:
+                    self._shadow, self._shadow_entities, self.shadow_stats = None, None, None
+                elif self._shadow is None or self._shadow.version != shadow_version:
+                    paths = version_paths(shadow_version, self.registry_dir)
+                    self._shadow = _load(shadow_version, paths["forest"], paths["encoders"])
+                    # Market names and aliases like the live dictionary, indexed by the shadow's encoders
+                    self._shadow_entities = build_entity_dictionary(self._shadow.encoders)
+                    self.shadow_stats = ShadowStats(shadow_version)
+                    logger.info(f"Shadow scoring price model {shadow_version}")
+            except Exception as e:
+                self._shadow, self._shadow_entities, self.shadow_stats = None, None, None
+                self.last_error = f"Shadow {shadow_version}: {e}"
+                logger.error(f"Shadow model load failed: {e}")
+            return self.status()
+
+    def reload_if_changed(self) -> bool:
+        """Cheap poll for the file watch: reload only when manifest.json changed."""
+        try:
+            mtime = os.path.getmtime(self._manifest_path())
+        except OSError:
+            return False
+        if mtime == self._manifest_mtime:
+            return False
+        self.reload()
+        return True
+
+    def submit_shadow(self, requests: List, price_histories: List[List[float]], forecast_days: int,
+                      start_date: datetime, live_predictions: List[List[Dict]], live_ms: float) -> bool:
+        """Score the shadow model on the same inputs in the background. Returns False when skipped."""
+        shadow, entities, stats = self._shadow, self._shadow_entities, self.shadow_stats
+        if shadow is None or stats is None or not requests:
+            return False
+        if not self._shadow_slots.acquire(blocking=False):
+            stats.record_dropped()
+            return False
+
+        def run():
+            try:
+                encoded = [
+                    tuple(entities.encode(col, getattr(req, col), UNSEEN_COMMODITY if col == 'commodity' else 0)
+                          for col in ('state', 'district', 'market', 'commodity', 'variety', 'grade'))
+                    for req in requests
+                ]
+                started = time.perf_counter()
+                shadow_predictions = forecast_prices(shadow.model, encoded, price_histories, forecast_days, start_date)
+                shadow_ms = (time.perf_counter() - started) * 1000
+                stats.record(
+                    live_ms, shadow_ms,
+                    [p["predicted_price"] for series in live_predictions for p in series[:forecast_days]],
+                    [p["predicted_price"] for series in shadow_predictions for p in series[:forecast_days]],
+                )
+            except Exception as e:
+                stats.record_error(e)
+            finally:
+                self._shadow_slots.release()
+
+        self._shadow_executor.submit(run)
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        active = self._active
+        shadow = self._shadow
+        memory_mapped = getattr(active.model, "memory_mapped", False) if active else False
+        return {
+            "registry_dir": self.registry_dir,
+            "active": {"version": active.version, "loaded_at": active.loaded_at,
+                       "load_seconds": active.load_seconds, "memory_mapped": memory_mapped,
+                       "direct_model": active.direct is not None} if active else None,
+            "shards": active.model.stats() if active and hasattr(active.model, "stats") else None,
+            "shadow": {"version": shadow.version, "loaded_at": shadow.loaded_at} if shadow else None,
+            "shadow_stats": self.shadow_stats.summary() if self.shadow_stats else None,
+            "swaps": self.swaps,
+            "last_error": self.last_error,
+        }
+
+    def shutdown(self) -> None:
+        self._shadow_executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _print_versions(registry_dir: str) -> None:
+    manifest = read_manifest(registry_dir)
+    for version, info in sorted(manifest["versions"].items(), key=lambda kv: kv[1].get("created_at", "")):
+        role = "active" if version == manifest.get("active") else "shadow" if version == manifest.get("shadow") else ""
+        chosen = (info.get("selection") or {}).get("chosen", "")
+        print(f"{version}  {info.get('created_at', '')[:19]}  {role:6}  {info.get('metrics') or ''}  {chosen}")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if command == "publish":
+        model_path = sys.argv[2] if len(sys.argv) > 2 else "price_model.pkl"
+        encoders_path = sys.argv[3] if len(sys.argv) > 3 else ENCODERS_PATH
+        shards_path = sys.argv[sys.argv.index("--shards") + 1] if "--shards" in sys.argv else None
+        direct_path = sys.argv[sys.argv.index("--direct") + 1] if "--direct" in sys.argv else None
+        version = publish_model(joblib.load(model_path), encoders_path,
+                                activate="--activate" in sys.argv, shadow="--shadow" in sys.argv,
+                                shards_path=shards_path, direct_path=direct_path)
+        print(f"Published {version}")
+    elif command == "activate":
+        set_active_version(sys.argv[2])
+        print(f"Activated {sys.argv[2]}")
+    elif command == "shadow":
+        version = None if sys.argv[2].lower() == "none" else sys.argv[2]
+        set_shadow_version(version)
+        print(f"Shadow set to {version}")
+    _print_versions(MODEL_REGISTRY_DIR)
@@ -0,0 +1,185 @@
+"""
+Per-commodity price model shards with the global forest as fallback.
+
+train_model.py fits one small forest for every commodity with enough history
+and keeps it only if it beats the global model on that commodity's holdout
+rows. Layout, next to the global price_forest/ directory:
+    price_shards/index.json   {"version", "params", "min_rows", "shards": {"<commodity code>": {...}}}
+    price_shards/c<code>/     CompiledForest directory for one commodity
+
+Shard keys are commodity_encoded values, so a shard directory is only valid
+together with the encoders.pkl it was trained with; the registry publishes
+them as one version. At serving time ShardedModel.route() splits a batch by
+commodity; shards are memory-mapped on first use and at most
+MODEL_SHARD_CACHE_SIZE of them stay open (least recently used are dropped).
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.compiled_forest import CompiledForest
+from utils.price_forecast import FEATURE_NAMES, UNSEEN_COMMODITY
+
+logger = logging.getLogger(__name__)
+
+SHARDS_DIRNAME = "price_shards"
+INDEX_FILE = "index.json"
+MODEL_SHARD_CACHE_SIZE = int(os.getenv("MODEL_SHARD_CACHE_SIZE", "16"))
+COMMODITY_FEATURE = FEATURE_NAMES.index('commodity_encoded')
+
+
+def shards_path_for(forest_path: str) -> str:
+    """Shard directory that belongs with a global forest directory."""
+    return os.path.join(os.path.dirname(os.path.normpath(forest_path)), SHARDS_DIRNAME)
+
+
+def shard_dirname(code: int) -> str:
+    return f"c{int(code)}"
+
+
+def read_shard_index(path: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_shard_index(path: str, shards: Dict[int, Dict], params: Dict, min_rows: int) -> str:
+    """Write index.json last, after every shard directory, and return the shard set version."""
+    digest = hashlib.sha256()
+    for code in sorted(shards):
+        digest.update(f"{code}:{shards[code]['version']};".encode())
+    index = {
+        "version": digest.hexdigest()[:16],
+        "params": params,
+        "min_rows": min_rows,
+        "shards": {str(code): info for code, info in sorted(shards.items())},
+    }
+    tmp = os.path.join(path, INDEX_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp, os.path.join(path, INDEX_FILE))
+    return index["version"]
+
+
+def replace_shards(staging: str, path: str) -> None:
+    """Move a fully written shard directory to path, replacing the old one.
+
+    The old directory is renamed aside before the new one is renamed in, so
+    path holds one complete shard set or, for an instant, nothing, which
+    with_shards() treats as serving the global model only.
+    """
+    old = f"{os.path.normpath(path)}.old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.isdir(path):
+        os.rename(path, old)
+    os.rename(staging, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+class ShardedModel:
+    """Global forest plus lazily opened per-commodity shards.
+
+    forecast_arrays calls route() to evaluate each commodity with its own
+    forest; predict() does the same for plain feature matrices.
+    """
+
+    def __init__(self, global_model, path: str, index: Dict, max_resident: int = MODEL_SHARD_CACHE_SIZE):
+        self.global_model = global_model
+        self.path = path
+        self.version = index.get("version")
+        self.codes = {int(code) for code in index.get("shards", {})}
+        self.max_resident = max(max_resident, 1)
+        self._resident: "OrderedDict[int, CompiledForest]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.fallbacks = 0
+
+    @property
+    def memory_mapped(self) -> bool:
+        return getattr(self.global_model, "memory_mapped", False)
+
+    def shard_for(self, code: int) -> Optional[CompiledForest]:
+        """The commodity's shard, or None when it is served by the global model."""
+        code = int(code)
+        with self._lock:
+            # An unseen commodity is encoded apart from class 0, so it never reaches class 0's shard
+            if code == UNSEEN_COMMODITY or code not in self.codes:
+                self.fallbacks += 1
+                return None
+            shard = self._resident.get(code)
+            if shard is not None:
+                self._resident.move_to_end(code)
+                self.hits += 1
+                return shard
+        # Opening is a few small reads plus mmap; done outside the lock
+        shard = CompiledForest.load(os.path.join(self.path, shard_dirname(code)))
+        with self._lock:
+            # Another thread may have opened it meanwhile; keep a single copy resident
+            shard = self._resident.setdefault(code, shard)
+            self.loads += 1
+            self._resident.move_to_end(code)
+            while len(self._resident) > self.max_resident:
+                self._resident.popitem(last=False)
+                self.evictions += 1
+        return shard
+
+    def route(self, commodity_codes) -> List[Tuple[object, np.ndarray]]:
+        """[(model, row indices)] covering every row, one entry per distinct model."""
+        codes = np.asarray(commodity_codes, dtype=np.int64)
+        groups: List[Tuple[object, np.ndarray]] = []
+        global_rows = []
+        for code in np.unique(codes):
+            rows = np.flatnonzero(codes == code)
+            try:
+                shard = self.shard_for(code)
+            except Exception as e:
+                logger.error(f"Price model shard {code} failed to load, using the global model: {e}")
+                shard = None
+            if shard is None:
+                global_rows.append(rows)
+            else:
+                groups.append((shard, rows))
+        if global_rows:
+            groups.append((self.global_model, np.sort(np.concatenate(global_rows))))
+        return groups
+
+    def predict(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        out = np.empty(len(X), dtype=np.float64)
+        for model, rows in self.route(X[:, COMMODITY_FEATURE]):
+            out[rows] = model.predict(X[rows])
+        return out
+
+    def stats(self) -> Dict:
+        with self._lock:
+            resident = sorted(self._resident)
+        return {
+            "version": self.version,
+            "shards": len(self.codes),
+            "resident": len(resident),
+            "max_resident": self.max_resident,
+            "hits": self.hits,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "global_fallbacks": self.fallbacks,
+        }
+
+
+def with_shards(global_model, forest_path: str, max_resident: int = MODEL_SHARD_CACHE_SIZE):
+    """Wrap global_model in a ShardedModel when shards were published next to forest_path."""
+    path = shards_path_for(forest_path)
+    index = read_shard_index(path)
+    if not index or not index.get("shards"):
+        return global_model
+    return ShardedModel(global_model, path, index, max_resident)
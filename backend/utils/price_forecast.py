@@ -0,0 +1,240 @@
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+FEATURE_NAMES = [
+    'state_encoded', 'district_encoded', 'market_encoded',
+    'commodity_encoded', 'variety_encoded', 'grade_encoded',
+    'moving_avg_7d', 'price_lag_1d', 'is_weekend'
+]
+
+# Direct multi-horizon model: price and 7-day average as of the forecast origin, the
+# target day's weekend flag, and how many days ahead the target is
+DIRECT_FEATURE_NAMES = FEATURE_NAMES + ['horizon_days']
+FORECAST_MODES = ('recursive', 'direct')
+
+HISTORY_WINDOW = 7
+MAX_FORECAST_DAYS = 30
+# Encoded commodity for names the encoders never saw. The forests read it as 0, like the
+# LabelEncoder fallback always did, but ShardedModel.route sends it to the global model
+# instead of class 0's shard.
+UNSEEN_COMMODITY = -1
+
+
+def per_tree_predictions(model, X: np.ndarray) -> np.ndarray:
+    """Evaluate every tree of a fitted forest on X, returning shape (n_trees, n_rows).
+
+    CompiledForest models walk their flat node arrays directly. For sklearn
+    forests the input is cast to float32 once and per-tree validation is
+    skipped, which is what RandomForestRegressor.predict does internally.
+    """
+    if hasattr(model, "tree_predictions"):
+        return model.tree_predictions(X)
+    X32 = np.ascontiguousarray(X, dtype=np.float32)
+    return np.stack([tree.predict(X32, check_input=False) for tree in model.estimators_])
+
+
+def predict_with_spread(model, X: np.ndarray):
+    """Point estimate and per-tree standard deviation from a single pass over the forest.
+
+    Returns (point, std); std is None for models without individual estimators.
+    """
+    if not hasattr(model, "estimators_") and not hasattr(model, "tree_predictions"):
+        return np.asarray(model.predict(X), dtype=np.float64), None
+
+    tree_preds = per_tree_predictions(model, X)
+    # Sequential sum over trees, matching the accumulation order of model.predict
+    point = np.add.reduce(tree_preds, axis=0) / len(tree_preds)
+    std = np.std(np.ascontiguousarray(tree_preds.T), axis=1)
+    return point, std
+
+
+def _window_mean(window: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    # Column-by-column sum keeps the same float order as sum(history_buffer)
+    total = window[:, 0].copy()
+    for col in range(1, window.shape[1]):
+        total += window[:, col]
+    return total / lengths
+
+
+def confidence_interval(pred: float, std_dev: Optional[float]) -> Optional[Dict[str, float]]:
+    if std_dev is None:
+        return None
+    return {
+        "lower": round(max(0, pred - 1.96 * std_dev), 2),
+        "upper": round(pred + 1.96 * std_dev, 2),
+        "std_dev": round(std_dev, 2),
+    }
+
+
+def forecast_arrays(
+    model,
+    encoded_rows: Sequence[Sequence[float]],
+    price_histories: Sequence[Sequence[float]],
+    forecast_days: int,
+    start_date: Optional[datetime] = None,
+    timer=None,
+) -> Tuple[List[datetime], np.ndarray, Optional[np.ndarray]]:
+    """Recursive day-by-day forecast for one or more series at once.
+
+    encoded_rows holds the six encoded categorical features per series (the
+    commodity may be UNSEEN_COMMODITY) and price_histories the most recent prices per series, newest first. Each day's
+    prediction is fed back as the next day's lag and moving average. Returns the
+    target dates and unrounded (n_series, forecast_days) arrays of point
+    estimates and per-tree standard deviations (None if the model has no trees).
+    Models with a route() method (ShardedModel) forecast each group of series
+    with the forest it routes them to.
+    With a StageTimer, time spent evaluating trees is added to its "tree_eval" stage.
+    """
+    if start_date is None:
+        start_date = datetime.now()
+    forecast_days = max(forecast_days, 0)
+
+    n_series = len(encoded_rows)
+    dates = [start_date + timedelta(days=i + 1) for i in range(forecast_days)]
+    points = np.zeros((n_series, forecast_days), dtype=np.float64)
+    stds: Optional[np.ndarray] = np.zeros((n_series, forecast_days), dtype=np.float64)
+    if n_series == 0:
+        return dates, points, stds
+
+    if hasattr(model, "route"):
+        # Sharded model: each commodity's series run through its own forest
+        commodity = FEATURE_NAMES.index('commodity_encoded')
+        for sub_model, rows in model.route([row[commodity] for row in encoded_rows]):
+            _, sub_points, sub_stds = forecast_arrays(
+                sub_model,
+                [encoded_rows[i] for i in rows],
+                [price_histories[i] for i in rows],
+                forecast_days,
+                start_date,
+                timer,
+            )
+            points[rows] = sub_points
+            if sub_stds is None:
+                stds = None
+            elif stds is not None:
+                stds[rows] = sub_stds
+        return dates, points, stds
+
+    X = np.zeros((n_series, len(FEATURE_NAMES)), dtype=np.float64)
+    X[:, :6] = np.maximum(np.asarray(encoded_rows, dtype=np.float64), 0)
+
+    window = np.zeros((n_series, HISTORY_WINDOW), dtype=np.float64)
+    lengths = np.zeros(n_series, dtype=np.float64)
+    for i, history in enumerate(price_histories):
+        history = list(history)[:HISTORY_WINDOW]
+        window[i, :len(history)] = history
+        lengths[i] = len(history)
+    outside_window = np.arange(HISTORY_WINDOW)[None, :] >= lengths[:, None]
+
+    current_lag = window[:, 0].copy()
+    current_ma = _window_mean(window, lengths)
+
+    timed = timer is not None and timer.enabled
+    for i, target_date in enumerate(dates):
+        X[:, 6] = current_ma
+        X[:, 7] = current_lag
+        X[:, 8] = 1 if target_date.weekday() >= 5 else 0
+
+        if timed:
+            started = time.perf_counter()
+            point, std = predict_with_spread(model, X)
+            timer.add("tree_eval", (time.perf_counter() - started) * 1000)
+        else:
+            point, std = predict_with_spread(model, X)
+        points[:, i] = point
+        if std is None:
+            stds = None
+        elif stds is not None:
+            stds[:, i] = std
+
+        current_lag = point.copy()
+        window[:, 1:] = window[:, :-1].copy()
+        window[:, 0] = point
+        window[outside_window] = 0.0
+        current_ma = _window_mean(window, lengths)
+
+    return dates, points, stds
+
+
+def forecast_direct_arrays(
+    model,
+    encoded_rows: Sequence[Sequence[float]],
+    price_histories: Sequence[Sequence[float]],
+    forecast_days: int,
+    start_date: Optional[datetime] = None,
+    timer=None,
+) -> Tuple[List[datetime], np.ndarray, Optional[np.ndarray]]:
+    """Every horizon of every series from one evaluation of a direct model.
+
+    Same inputs and outputs as forecast_arrays, but no prediction is fed back:
+    row (series, h) carries the series' latest price and 7-day average plus
+    horizon_days = h, so all series * forecast_days rows go through the forest
+    in a single batch.
+    """
+    if start_date is None:
+        start_date = datetime.now()
+    forecast_days = max(forecast_days, 0)
+
+    n_series = len(encoded_rows)
+    dates = [start_date + timedelta(days=i + 1) for i in range(forecast_days)]
+    if n_series == 0 or forecast_days == 0:
+        return dates, np.zeros((n_series, forecast_days)), np.zeros((n_series, forecast_days))
+
+    window = np.zeros((n_series, HISTORY_WINDOW), dtype=np.float64)
+    lengths = np.zeros(n_series, dtype=np.float64)
+    for i, history in enumerate(price_histories):
+        history = list(history)[:HISTORY_WINDOW]
+        window[i, :len(history)] = history
+        lengths[i] = len(history)
+
+    # Series-major rows: row i * forecast_days + h is series i, horizon h + 1
+    X = np.zeros((n_series, forecast_days, len(DIRECT_FEATURE_NAMES)), dtype=np.float64)
+    X[:, :, :6] = np.maximum(np.asarray(encoded_rows, dtype=np.float64), 0)[:, None, :]
+    X[:, :, 6] = _window_mean(window, lengths)[:, None]
+    X[:, :, 7] = window[:, 0][:, None]
+    X[:, :, 8] = [1 if d.weekday() >= 5 else 0 for d in dates]
+    X[:, :, 9] = np.arange(1, forecast_days + 1)
+
+    started = time.perf_counter()
+    point, std = predict_with_spread(model, X.reshape(n_series * forecast_days, -1))
+    if timer is not None and timer.enabled:
+        timer.add("tree_eval", (time.perf_counter() - started) * 1000)
+    points = point.reshape(n_series, forecast_days)
+    stds = std.reshape(n_series, forecast_days) if std is not None else None
+    return dates, points, stds
+
+
+def format_forecast(dates: Sequence[datetime], points, stds) -> List[Dict]:
+    """API entries for one series from forecast_arrays output rows."""
+    return [
+        {
+            "date": target_date.strftime("%Y-%m-%d"),
+            "predicted_price": round(float(points[i]), 2),
+            "confidence_interval": confidence_interval(
+                float(points[i]), float(stds[i]) if stds is not None else None
+            ),
+        }
+        for i, target_date in enumerate(dates)
+    ]
+
+
+def forecast_prices(
+    model,
+    encoded_rows: Sequence[Sequence[float]],
+    price_histories: Sequence[Sequence[float]],
+    forecast_days: int,
+    start_date: Optional[datetime] = None,
+    timer=None,
+    mode: str = 'recursive',
+) -> List[List[Dict]]:
+    """forecast_arrays (or forecast_direct_arrays with mode='direct') formatted
+    as one list of {"date", "predicted_price", "confidence_interval"} entries per series."""
+    forecast = forecast_direct_arrays if mode == 'direct' else forecast_arrays
+    dates, points, stds = forecast(model, encoded_rows, price_histories, forecast_days, start_date, timer)
+    return [
+        format_forecast(dates, points[row], stds[row] if stds is not None else None)
+        for row in range(len(encoded_rows))
+    ]
@@ -0,0 +1,164 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional, Tuple
+
+# Per-stage latency histograms for the prediction path. With
+# LATENCY_METRICS_ENABLED=false every timer is a no-op.
+LATENCY_METRICS_ENABLED = os.getenv("LATENCY_METRICS_ENABLED", "true").lower() == "true"
+# Send a Server-Timing header on every response, not only to callers that ask with X-Server-Timing
+SERVER_TIMING_ALWAYS = os.getenv("SERVER_TIMING_ALWAYS", "false").lower() == "true"
+
+# Log-spaced bucket upper bounds (ms), ~10% apart from 10 µs to 60 s; percentiles
+# are reported as the upper bound of the bucket they fall in
+_BUCKETS: List[float] = []
+_bound = 0.01
+while _bound < 60000:
+    _BUCKETS.append(round(_bound, 4))
+    _bound *= 1.1
+_BUCKETS.append(float("inf"))
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram: constant memory and O(log buckets) per sample."""
+
+    def __init__(self):
+        self._counts = [0] * len(_BUCKETS)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms: float) -> None:
+        i = bisect.bisect_left(_BUCKETS, ms)
+        with self._lock:
+            self._counts[i] += 1
+            self.count += 1
+            self.total_ms += ms
+            if ms > self.max_ms:
+                self.max_ms = ms
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for bound, n in zip(_BUCKETS, self._counts):
+            seen += n
+            if seen >= rank and n:
+                return round(min(bound, self.max_ms), 4)
+        return round(self.max_ms, 4)
+
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            return {
+                "count": self.count,
+                "mean_ms": round(self.total_ms / self.count, 3) if self.count else None,
+                "p50_ms": self.percentile(50),
+                "p95_ms": self.percentile(95),
+                "p99_ms": self.percentile(99),
+                "max_ms": round(self.max_ms, 3) if self.count else None,
+            }
+
+
+class StageMetrics:
+    """Histograms keyed by "<endpoint>.<stage>"."""
+
+    def __init__(self):
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def histogram(self, name: str) -> LatencyHistogram:
+        hist = self._histograms.get(name)
+        if hist is None:
+            with self._lock:
+                hist = self._histograms.setdefault(name, LatencyHistogram())
+        return hist
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {name: hist.snapshot() for name, hist in sorted(self._histograms.items())}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms = {}
+            self.started_at = time.time()
+
+
+stage_metrics = StageMetrics()
+
+
+class StageTimer:
+    """Times the stages of one request and feeds them into stage_metrics on finish().
+
+    With record=False the stages are only kept for the Server-Timing header.
+    """
+
+    enabled = True
+
+    def __init__(self, endpoint: str, metrics: StageMetrics = stage_metrics, record: bool = True):
+        self.endpoint = endpoint
+        self.metrics = metrics
+        self.record = record
+        self.stages: Dict[str, float] = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - started) * 1000)
+
+    def add(self, name: str, ms: float) -> None:
+        """Accumulate ms into a stage; repeated stages (e.g. per forecast day) add up."""
+        self.stages[name] = self.stages.get(name, 0.0) + ms
+
+    def finish(self) -> List[Tuple[str, float]]:
+        self.stages["total"] = (time.perf_counter() - self._started) * 1000
+        if self.record:
+            for name, ms in self.stages.items():
+                self.metrics.histogram(f"{self.endpoint}.{name}").record(ms)
+        return list(self.stages.items())
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{name};dur={ms:.3f}" for name, ms in self.stages.items())
+
+
+class NullTimer:
+    """Stand-in when metrics are disabled: no clock reads, no allocation per stage."""
+
+    enabled = False
+    stages: Dict[str, float] = {}
+    _context = nullcontext()
+
+    def stage(self, name: str):
+        return self._context
+
+    def add(self, name: str, ms: float) -> None:
+        pass
+
+    def finish(self) -> List[Tuple[str, float]]:
+        return []
+
+    def server_timing(self) -> str:
+        return ""
+
+
+_NULL_TIMER = NullTimer()
+
+
+def start_timer(endpoint: str, force: bool = False):
+    """StageTimer for one request, or the shared no-op timer when metrics are off.
+
+    force times the request anyway, for a caller asking for Server-Timing,
+    but with metrics off its stages still stay out of the histograms.
+    """
+    if LATENCY_METRICS_ENABLED:
+        return StageTimer(endpoint)
+    if force:
+        return StageTimer(endpoint, record=False)
+    return _NULL_TIMER